@@ -2,35 +2,51 @@
 Flask Backend for PCD (Face Anonymization)
 ------------------------------------------
 Handles:
- - Receiving frames (base64) from external PCD process (pcd_main.py)
+ - Receiving frames (raw JPEG or base64) from external PCD process (pcd_main.py)
  - Processing frames (face blur) via services.pcd_main
  - Broadcasting processed frames to connected clients via Socket.IO
  - Serving Flutter Web frontend (if built)
 """
 
-from flask import Flask, send_from_directory, jsonify, request
+import time
+_IMPORT_STARTED = time.perf_counter()  # cold-start report: module import starts here
+
+from flask import Flask, Response, g, send_from_directory, jsonify, request
 from flask_socketio import SocketIO
+import base64
 import os
 import subprocess
 import sys
+import threading
 
-# Import modul pcd sebagai modul, jangan import fungsi yang memicu eksekusi loop pada import
-from services import pcd_main
+# services.pcd_main (cv2, numpy, detector) is imported on the first frame, see _get_frame_pool()
+from services.broadcast import FrameBroadcaster
+from services.frame_pool import FrameDropped
+from services.metrics import CONTENT_TYPE, FRAMES_IN, FRAMES_OUT, REGISTRY, stage_timer
+from services.startup import StartupReport
 
 # --- Flask App Config ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret')
 socketio = SocketIO(app, cors_allowed_origins='*')
+startup = StartupReport('flask', started=_IMPORT_STARTED)
+
+# 'base64' (default): string payload every viewer understands; 'binary': raw JPEG bytes (opt-in, smaller)
+FRAME_EMIT_FORMAT = os.environ.get('FRAME_EMIT_FORMAT', 'base64').lower()
+# Per-client 'frame' delivery: one frame in flight per viewer, quality tier by ack latency
+broadcaster = FrameBroadcaster(socketio, emit_format=FRAME_EMIT_FORMAT)
 
 
 # --- SocketIO Events ---
 @socketio.on('connect')
 def handle_connect():
+    broadcaster.add_client(request.sid)
     print('✓ SocketIO client connected')
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    broadcaster.remove_client(request.sid)
     print('✓ SocketIO client disconnected')
 
 
@@ -60,34 +76,138 @@ def static_files(filename: str):
     return jsonify({'error': 'file not found'}), 404
 
 
+# --- Cold-start report ---
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_first_request(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        startup.first_request(time.perf_counter() - started)
+    return response
+
+
+@app.route('/startup')
+def startup_report():
+    """Cold-start timings of this worker (import, lazy model load, first request)."""
+    return jsonify(startup.as_dict())
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text metrics: per-stage latency histograms and frame counters."""
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+
 # --- Receive Frame API ---
+_frame_pool = None
+_frame_pool_lock = threading.Lock()
+
+
+def _get_frame_pool():
+    """Import services.pcd_main and start its frame pool on first use (thread-safe, timed)."""
+    global _frame_pool
+    if _frame_pool is None:
+        with _frame_pool_lock:
+            if _frame_pool is None:
+                with startup.time('pcd_main_import'):
+                    from services import pcd_main
+                with startup.time('frame_pool_start'):
+                    _frame_pool = pcd_main.get_frame_pool()
+    return _frame_pool
+
+
+def _process_frame(jpeg: bytes) -> bytes:
+    """Process a frame on the frame pool without blocking the eventlet hub.
+
+    A pool worker (with its own DNN) does the OpenCV work; under eventlet the
+    request greenlet only waits through tpool, so other clients keep being
+    served and frames from several clients are processed on several cores.
+    """
+    started = time.perf_counter()
+    future = _get_frame_pool().submit(jpeg)
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        result = tpool.execute(future.result)
+    else:
+        result = future.result()
+    # Only the first frame is kept: it includes the per-worker model load
+    startup.mark('first_frame', time.perf_counter() - started)
+    return result
+
+
+def _read_uploaded_jpeg() -> bytes | None:
+    """Return JPEG bytes from a raw image/jpeg body or a legacy JSON {"image": "<base64>"} body."""
+    if request.mimetype in ('image/jpeg', 'application/octet-stream'):
+        return request.get_data(cache=False) or None
+    data = request.get_json(force=True, silent=True)
+    if not data or 'image' not in data:
+        return None
+    return base64.b64decode(data['image'])
+
+
+def _broadcast_frame(jpeg: bytes):
+    """Broadcast a processed frame (event name 'frame' expected by frontend).
+
+    Slow viewers skip frames and drop to a lower quality tier instead of
+    building up a send buffer.
+    """
+    with stage_timer('socketio_emit'):
+        broadcaster.publish(jpeg)
+    FRAMES_OUT.inc()
+
+
 @app.route('/upload_frame', methods=['POST'])
 def upload_frame():
     """
-    Receive a base64-encoded image (JSON {"image":"..."}) → process with PCD → broadcast via Socket.IO.
-    This allows pcd_main.py or other clients to POST frames to the backend.
+    Receive a frame → process with PCD → broadcast via Socket.IO.
+    Accepts a raw JPEG body (Content-Type: image/jpeg, used by pcd_main.py over a
+    keep-alive connection) or the legacy base64 JSON {"image":"..."}.
     """
     try:
-        data = request.get_json(force=True)
-        if not data or 'image' not in data:
+        jpeg = _read_uploaded_jpeg()
+        if not jpeg:
             return jsonify({'error': 'missing image field'}), 400
-
-        img_b64 = data['image']
+        FRAMES_IN.inc()
 
         # 🔹 Proses frame menggunakan modul PCD (modul pcd_main)
-        processed_b64 = pcd_main.process_frame_base64(img_b64)
+        # Dijalankan di frame pool agar request lain tetap dilayani paralel
+        processed = _process_frame(jpeg)
 
-        # 🔹 Broadcast hasil blur ke semua klien (event name 'frame' expected by frontend)
-        socketio.emit('frame', {'image': processed_b64})
+        # 🔹 Broadcast hasil blur ke semua klien
+        _broadcast_frame(processed)
 
         print("→ Frame processed and broadcast to clients.")
         return jsonify({'status': 'processed'}), 200
 
+    except FrameDropped:
+        # Frame pool queue full: a newer frame took this one's place (503 makes the uploader back off)
+        return jsonify({'status': 'dropped'}), 503
     except Exception as e:
         print('✗ Error in /upload_frame:', e)
         return jsonify({'error': str(e)}), 500
 
 
+@socketio.on('upload_frame')
+def handle_upload_frame(data):
+    """Binary Socket.IO ingest: clients emit raw JPEG bytes on a persistent connection."""
+    if not isinstance(data, (bytes, bytearray)) or not data:
+        return {'error': 'expected binary JPEG payload'}
+    FRAMES_IN.inc()
+    try:
+        processed = _process_frame(bytes(data))
+        _broadcast_frame(processed)
+        return {'status': 'processed'}
+    except FrameDropped:
+        return {'status': 'dropped'}
+    except Exception as e:
+        print('✗ Error in upload_frame event:', e)
+        return {'error': str(e)}
+
+
 # --- Run Server ---
 def _start_pcd_subprocess():
     """Start pcd_main.py as a separate subprocess.
@@ -116,6 +236,9 @@ def _start_pcd_subprocess():
         return None
 
 
+startup.mark('import')
+
+
 if __name__ == '__main__':
     print("🚀 Flask PCD backend running on http://0.0.0.0:5000")
     # Start PCD in a separate process so it runs alongside the server
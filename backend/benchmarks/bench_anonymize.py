@@ -0,0 +1,325 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+"""
+bench_anonymize.py
+-------------------
+Micro-benchmarks for the anonymization hot path in services/pcd_main.py.
+
+Generates synthetic frames (480p/720p/1080p/4K) with 0/1/5/20 face-sized
+regions and times each stage: JPEG decode, resize + blobFromImage,
+net.forward, detection decode, tiled detection, the Anonymizer modes
+(Gaussian, mosaic, solid fill, pixel shuffle), JPEG encode and the
+end-to-end process_frame_bytes. Allocations are measured with tracemalloc in
+a separate pass so they do not distort the timings.
+
+By default the DNN is replaced with a deterministic fake net that "detects"
+exactly the generated regions, so the suite runs without the caffemodel and
+the numbers only reflect our own code. Use --real-net to time the real
+detector selected by DETECTOR (ssd, yunet or onnx).
+
+Usage (from backend/):
+    python benchmarks/bench_anonymize.py --output bench.json
+    python benchmarks/bench_anonymize.py --compare bench_before.json bench.json
+"""
+
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+from services.detection import finish_boxes, merge_tile_boxes, tile_views  # noqa: E402
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+FACE_COUNTS = (0, 1, 5, 20)
+
+
+class FakeNet:
+    """Deterministic stand-in for the res10 SSD.
+
+    forward() returns the boxes set with set_faces() (normalized 0..1) for every
+    image in the input blob, plus a near-duplicate of each box (exercises NMS)
+    and a few low-confidence rows, in the real (1, 1, 200, 7) layout.
+    """
+
+    def __init__(self):
+        self._faces = np.empty((0, 4), dtype=np.float32)
+        self._batch = 1
+
+    def set_faces(self, boxes_norm: np.ndarray):
+        self._faces = np.asarray(boxes_norm, dtype=np.float32).reshape(-1, 4)
+
+    def setPreferableBackend(self, *_):
+        pass
+
+    def setPreferableTarget(self, *_):
+        pass
+
+    def setInput(self, blob):
+        self._batch = blob.shape[0]
+
+    def forward(self):
+        out = np.zeros((1, 1, 200, 7), dtype=np.float32)
+        out[0, 0, :, 0] = -1
+        row = 0
+        for image_id in range(self._batch):
+            for box in self._faces:
+                for conf, jitter in ((0.95, 0.0), (0.80, 0.005)):
+                    if row >= 200:
+                        break
+                    out[0, 0, row] = [image_id, 1, conf, *(box + jitter)]
+                    row += 1
+            for _ in range(3):
+                if row >= 200:
+                    break
+                out[0, 0, row] = [image_id, 1, 0.05, 0.1, 0.1, 0.2, 0.2]
+                row += 1
+        return out
+
+
+def _load_pcd_main(real_net: bool):
+    """Import services.pcd_main, swapping the Caffe loader for FakeNet unless real_net."""
+    fake = None
+    # Module import and model load print status lines; keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        if not real_net:
+            # FakeNet emulates the res10 SSD, so pin the backend to it
+            os.environ['DETECTOR'] = 'ssd'
+            fake = FakeNet()
+            original = getattr(cv2.dnn, 'readNetFromCaffe', None)
+            cv2.dnn.readNetFromCaffe = lambda *_a, **_k: fake
+            try:
+                from services import pcd_main
+                pcd_main.get_detector()  # the detector loads lazily; force it while patched
+            finally:
+                if original is not None:
+                    cv2.dnn.readNetFromCaffe = original
+                else:
+                    del cv2.dnn.readNetFromCaffe
+        else:
+            from services import pcd_main
+            pcd_main.get_detector()
+    return pcd_main, fake
+
+
+def make_frame(width: int, height: int, faces: int, seed: int = 0):
+    """Synthetic BGR frame with `faces` textured ellipses; returns (frame, boxes_px)."""
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), 90, dtype=np.uint8)
+    frame += rng.integers(0, 30, size=frame.shape, dtype=np.uint8)
+    boxes = []
+    if faces:
+        cols = int(np.ceil(np.sqrt(faces)))
+        rows = int(np.ceil(faces / cols))
+        cell_w, cell_h = width // cols, height // rows
+        face_h = int(min(cell_h, cell_w * 1.3) * 0.7)
+        face_w = int(face_h / 1.3)
+        for i in range(faces):
+            cx = (i % cols) * cell_w + cell_w // 2
+            cy = (i // cols) * cell_h + cell_h // 2
+            x1, y1 = cx - face_w // 2, cy - face_h // 2
+            cv2.ellipse(frame, (cx, cy), (face_w // 2, face_h // 2), 0, 0, 360, (150, 170, 200), -1)
+            patch = frame[y1:y1 + face_h, x1:x1 + face_w]
+            patch[:] = cv2.add(patch, rng.integers(0, 40, size=patch.shape, dtype=np.uint8))
+            boxes.append((x1, y1, x1 + face_w, y1 + face_h))
+    return frame, np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def _time(fn, repeat: int, warmup: int = 2) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    arr = np.array(samples)
+    return {
+        'n': repeat,
+        'mean_ms': round(float(arr.mean()), 4),
+        'median_ms': round(float(np.median(arr)), 4),
+        'p95_ms': round(float(np.percentile(arr, 95)), 4),
+        'min_ms': round(float(arr.min()), 4),
+    }
+
+
+def _allocations(fn) -> dict:
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_kb': round((peak - before) / 1024.0, 1), 'retained_kb': round((current - before) / 1024.0, 1)}
+
+
+def build_stages(pcd_main, fake, frame: np.ndarray, boxes: np.ndarray) -> dict:
+    """Return {stage_name: zero-arg callable} for one synthetic frame."""
+    h, w = frame.shape[:2]
+    if fake is not None:
+        fake.set_faces(boxes / np.array([w, h, w, h], dtype=np.float32) if len(boxes) else boxes)
+    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+    blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+    detector = pcd_main.get_detector()
+    raw_boxes, raw_scores = detector.detect_raw(frame)
+
+    # Modes work in place; a scratch copy keeps the source frame intact without timing the copy
+    work = frame.copy()
+
+    def anonymize(mode):
+        # All faces of the frame in one call, as in pcd_main
+        pcd_main.anonymizer.apply(work, boxes, mode)
+
+    def forward():
+        # Bare net.forward() only exists for the SSD backend; others time their whole detect_raw
+        if hasattr(detector, 'net'):
+            detector.net.setInput(blob)
+            return detector.net.forward()
+        return detector.detect_raw(frame)
+
+    # Tiled mode (DETECT_TILED) timed regardless of the env switch: crops, one batched detect, merge
+    views = tile_views(w, h, pcd_main.DETECT_TILE_SIZE, pcd_main.DETECT_TILE_OVERLAP, pcd_main.DETECT_MAX_TILES)
+
+    def detect_tiled():
+        crops = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in views]
+        tb, ts = merge_tile_boxes(detector.detect_raw_batch(crops), views, w, h)
+        return finish_boxes(tb, ts, w, h, pcd_main.BOX_PAD, pcd_main.NMS_THRESHOLD)
+
+    return {
+        'jpeg_decode': lambda: cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR),
+        'resize_blob': lambda: cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300),
+                                                     (104.0, 177.0, 123.0)),
+        'net_forward': forward,
+        'decode_detections': lambda: finish_boxes(raw_boxes.copy(), raw_scores, w, h,
+                                                  pcd_main.BOX_PAD, pcd_main.NMS_THRESHOLD),
+        'detect_tiled': detect_tiled,
+        'gaussian_blur': lambda: anonymize('gaussian'),
+        'mosaic_blur': lambda: anonymize('mosaic'),
+        'solid_fill': lambda: anonymize('solid'),
+        'pixel_shuffle': lambda: anonymize('shuffle'),
+        'jpeg_encode': lambda: cv2.imencode('.jpg', frame),
+        'process_frame_bytes': lambda: pcd_main.process_frame_bytes(jpeg),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=_BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(resolutions, face_counts, repeat: int, real_net: bool, stages_filter=None) -> dict:
+    pcd_main, fake = _load_pcd_main(real_net)
+    results = []
+    for res_name in resolutions:
+        width, height = RESOLUTIONS[res_name]
+        for faces in face_counts:
+            frame, boxes = make_frame(width, height, faces)
+            for stage, fn in build_stages(pcd_main, fake, frame, boxes).items():
+                if stages_filter and stage not in stages_filter:
+                    continue
+                entry = {'resolution': res_name, 'faces': faces, 'stage': stage}
+                entry.update(_time(fn, repeat))
+                entry.update(_allocations(fn))
+                results.append(entry)
+                print(f"{res_name:>6} faces={faces:<3} {stage:<20} median={entry['median_ms']:.3f}ms "
+                      f"p95={entry['p95_ms']:.3f}ms peak={entry['peak_kb']}KB", file=sys.stderr)
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'machine': platform.machine(),
+            'net': 'real' if real_net else 'fake',
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.10) -> int:
+    """Print median deltas between two result files; exit code 1 if any stage regressed beyond threshold."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda r: (r['resolution'], r['faces'], r['stage'])
+    base_idx = {key(r): r for r in base['results']}
+    regressed = False
+    print(f"base={base['meta'].get('commit')} new={new['meta'].get('commit')}")
+    for r in new['results']:
+        b = base_idx.get(key(r))
+        if b is None or b['median_ms'] <= 0:
+            continue
+        delta = (r['median_ms'] - b['median_ms']) / b['median_ms']
+        flag = ''
+        if delta > threshold:
+            flag = '  <-- regression'
+            regressed = True
+        print(f"{r['resolution']:>6} faces={r['faces']:<3} {r['stage']:<20} "
+              f"{b['median_ms']:9.3f} -> {r['median_ms']:9.3f} ms ({delta:+.1%}){flag}")
+    return 1 if regressed else 0
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pcd_main anonymization hot path')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help='Comma-separated subset of ' + ','.join(RESOLUTIONS))
+    parser.add_argument('--faces', default=','.join(str(n) for n in FACE_COUNTS),
+                        help='Comma-separated face counts per frame')
+    parser.add_argument('--stages', help='Comma-separated subset of stages to run')
+    parser.add_argument('--repeat', type=int, default=30, help='Timed iterations per stage')
+    parser.add_argument('--real-net', action='store_true', help='Use the real detector (DETECTOR backend) instead of the fake net')
+    parser.add_argument('--output', '-o', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Compare two result files')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Regression threshold for --compare')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    resolutions = [r.strip() for r in args.resolutions.split(',') if r.strip()]
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        print(f"✗ Unknown resolution(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    face_counts = [int(n) for n in args.faces.split(',') if n.strip()]
+    stages = {s.strip() for s in args.stages.split(',')} if args.stages else None
+
+    report = run(resolutions, face_counts, max(1, args.repeat), args.real_net, stages)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+        print(f"✓ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
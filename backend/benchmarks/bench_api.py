@@ -0,0 +1,186 @@
+import argparse
+import json
+import threading
+import time
+
+import requests
+
+"""
+bench_api.py
+-------------
+Load test for the admin dashboard endpoints of the FastAPI app: N concurrent
+clients (default 200) each polling GET /reports with their own keep-alive
+session, like admins keeping the dashboard open. Reports throughput, latency
+percentiles and errors, so the sync routers (threadpool + SessionLocal) can be
+compared with DB_ASYNC=1 (AsyncSession) against the same database.
+
+--check-etag is a regression check for the conditional GETs: two PATCHes of
+one report within the same second must still change the ETag of both
+GET /reports/{id} and GET /reports (updated_at only has second precision).
+
+The server is started separately, e.g.:
+    uvicorn backend.fastapi.main:app --port 65514
+    DB_ASYNC=1 uvicorn backend.fastapi.main:app --port 65514
+
+Usage (from backend/):
+    python benchmarks/bench_api.py --url http://127.0.0.1:65514 --username admin --password ... --output sync.json
+    python benchmarks/bench_api.py --compare sync.json async.json
+    python benchmarks/bench_api.py --url http://127.0.0.1:65514 --password ... --check-etag
+"""
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _login(url: str, username: str, password: str) -> str:
+    resp = requests.post(f"{url}/auth/login", data={'username': username, 'password': password}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()['access_token']
+
+
+def run(url: str, token: str, clients: int, duration: float, path: str, conditional: bool) -> dict:
+    latencies: list[list[float]] = [[] for _ in range(clients)]
+    errors = [0] * clients
+    statuses: dict[int, int] = {}
+    lock = threading.Lock()
+    start = threading.Barrier(clients + 1)
+    stop_at = [0.0]
+
+    def client(i: int):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {token}'
+        etag = None
+        start.wait()
+        while time.perf_counter() < stop_at[0]:
+            headers = {'If-None-Match': etag} if conditional and etag else {}
+            t0 = time.perf_counter()
+            try:
+                resp = session.get(url + path, headers=headers, timeout=30)
+                resp.content
+            except requests.RequestException:
+                errors[i] += 1
+                continue
+            latencies[i].append(time.perf_counter() - t0)
+            etag = resp.headers.get('ETag', etag)
+            if resp.status_code not in (200, 304):
+                errors[i] += 1
+            with lock:
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    began = time.perf_counter()
+    stop_at[0] = began + duration
+    start.wait()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    all_lat = sorted(x for lat in latencies for x in lat)
+    return {
+        'url': url, 'path': path, 'clients': clients, 'duration_s': round(elapsed, 2), 'conditional': conditional,
+        'requests': len(all_lat), 'errors': sum(errors), 'statuses': statuses,
+        'rps': round(len(all_lat) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(_percentile(all_lat, 0.50) * 1000, 1),
+        'p95_ms': round(_percentile(all_lat, 0.95) * 1000, 1),
+        'p99_ms': round(_percentile(all_lat, 0.99) * 1000, 1),
+    }
+
+
+def check_etag(url: str, token: str, attempts: int = 5) -> bool:
+    """PATCH one report twice in the same second; a GET with the first ETag must not be a 304."""
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    reports = session.get(f"{url}/reports?limit=1", timeout=30).json()
+    if not reports:
+        print('✗ No reports to check against; ingest one first')
+        return False
+    report_id, original = reports[0]['id'], reports[0]['status']
+    first, second = [s for s in ('new', 'processing', 'completed') if s != original][:2]
+    try:
+        for _ in range(attempts):
+            a = session.patch(f"{url}/reports/{report_id}", json={'status': first}, timeout=30).json()
+            detail_etag = session.get(f"{url}/reports/{report_id}", timeout=30).headers['ETag']
+            list_etag = session.get(f"{url}/reports", timeout=30).headers['ETag']
+            b = session.patch(f"{url}/reports/{report_id}", json={'status': second}, timeout=30).json()
+            if a['updated_at'] == b['updated_at']:
+                break
+        else:
+            print(f'✗ Could not land two updates in the same second after {attempts} attempts')
+            return False
+        ok = True
+        for path, etag in ((f"/reports/{report_id}", detail_etag), ('/reports', list_etag)):
+            resp = session.get(url + path, headers={'If-None-Match': etag}, timeout=30)
+            current = None
+            if resp.status_code == 200 and path == '/reports':
+                current = next((r['status'] for r in resp.json() if r['id'] == report_id), None)
+            elif resp.status_code == 200:
+                current = resp.json()['status']
+            if current != second:
+                print(f"✗ GET {path} with the stale ETag: {resp.status_code}, status={current} (expected {second})")
+                ok = False
+            else:
+                print(f"✓ GET {path} with the stale ETag: {resp.status_code}, status={current}")
+        return ok
+    finally:
+        session.patch(f"{url}/reports/{report_id}", json={'status': original}, timeout=30)
+        session.close()
+
+
+def _print(result: dict):
+    print(f"{result['clients']} clients, {result['duration_s']}s, {result['path']}"
+          f"{' (If-None-Match)' if result['conditional'] else ''}")
+    print(f"  {result['requests']} requests, {result['rps']} req/s, errors={result['errors']}, "
+          f"statuses={result['statuses']}")
+    print(f"  latency p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms")
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'metric':<8} {'before':>10} {'after':>10} {'change':>8}")
+    for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'errors'):
+        b, a = before[key], after[key]
+        change = f"{(a - b) / b * 100:+.0f}%" if b else '-'
+        print(f"{key:<8} {b:>10} {a:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent dashboard load test for the reports API')
+    parser.add_argument('--url', default='http://127.0.0.1:65514')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--token', help='Use this bearer token instead of logging in')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--path', default='/reports?limit=50&fields=summary')
+    parser.add_argument('--conditional', action='store_true', help='Send If-None-Match like a refreshing dashboard')
+    parser.add_argument('--output', help='Write the result as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--check-etag', action='store_true',
+                        help='Check that two updates in one second change the ETag, then exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    url = args.url.rstrip('/')
+    token = args.token or _login(url, args.username, args.password)
+    if args.check_etag:
+        raise SystemExit(0 if check_etag(url, token) else 1)
+    result = run(url, token, args.clients, args.duration, args.path, args.conditional)
+    _print(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,9 +10,27 @@ class Settings:
     JWT_SECRET: str = os.getenv("JWT_SECRET", "change-this-secret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+    # Cache token -> admin per proses (0 = nonaktif); perubahan admin di proses lain terlihat setelah TTL
+    AUTH_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+    # Verifikasi bcrypt saat login: worker paralel, antrean maksimum (lebih → 429), batas tunggu (→ 503)
+    PASSWORD_WORKERS: int = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PASSWORD_QUEUE_MAX: int = int(os.getenv("PASSWORD_QUEUE_MAX", "16"))
+    PASSWORD_QUEUE_TIMEOUT: float = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "5"))
 
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./fastapi.db")
+    # Pool koneksi (berlaku untuk engine sync dan async)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Di bawah wait_timeout MySQL, agar koneksi idle tidak diputus server saat dipakai
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+    # Router reports/auth async (butuh aiomysql / aiosqlite); ASYNC_DATABASE_URL opsional,
+    # default diturunkan dari DATABASE_URL (mysql+pymysql -> mysql+aiomysql, sqlite -> sqlite+aiosqlite)
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+    ASYNC_DATABASE_URL: str | None = os.getenv("ASYNC_DATABASE_URL")
 
     # Seed admin (opsional)
     ADMIN_SEED_USERNAME: str | None = os.getenv("ADMIN_SEED_USERNAME")
@@ -20,6 +38,13 @@ class Settings:
 
     # Report ingest API (digunakan oleh services/pcd_main.py)
     REPORT_API_KEY: str | None = os.getenv("REPORT_API_KEY")
+    # Jumlah maksimum laporan per POST /reports/batch
+    REPORT_BATCH_MAX: int = int(os.getenv("REPORT_BATCH_MAX", "500"))
+
+    # Rekaman: recording_path laporan relatif terhadap direktori ini (default: backend/)
+    RECORDINGS_ROOT: str = os.path.abspath(os.getenv("RECORDINGS_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+    # Opsional: prefix lokasi internal Nginx; file dikirim Nginx via X-Accel-Redirect (sendfile + Range)
+    RECORDINGS_ACCEL_REDIRECT: str | None = os.getenv("RECORDINGS_ACCEL_REDIRECT")
 
 
 settings = Settings()
@@ -1,11 +1,26 @@
+import importlib.util
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .config import settings
 
 
+def _pool_options(url: str) -> dict:
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}  # SQLite in-memory memakai satu koneksi; opsi pool tidak berlaku
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
+    **_pool_options(settings.DATABASE_URL),
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -20,3 +35,62 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# --- Engine async (opsional, DB_ASYNC=1) ---
+# Dibuat saat pertama dipakai sehingga driver async tidak wajib terpasang bila tidak dipakai.
+_ASYNC_DRIVERS = {"mysql+pymysql": "mysql+aiomysql", "mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+_async_engine = None
+AsyncSessionLocal = None
+
+
+def async_database_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    scheme, sep, rest = settings.DATABASE_URL.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def check_async_dependencies():
+    """Pastikan greenlet dan driver async untuk URL terpasang; RuntimeError yang jelas bila tidak.
+
+    Dipanggil saat aplikasi dibuat dengan DB_ASYNC=1, supaya paket yang kurang terlihat
+    saat startup, bukan sebagai ImportError dari dalam lifespan atau request pertama.
+    """
+    url = async_database_url()
+    driver = url.partition("://")[0].partition("+")[2]
+    if not driver:
+        raise RuntimeError(
+            f"DB_ASYNC=1 butuh driver async di URL database (mis. mysql+aiomysql://, sqlite+aiosqlite://), "
+            f"dapat '{url.partition('://')[0]}'; atur ASYNC_DATABASE_URL"
+        )
+    missing = [name for name in ("greenlet", driver) if importlib.util.find_spec(name) is None]
+    if missing:
+        raise RuntimeError(
+            f"DB_ASYNC=1 butuh paket yang belum terpasang: {', '.join(missing)} "
+            f"(pip install {' '.join(missing)}, atau extra 'async' di pyproject.toml)"
+        )
+
+
+def get_async_engine():
+    global _async_engine, AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        url = async_database_url()
+        _async_engine = create_async_engine(url, **_pool_options(url))
+        AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
@@ -1,43 +1,71 @@
-from fastapi import FastAPI
+import os
+import time
+from contextlib import asynccontextmanager
+
+_IMPORT_STARTED = time.perf_counter()  # laporan cold start: import modul dimulai di sini
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 
-from .db import engine, Base, SessionLocal
+from .db import engine, Base, SessionLocal, check_async_dependencies, dispose_async_engine, get_async_engine
 from .models import Admin
 from .routers import auth as auth_router
 from .routers import reports as reports_router
+from .routers import recordings as recordings_router
 from .config import settings
 from .security import hash_password
+from .previews import shutdown_previews
+from .passwords import REGISTRY, shutdown_password_pool
+from ..services.metrics import CONTENT_TYPE
 
 
-def create_app() -> FastAPI:
-    app = FastAPI(title="PPKS Admin API", version="0.1.0")
+# Waktu cold start worker ini (detik): import, bootstrap DB, request pertama
+startup_phases: dict[str, float] = {}
 
-    # CORS: izinkan akses dari frontend saat pengembangan (Flutter web / dev server)
-    # Catatan: allow_credentials=False agar wildcard origins (*) valid
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=False,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
 
-    # Buat tabel jika belum ada
-    Base.metadata.create_all(bind=engine)
+def _mark(phase: str, seconds: float | None = None):
+    startup_phases.setdefault(phase, (time.perf_counter() - _IMPORT_STARTED) if seconds is None else seconds)
 
-    # Registrasi router
-    app.include_router(auth_router.router)
-    app.include_router(reports_router.router)
 
-    @app.get("/")
-    def root():
-        return {"status": "ok", "service": "fastapi", "version": "0.1.0"}
+# Kolom/index yang ditambahkan setelah tabel dibuat (create_all tidak mengubah tabel lama)
+_LATE_COLUMNS = [
+    # (tabel, kolom, DDL tipe)
+    ("reports", "idempotency_key", "VARCHAR(64)"),
+    ("reports", "version", "INTEGER NOT NULL DEFAULT 1"),
+]
+_LATE_INDEXES = [
+    # (tabel, nama index, kolom, unique)
+    ("reports", "uq_reports_idempotency_key", ("idempotency_key",), True),
+    ("reports", "ix_reports_created_at_id", ("created_at", "id"), False),
+    ("reports", "ix_reports_status_created_at_id", ("status", "created_at", "id"), False),
+    ("reports", "ix_reports_status_updated_at_version", ("status", "updated_at", "version"), False),
+]
 
-    return app
 
+def _has_index(insp, table: str, columns: tuple, unique: bool) -> bool:
+    found = [(tuple(i["column_names"]), bool(i.get("unique"))) for i in insp.get_indexes(table)]
+    found += [(tuple(c["column_names"]), True) for c in insp.get_unique_constraints(table)]
+    return any(cols == columns and (is_unique or not unique) for cols, is_unique in found)
 
-app = create_app()
+
+def init_db():
+    """Buat tabel jika belum ada, lalu tambahkan kolom/index baru pada database lama."""
+    Base.metadata.create_all(bind=engine)
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in _LATE_COLUMNS:
+            if column not in {c["name"] for c in insp.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                print(f"✓ Kolom {table}.{column} ditambahkan")
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, name, columns, unique in _LATE_INDEXES:
+            if not _has_index(insp, table, columns, unique):
+                kind = "UNIQUE INDEX" if unique else "INDEX"
+                conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+                print(f"✓ Index {name} dibuat")
 
 
 def seed_admin_if_needed():
@@ -56,8 +84,82 @@ def seed_admin_if_needed():
         db.close()
 
 
-# Jalankan seeding ringan saat modul diimpor (tidak fatal bila gagal)
-try:
-    seed_admin_if_needed()
-except Exception as _:
-    pass
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Bootstrap DB saat startup server, bukan saat modul diimpor."""
+    started = time.perf_counter()
+    init_db()
+    # Seeding ringan (tidak fatal bila gagal)
+    try:
+        seed_admin_if_needed()
+    except Exception as exc:
+        print(f"⚠️ Admin seeding skipped: {exc}")
+    if settings.DB_ASYNC:
+        get_async_engine()  # driver async diimpor di sini, bukan pada request pertama
+    _mark('db_bootstrap', time.perf_counter() - started)
+    _mark('ready')
+    yield
+    shutdown_previews()
+    shutdown_password_pool()
+    await dispose_async_engine()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="PPKS Admin API", version="0.1.0", lifespan=lifespan)
+
+    # CORS: izinkan akses dari frontend saat pengembangan (Flutter web / dev server)
+    # Catatan: allow_credentials=False agar wildcard origins (*) valid
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=False,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
+    )
+
+    @app.middleware("http")
+    async def first_request_timer(request: Request, call_next):
+        if 'first_request' in startup_phases:
+            return await call_next(request)
+        started = time.perf_counter()
+        response = await call_next(request)
+        _mark('first_request', time.perf_counter() - started)
+        _mark('ready_to_first_response')
+        parts = ', '.join(f"{k}={v * 1000:.0f}ms" for k, v in startup_phases.items())
+        print(f"ℹ️ Startup [fastapi pid={os.getpid()}]: {parts}")
+        return response
+
+    # Registrasi router
+    if settings.DB_ASYNC:
+        # Endpoint auth/reports versi AsyncSession; rekaman dan preview tetap memakai engine sync
+        check_async_dependencies()
+        from .routers import auth_async, reports_async
+
+        app.include_router(auth_async.router)
+        app.include_router(reports_async.router)
+    else:
+        app.include_router(auth_router.router)
+        app.include_router(reports_router.router)
+    app.include_router(recordings_router.router)
+
+    @app.get("/")
+    def root():
+        return {"status": "ok", "service": "fastapi", "version": "0.1.0"}
+
+    @app.get("/metrics")
+    def metrics():
+        """Metrik Prometheus API (latency login, antrean worker password)."""
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    @app.get("/startup")
+    def startup_report():
+        """Waktu cold start worker ini (import, bootstrap DB, request pertama)."""
+        return {"service": "fastapi", "pid": os.getpid(),
+                "phases": {k: round(v, 4) for k, v in startup_phases.items()}}
+
+    return app
+
+
+app = create_app()
+_mark('import')
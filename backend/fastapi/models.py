@@ -1,9 +1,9 @@
 from datetime import datetime
 from enum import Enum as PyEnum
 
-from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy import String, Integer, DateTime, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal_column
 
 from .db import Base
 
@@ -25,6 +25,13 @@ class ReportStatus(str, PyEnum):
 
 class Report(Base):
     __tablename__ = "reports"
+    __table_args__ = (
+        # Daftar laporan diurutkan (created_at, id) terbaru dulu; keyset pagination memakai index ini
+        Index("ix_reports_created_at_id", "created_at", "id"),
+        Index("ix_reports_status_created_at_id", "status", "created_at", "id"),
+        # Validator ETag/Last-Modified (count, max(updated_at), sum(version)) dibaca dari index, bukan dari baris
+        Index("ix_reports_status_updated_at_version", "status", "updated_at", "version"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -35,5 +42,10 @@ class Report(Base):
     submitted_by: Mapped[str | None] = mapped_column(String(255), nullable=True)
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
     captured_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Dikirim pcd_main (outbox) agar retry tidak membuat laporan ganda
+    idempotency_key: Mapped[str | None] = mapped_column(String(64), unique=True, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), default=datetime.utcnow, onupdate=func.now())
+    # Naik 1 di setiap UPDATE (di SQL, jadi atomik); dasar ETag karena updated_at hanya sampai detik
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1",
+                                         onupdate=literal_column("version") + 1)
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from ..services.metrics import CallbackGauge, Counter, Histogram, Registry
+from .config import settings
+from .security import verify_password
+
+# Hash/verifikasi bcrypt di executor sendiri yang dibatasi.
+# bcrypt butuh ratusan ms CPU per panggilan; tanpa batas, lonjakan login (atau credential
+# stuffing) menghabiskan threadpool FastAPI dan membuat endpoint laporan ikut macet.
+# Di sini maksimal PASSWORD_WORKERS yang berjalan + PASSWORD_QUEUE_MAX yang antre;
+# sisanya langsung ditolak 429, dan yang terlalu lama antre ditolak 503.
+
+# Registry terpisah: /metrics FastAPI hanya berisi metrik API, bukan metrik frame pcd_*
+REGISTRY = Registry()
+
+_LOGIN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOGIN_SECONDS = Histogram('ppks_login_seconds', 'Login latency including the wait for a password worker',
+                          ('result',), buckets=_LOGIN_BUCKETS, registry=REGISTRY)
+PASSWORD_WAIT_SECONDS = Histogram('ppks_password_queue_wait_seconds', 'Time a password job waited for a worker',
+                                  buckets=_LOGIN_BUCKETS, registry=REGISTRY)
+PASSWORD_REJECTED = Counter('ppks_password_rejected_total', 'Password jobs rejected by the bounded pool',
+                            ('reason',), registry=REGISTRY)
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class QueueTimeout(Exception):
+    pass
+
+
+class PasswordPool:
+    """ThreadPoolExecutor dengan batas antrean; bcrypt melepas GIL sehingga worker berjalan paralel."""
+
+    def __init__(self, workers: int, queue_max: int, queue_timeout: float):
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ppks-password')
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_max)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.running = 0
+
+    @property
+    def queued(self) -> int:
+        return self.admitted - self.running
+
+    async def run(self, fn, *args):
+        """Jalankan fn di worker; PoolSaturated bila penuh, QueueTimeout bila antre > queue_timeout."""
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_REJECTED.labels('saturated').inc()
+            raise PoolSaturated()
+        with self._lock:
+            self.admitted += 1
+        try:
+            future = self._executor.submit(self._job, time.monotonic(), fn, args)
+        except BaseException:
+            self._release(started=False)
+            raise
+        # Request dibatalkan (klien putus) sebelum job mulai: slot dikembalikan di sini
+        future.add_done_callback(lambda f: self._release(started=False) if f.cancelled() else None)
+        return await asyncio.wrap_future(future)
+
+    def _job(self, submitted: float, fn, args):
+        waited = time.monotonic() - submitted
+        PASSWORD_WAIT_SECONDS.observe(waited)
+        if self.queue_timeout > 0 and waited > self.queue_timeout:
+            # Klien kemungkinan sudah menyerah; jangan habiskan CPU bcrypt untuknya
+            self._release(started=False)
+            PASSWORD_REJECTED.labels('timeout').inc()
+            raise QueueTimeout()
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            self._release(started=True)
+
+    def _release(self, started: bool):
+        with self._lock:
+            self.admitted -= 1
+            if started:
+                self.running -= 1
+        self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: PasswordPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_password_pool() -> PasswordPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordPool(settings.PASSWORD_WORKERS, settings.PASSWORD_QUEUE_MAX,
+                                     settings.PASSWORD_QUEUE_TIMEOUT)
+    return _pool
+
+
+def shutdown_password_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _pool_gauge(attr: str):
+    return lambda: {(): getattr(_pool, attr)} if _pool is not None else {}
+
+
+CallbackGauge('ppks_password_queue_depth', 'Password jobs waiting for a worker', _pool_gauge('queued'),
+              registry=REGISTRY)
+CallbackGauge('ppks_password_in_flight', 'Password jobs being hashed/verified', _pool_gauge('running'),
+              registry=REGISTRY)
+
+
+def _overloaded(exc: Exception) -> HTTPException:
+    if isinstance(exc, PoolSaturated):
+        return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                             detail="Terlalu banyak percobaan login, coba lagi sebentar",
+                             headers={"Retry-After": "1"})
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail="Layanan login sedang sibuk, coba lagi sebentar",
+                         headers={"Retry-After": str(max(1, int(settings.PASSWORD_QUEUE_TIMEOUT)))})
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password di PasswordPool; HTTPException 429/503 bila pool penuh."""
+    try:
+        return await get_password_pool().run(verify_password, plain_password, hashed_password)
+    except (PoolSaturated, QueueTimeout) as exc:
+        raise _overloaded(exc) from None
+
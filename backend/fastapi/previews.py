@@ -0,0 +1,61 @@
+import os
+import threading
+
+from .config import settings
+from .db import SessionLocal
+from .models import Report
+
+# Thumbnail + sprite laporan, dibuat di background setelah laporan di-ingest.
+# Pekerjaan berat (OpenCV) ada di services/thumbnails.py; di sini hanya antrean worker
+# dan update kolom thumbnail_path. Preview yang sudah dibuat pcd_main dipakai ulang.
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _to_abs(path: str) -> str:
+    return os.path.realpath(os.path.join(settings.RECORDINGS_ROOT, path))
+
+
+def _save_thumbnail(report_id: int, result: dict | None):
+    if not result:
+        return
+    rel = os.path.relpath(result["thumbnail"], os.path.realpath(settings.RECORDINGS_ROOT)).replace("\\", "/")
+    db = SessionLocal()
+    try:
+        report = db.get(Report, report_id)
+        if report is not None and report.thumbnail_path != rel:
+            report.thumbnail_path = rel
+            db.commit()
+    finally:
+        db.close()
+
+
+def get_preview_worker():
+    """Worker preview bersama; OpenCV baru diimpor saat pertama dipakai."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                from ..services.thumbnails import ThumbnailWorker
+                _worker = ThumbnailWorker(on_done=_save_thumbnail, name="ppks-previews")
+    return _worker
+
+
+def schedule_previews(report: Report) -> bool:
+    """Antrekan pembuatan preview bila laporan belum punya thumbnail yang ada di disk."""
+    if report.thumbnail_path and os.path.isfile(_to_abs(report.thumbnail_path)):
+        return False
+    root = os.path.realpath(settings.RECORDINGS_ROOT)
+    path = _to_abs(report.recording_path)
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return False
+    return get_preview_worker().submit(path, key=report.id)
+
+
+def shutdown_previews():
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.close(timeout=30)
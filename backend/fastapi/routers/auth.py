@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from ..db import get_db
 from ..models import Admin
 from ..schemas import TokenResponse, AdminOut
-from ..security import verify_password, hash_password, create_access_token
+from ..security import AdminPrincipal, verify_password, hash_password, create_access_token, principal_cache
 from ..config import settings
+from ..passwords import LOGIN_SECONDS, verify_password_async
 
 router = APIRouter(prefix="/auth", tags=["auth"]) 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+_oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 
 def authenticate_admin(db: Session, username: str, password: str) -> Admin | None:
@@ -22,19 +27,62 @@ def authenticate_admin(db: Session, username: str, password: str) -> Admin | Non
     return admin
 
 
-@router.post("/login", response_model=TokenResponse)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    admin = authenticate_admin(db, form_data.username, form_data.password)
+async def authenticate_admin_async(db: Session, username: str, password: str) -> Admin | None:
+    """Seperti authenticate_admin, tetapi bcrypt berjalan di PasswordPool (429/503 bila penuh)."""
+    admin = await run_in_threadpool(lambda: db.query(Admin).filter(Admin.username == username).first())
     if not admin:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Username atau password salah")
+        return None
+    if not await verify_password_async(password, admin.password_hash):
+        return None
+    return admin
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # async: login yang menunggu worker bcrypt tidak memegang thread threadpool
+    started = time.perf_counter()
+    result = "error"
+    try:
+        admin = await authenticate_admin_async(db, form_data.username, form_data.password)
+        if not admin:
+            result = "invalid"
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Username atau password salah")
+        result = "ok"
+    except HTTPException as exc:
+        if exc.status_code in (status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE):
+            result = "rejected"
+        raise
+    finally:
+        LOGIN_SECONDS.labels(result).observe(time.perf_counter() - started)
 
     token, expires_in = create_access_token(subject=str(admin.id))
     return TokenResponse(access_token=token, expires_in=expires_in)
 
 
-def get_current_admin(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> Admin:
+def get_current_admin(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> AdminPrincipal:
+    return _admin_from_token(db, token)
+
+
+def get_current_admin_media(
+    db: Session = Depends(get_db),
+    token: str | None = Depends(_oauth2_scheme_optional),
+    access_token: str | None = Query(default=None),
+) -> AdminPrincipal:
+    """Seperti get_current_admin, tetapi token boleh lewat ?access_token= (elemen <video> tidak bisa kirim header)."""
+    token = token or access_token
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return _admin_from_token(db, token)
+
+
+def _admin_from_token(db: Session, token: str) -> AdminPrincipal:
     from ..security import decode_token
 
+    # Token yang sudah diverifikasi dilayani dari cache: tanpa decode JWT dan tanpa query DB
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
     payload = decode_token(token)
     if payload is None or "sub" not in payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token tidak valid")
@@ -42,9 +90,11 @@ def get_current_admin(db: Session = Depends(get_db), token: str = Depends(oauth2
     admin = db.get(Admin, admin_id)
     if admin is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin tidak ditemukan")
-    return admin
+    principal = AdminPrincipal.from_admin(admin)
+    principal_cache.put(token, principal, token_exp=payload.get("exp"))
+    return principal
 
 
 @router.get("/me", response_model=AdminOut)
-def me(current_admin: Admin = Depends(get_current_admin)):
+def me(current_admin: AdminPrincipal = Depends(get_current_admin)):
     return current_admin
@@ -0,0 +1,69 @@
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_async_db
+from ..models import Admin
+from ..passwords import LOGIN_SECONDS, verify_password_async
+from ..schemas import AdminOut, TokenResponse
+from ..security import AdminPrincipal, create_access_token, decode_token, principal_cache
+from .auth import oauth2_scheme
+
+# Versi async router auth (DB_ASYNC=1); token, cache principal dan pool bcrypt sama
+# dengan routers/auth.py. get_current_admin_media (rekaman) tetap dari router sync.
+router = APIRouter(prefix="/auth", tags=["auth"])
+
+
+async def authenticate_admin(db: AsyncSession, username: str, password: str) -> Admin | None:
+    admin = (await db.scalars(select(Admin).where(Admin.username == username))).first()
+    if not admin:
+        return None
+    if not await verify_password_async(password, admin.password_hash):
+        return None
+    return admin
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    started = time.perf_counter()
+    result = "error"
+    try:
+        admin = await authenticate_admin(db, form_data.username, form_data.password)
+        if not admin:
+            result = "invalid"
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Username atau password salah")
+        result = "ok"
+    except HTTPException as exc:
+        if exc.status_code in (status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE):
+            result = "rejected"
+        raise
+    finally:
+        LOGIN_SECONDS.labels(result).observe(time.perf_counter() - started)
+
+    token, expires_in = create_access_token(subject=str(admin.id))
+    return TokenResponse(access_token=token, expires_in=expires_in)
+
+
+async def get_current_admin(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> AdminPrincipal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    payload = decode_token(token)
+    if payload is None or "sub" not in payload:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token tidak valid")
+    admin = await db.get(Admin, int(payload["sub"]))
+    if admin is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin tidak ditemukan")
+    principal = AdminPrincipal.from_admin(admin)
+    principal_cache.put(token, principal, token_exp=payload.get("exp"))
+    return principal
+
+
+@router.get("/me", response_model=AdminOut)
+async def me(current_admin: AdminPrincipal = Depends(get_current_admin)):
+    return current_admin
@@ -0,0 +1,136 @@
+import json
+import os
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..db import get_db
+from ..models import Report
+from ..schemas import RecordingOut, RecordingSegmentOut
+from .auth import get_current_admin_media
+
+# Rekaman laporan untuk dashboard admin.
+# recording_path berisi manifest.json (rekaman bersegmen dari services/recorder.py)
+# atau satu file .mp4 (rekaman lama). Segmen dikirim dengan dukungan HTTP Range agar
+# admin bisa seek tanpa server membaca seluruh file ke memori.
+# Zero-copy (sendfile) hanya lewat Nginx: dengan RECORDINGS_ACCEL_REDIRECT FastAPI cukup
+# mengotorisasi lalu menyerahkan file lewat X-Accel-Redirect. Tanpa itu FileResponse
+# membaca file per chunk di proses Python (Range tetap jalan, tetapi bukan zero-copy);
+# cukup untuk pengembangan, bukan setelan produksi.
+router = APIRouter(prefix="/reports", tags=["recordings"])
+
+
+def _resolve(path: str) -> str:
+    """Path absolut di dalam RECORDINGS_ROOT; 404 jika keluar dari root atau tidak ada."""
+    root = os.path.realpath(settings.RECORDINGS_ROOT)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root or not os.path.isfile(full):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording file not found")
+    return full
+
+
+def _load_recording(db: Session, report_id: int) -> tuple[dict, list[dict]]:
+    """Return (manifest, segments) untuk laporan; tiap segmen punya 'path' absolut."""
+    report = db.get(Report, report_id)
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
+    path = _resolve(report.recording_path)
+    if not path.endswith(".json"):
+        return {}, [{"index": 0, "path": path}]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base = os.path.relpath(os.path.dirname(path), os.path.realpath(settings.RECORDINGS_ROOT))
+    segments = []
+    for seg in manifest.get("segments", []):
+        try:
+            segments.append({**seg, "path": _resolve(os.path.join(base, seg["file"]))})
+        except HTTPException:
+            continue  # segmen yang belum ditulis / hilang (mis. crash) dilewati
+    return manifest, segments
+
+
+@router.get("/{report_id}/recording", response_model=RecordingOut)
+def get_recording(
+    report_id: int,
+    db: Session = Depends(get_db),
+    _: None = Depends(get_current_admin_media),
+):
+    manifest, segments = _load_recording(db, report_id)
+    return RecordingOut(
+        report_id=report_id,
+        fps=manifest.get("fps"),
+        width=manifest.get("width"),
+        height=manifest.get("height"),
+        complete=manifest.get("complete", True),
+        segments=[
+            RecordingSegmentOut(
+                index=seg["index"],
+                url=f"/reports/{report_id}/recording/{seg['index']}",
+                size_bytes=os.path.getsize(seg["path"]),
+                frames=seg.get("frames"),
+                duration_seconds=seg.get("duration_seconds"),
+                complete=seg.get("complete", True),
+                streamable=seg.get("streamable", False),
+            )
+            for seg in segments
+        ],
+    )
+
+
+@router.get("/{report_id}/thumbnail")
+def get_thumbnail(
+    report_id: int,
+    db: Session = Depends(get_db),
+    _: None = Depends(get_current_admin_media),
+):
+    report = db.get(Report, report_id)
+    if report is None or not report.thumbnail_path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thumbnail not available")
+    return FileResponse(_resolve(report.thumbnail_path), media_type="image/jpeg")
+
+
+@router.get("/{report_id}/sprite")
+def get_sprite(
+    report_id: int,
+    image: bool = False,
+    db: Session = Depends(get_db),
+    _: None = Depends(get_current_admin_media),
+):
+    """Indeks sprite (JSON: waktu + posisi tiap tile); ?image=true untuk file JPEG-nya."""
+    report = db.get(Report, report_id)
+    if report is None or not report.thumbnail_path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sprite not available")
+    # sprite.json / sprite.jpg berada di samping thumbnail (lihat services/thumbnails.preview_paths)
+    base = report.thumbnail_path[: -len("thumbnail.jpg")]
+    if image:
+        return FileResponse(_resolve(base + "sprite.jpg"), media_type="image/jpeg")
+    with open(_resolve(base + "sprite.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    index["url"] = f"/reports/{report_id}/sprite?image=true"
+    return index
+
+
+@router.get("/{report_id}/recording/{index}")
+def stream_recording_segment(
+    report_id: int,
+    index: int,
+    db: Session = Depends(get_db),
+    _: None = Depends(get_current_admin_media),
+):
+    """Isi satu segmen dengan dukungan Range: zero-copy lewat Nginx bila RECORDINGS_ACCEL_REDIRECT
+    diatur, selain itu dibaca per chunk oleh FileResponse."""
+    _, segments = _load_recording(db, report_id)
+    seg = next((s for s in segments if s["index"] == index), None)
+    if seg is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording segment not found")
+    if settings.RECORDINGS_ACCEL_REDIRECT:
+        # Nginx melayani file (sendfile, Range) dari lokasi internal; FastAPI hanya otorisasi
+        rel = os.path.relpath(seg["path"], os.path.realpath(settings.RECORDINGS_ROOT)).replace("\\", "/")
+        target = settings.RECORDINGS_ACCEL_REDIRECT.rstrip("/") + "/" + quote(rel)
+        return Response(headers={"X-Accel-Redirect": target}, media_type="video/mp4")
+    # Fallback tanpa Nginx: FileResponse menangani Range/If-Range (206/416) dan membaca per chunk
+    # lewat Python (bukan zero-copy)
+    return FileResponse(seg["path"], media_type="video/mp4")
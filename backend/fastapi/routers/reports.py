@@ -1,13 +1,25 @@
-from typing import List, Optional
+import base64
+import hashlib
+import json
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.security import APIKeyHeader
+from pydantic import ValidationError
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from ..config import settings
 from ..db import get_db
 from ..models import Report, ReportStatus
-from ..schemas import ReportCreate, ReportOut, ReportUpdate
+from ..previews import schedule_previews
+from ..schemas import BatchIngestResponse, BatchItemResult, ReportCreate, ReportOut, ReportUpdate
 from .auth import get_current_admin
 
 router = APIRouter(prefix="/reports", tags=["reports"])
@@ -26,54 +38,336 @@ def _verify_report_api_key(api_key: Optional[str] = Depends(_api_key_header)) ->
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid report API key")
 
 
+def _report_values(payload: ReportCreate) -> dict:
+    return {
+        "title": payload.title,
+        "recording_path": payload.recording_path,
+        "thumbnail_path": payload.thumbnail_path,
+        "status": (payload.status or ReportStatus.NEW).value,
+        "duration_seconds": payload.duration_seconds,
+        "submitted_by": payload.submitted_by,
+        "notes": payload.notes,
+        "captured_at": payload.captured_at,
+        "idempotency_key": payload.idempotency_key,
+    }
+
+
+def _encode_cursor(report: Report) -> str:
+    raw = json.dumps([report.created_at.isoformat(), report.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, report_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# Kolom untuk tampilan daftar di dashboard (fields=summary): tanpa notes/recording_path
+_SUMMARY_FIELDS = ("id", "title", "status", "thumbnail_path", "duration_seconds", "submitted_by",
+                   "captured_at", "created_at", "updated_at")
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[tuple[str, ...]]:
+    """None = objek lengkap; selain itu kolom yang dipilih (id dan created_at selalu ikut untuk cursor)."""
+    if not fields:
+        return None
+    names = _SUMMARY_FIELDS if fields == "summary" else tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [name for name in names if name not in ReportOut.model_fields]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(("id", "created_at") + names))
+
+
+def _etag(*parts) -> str:
+    # Perubahan dideteksi lewat Report.version (naik di setiap UPDATE), bukan updated_at yang
+    # hanya sampai detik: dua PATCH dalam detik yang sama tetap menghasilkan ETag berbeda
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+
+def _not_modified(request: Request, response: Response, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Set ETag/Last-Modified pada response; True bila request kondisional masih cocok (304)."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match menang atas If-Modified-Since (RFC 9110); perbandingan weak
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def _describe_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'body'}: {err['msg']}" for err in exc.errors()
+    )
+
+
+# --- Bagian query/logika yang dipakai bersama oleh router sync ini dan reports_async ---
+# Statement dibangun dengan select() sehingga bisa dijalankan Session maupun AsyncSession.
+
+
+def _by_idempotency_key(key: str):
+    return select(Report).where(Report.idempotency_key == key)
+
+
+def _parse_batch(payload: list) -> tuple[list[BatchItemResult], list[Optional[str]], dict[int, ReportCreate]]:
+    """Validasi tiap item batch; return (hasil per index, key per index, item valid per index)."""
+    if len(payload) > settings.REPORT_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch too large: {len(payload)} items (max {settings.REPORT_BATCH_MAX})",
+        )
+    results: list[BatchItemResult] = []
+    keys: list[Optional[str]] = []
+    parsed_items: dict[int, ReportCreate] = {}
+    for index, item in enumerate(payload):
+        try:
+            parsed = ReportCreate.model_validate(item)
+        except ValidationError as exc:
+            results.append(BatchItemResult(index=index, status="error", error=_describe_validation_error(exc)))
+            keys.append(None)
+            continue
+        if not parsed.idempotency_key:
+            # Key dari server: id hasil executemany dibaca ulang lewat key ini
+            # (MySQL tidak punya RETURNING, jadi tidak bisa langsung dari INSERT)
+            parsed.idempotency_key = uuid.uuid4().hex
+        results.append(BatchItemResult(index=index, status="created"))
+        keys.append(parsed.idempotency_key)
+        parsed_items[index] = parsed
+    return results, keys, parsed_items
+
+
+def _existing_keys(keys: list[Optional[str]]):
+    wanted = {key for key in keys if key}
+    return select(Report.idempotency_key, Report.id).where(Report.idempotency_key.in_(wanted)) if wanted else None
+
+
+def _batch_rows(keys: list[Optional[str]], parsed_items: dict[int, ReportCreate], existing: dict) -> dict[str, dict]:
+    rows: dict[str, dict] = {}
+    for index, key in enumerate(keys):
+        if key and key not in existing and key not in rows:
+            rows[key] = _report_values(parsed_items[index])
+    return rows
+
+
+def _batch_response(results: list[BatchItemResult], keys: list[Optional[str]], created: dict[str, Report],
+                    existing: dict) -> BatchIngestResponse:
+    seen: set[str] = set()
+    for index, key in enumerate(keys):
+        if key is None:
+            continue
+        if key in created and key not in seen:
+            results[index] = BatchItemResult(index=index, id=created[key].id, status="created")
+        else:
+            report_id = created[key].id if key in created else existing[key]
+            results[index] = BatchItemResult(index=index, id=report_id, status="duplicate")
+        seen.add(key)
+    return BatchIngestResponse(
+        created=len(created),
+        duplicates=sum(1 for r in results if r.status == "duplicate"),
+        errors=sum(1 for r in results if r.status == "error"),
+        items=results,
+    )
+
+
+def _list_filters(status_filter: Optional[ReportStatus]) -> list:
+    return [Report.status == status_filter.value] if status_filter is not None else []
+
+
+def _list_validator(filters: list):
+    # sum(version) berubah pada setiap UPDATE baris mana pun yang cocok dengan filter
+    return select(func.count(Report.id), func.max(Report.updated_at), func.max(Report.id),
+                  func.coalesce(func.sum(Report.version), 0)).where(*filters)
+
+
+def _detail_validator(report_id: int):
+    return select(Report.updated_at, Report.version).where(Report.id == report_id)
+
+
+def _list_query(columns: Optional[tuple[str, ...]], filters: list, cursor: Optional[str], offset: int, limit: int):
+    if columns is None:
+        stmt = select(Report)
+    else:
+        stmt = select(*(getattr(Report, name) for name in columns))
+    stmt = stmt.where(*filters).order_by(Report.created_at.desc(), Report.id.desc())
+    if cursor:
+        created_at, report_id = _decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                Report.created_at < created_at,
+                and_(Report.created_at == created_at, Report.id < report_id),
+            )
+        )
+    else:
+        stmt = stmt.offset(max(0, offset))
+    return stmt.limit(limit)
+
+
+def _list_response(reports: list, columns: Optional[tuple[str, ...]], response: Response, limit: int):
+    if len(reports) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(reports[-1])
+    if columns is None:
+        return reports
+    # Proyeksi: baris langsung diserialisasi, tanpa validasi ReportOut
+    return JSONResponse(
+        jsonable_encoder([row._asdict() for row in reports]),
+        headers=dict(response.headers),
+    )
+
+
+def _not_modified_response(response: Response) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers))
+
+
+def _apply_update(report: Report, update: ReportUpdate) -> None:
+    update_data = update.model_dump(exclude_unset=True)
+    for field, value in update_data.items():
+        if field == "status" and value is not None:
+            setattr(report, field, value.value)
+        else:
+            setattr(report, field, value)
+
+
 @router.post("", response_model=ReportOut, status_code=status.HTTP_201_CREATED)
 def ingest_report(
     payload: ReportCreate,
+    response: Response,
     _: None = Depends(_verify_report_api_key),
     db: Session = Depends(get_db),
 ):
-    status_value = (payload.status or ReportStatus.NEW).value
-    report = Report(
-        title=payload.title,
-        recording_path=payload.recording_path,
-        thumbnail_path=payload.thumbnail_path,
-        status=status_value,
-        duration_seconds=payload.duration_seconds,
-        submitted_by=payload.submitted_by,
-        notes=payload.notes,
-        captured_at=payload.captured_at,
-    )
+    if payload.idempotency_key:
+        # Retry dari pengirim: kembalikan laporan yang sudah ada, bukan membuat duplikat
+        existing = db.scalars(_by_idempotency_key(payload.idempotency_key)).first()
+        if existing is not None:
+            response.status_code = status.HTTP_200_OK
+            return existing
+    report = Report(**_report_values(payload))
     db.add(report)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Request kembar yang masuk bersamaan: yang kalah memakai baris pemenang
+        db.rollback()
+        existing = db.scalars(_by_idempotency_key(payload.idempotency_key)).first()
+        if existing is None:
+            raise
+        response.status_code = status.HTTP_200_OK
+        return existing
     db.refresh(report)
+    # Thumbnail + sprite dibuat di background; thumbnail_path diisi setelah selesai
+    schedule_previews(report)
     return report
 
 
+@router.post("/batch", response_model=BatchIngestResponse)
+def ingest_reports_batch(
+    payload: List[Any] = Body(...),
+    _: None = Depends(_verify_report_api_key),
+    db: Session = Depends(get_db),
+):
+    """Ingest banyak laporan dalam satu request dan satu transaksi.
+
+    Tiap item divalidasi sendiri: item yang tidak valid dilaporkan per index
+    (tanpa id) tanpa menggagalkan item lain. `items` selalu berurutan sesuai
+    input. idempotency_key yang sudah ada (di database atau lebih awal di batch
+    yang sama) mengembalikan id laporan yang sudah ada.
+    """
+    results, keys, parsed_items = _parse_batch(payload)
+
+    # Satu percobaan ulang: bila request lain menyisipkan key yang sama di antara SELECT
+    # dan INSERT, transaksi di-rollback dan key tersebut terbaca sebagai duplikat
+    for attempt in range(2):
+        stmt = _existing_keys(keys)
+        existing = dict(db.execute(stmt).all()) if stmt is not None else {}
+        rows = _batch_rows(keys, parsed_items, existing)
+        try:
+            if rows:
+                # Satu INSERT executemany untuk seluruh batch
+                db.execute(insert(Report), list(rows.values()))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if attempt == 0:
+                continue
+            raise
+        break
+
+    created = {}
+    if rows:
+        created = {r.idempotency_key: r for r in db.scalars(select(Report).where(Report.idempotency_key.in_(rows)))}
+    for report in created.values():
+        schedule_previews(report)
+    return _batch_response(results, keys, created, existing)
+
+
 @router.get("", response_model=List[ReportOut])
 def list_reports(
+    request: Request,
+    response: Response,
     status_filter: Optional[ReportStatus] = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     _: None = Depends(get_current_admin),
 ):
-    query = db.query(Report).order_by(Report.created_at.desc())
-    if status_filter is not None:
-        query = query.filter(Report.status == status_filter.value)
-    reports = query.offset(max(0, offset)).limit(max(1, min(limit, 200))).all()
-    return reports
+    """Laporan terbaru dulu.
+
+    Dua mode paging: `offset` (lama) atau `cursor` (keyset). Bila halaman penuh,
+    header `X-Next-Cursor` berisi cursor halaman berikutnya; dengan cursor, query
+    langsung mulai dari posisi terakhir lewat index (created_at, id) sehingga
+    halaman sedalam apa pun sama cepatnya.
+
+    `fields=summary` (atau daftar kolom dipisah koma) hanya memilih kolom itu,
+    mis. tanpa `notes`. ETag dihitung dari count + max(id) + sum(version) dan
+    Last-Modified dari max(updated_at), sehingga refresh tanpa perubahan dijawab 304 tanpa memuat baris.
+    """
+    limit = max(1, min(limit, 200))
+    columns = _parse_fields(fields)
+    filters = _list_filters(status_filter)
+
+    count, last_modified, max_id, versions = db.execute(_list_validator(filters)).one()
+    etag = _etag("list", status_filter and status_filter.value, limit, offset, cursor, columns,
+                 count, max_id, versions)
+    if _not_modified(request, response, etag, last_modified):
+        return _not_modified_response(response)
+
+    result = db.execute(_list_query(columns, filters, cursor, offset, limit))
+    reports = result.scalars().all() if columns is None else result.all()
+    return _list_response(reports, columns, response, limit)
 
 
 @router.get("/{report_id}", response_model=ReportOut)
 def get_report(
     report_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     _: None = Depends(get_current_admin),
 ):
-    report = db.get(Report, report_id)
-    if report is None:
+    validator = db.execute(_detail_validator(report_id)).first()
+    if validator is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
-    return report
+    last_modified, version = validator
+    if _not_modified(request, response, _etag("detail", report_id, version), last_modified):
+        return _not_modified_response(response)
+    return db.get(Report, report_id)
 
 
 @router.patch("/{report_id}", response_model=ReportOut)
@@ -87,13 +381,7 @@ def update_report(
     if report is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
 
-    update_data = update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        if field == "status" and value is not None:
-            setattr(report, field, value.value)
-        else:
-            setattr(report, field, value)
-
+    _apply_update(report, update)
     db.commit()
     db.refresh(report)
     return report
@@ -0,0 +1,156 @@
+from typing import Any, List, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, status
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_async_db
+from ..models import Report, ReportStatus
+from ..previews import schedule_previews
+from ..schemas import BatchIngestResponse, ReportCreate, ReportOut, ReportUpdate
+from .auth_async import get_current_admin
+from .reports import (
+    _apply_update,
+    _batch_response,
+    _batch_rows,
+    _by_idempotency_key,
+    _detail_validator,
+    _etag,
+    _existing_keys,
+    _list_filters,
+    _list_query,
+    _list_response,
+    _list_validator,
+    _not_modified,
+    _not_modified_response,
+    _parse_batch,
+    _parse_fields,
+    _report_values,
+    _verify_report_api_key,
+)
+
+# Versi async router reports (DB_ASYNC=1): path, parameter dan respons sama dengan
+# routers/reports.py, tetapi query berjalan di AsyncSession sehingga request yang
+# menunggu database tidak memegang thread threadpool.
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+
+@router.post("", response_model=ReportOut, status_code=status.HTTP_201_CREATED)
+async def ingest_report(
+    payload: ReportCreate,
+    response: Response,
+    _: None = Depends(_verify_report_api_key),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if payload.idempotency_key:
+        existing = (await db.scalars(_by_idempotency_key(payload.idempotency_key))).first()
+        if existing is not None:
+            response.status_code = status.HTTP_200_OK
+            return existing
+    report = Report(**_report_values(payload))
+    db.add(report)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        existing = (await db.scalars(_by_idempotency_key(payload.idempotency_key))).first()
+        if existing is None:
+            raise
+        response.status_code = status.HTTP_200_OK
+        return existing
+    await db.refresh(report)
+    schedule_previews(report)
+    return report
+
+
+@router.post("/batch", response_model=BatchIngestResponse)
+async def ingest_reports_batch(
+    payload: List[Any] = Body(...),
+    _: None = Depends(_verify_report_api_key),
+    db: AsyncSession = Depends(get_async_db),
+):
+    results, keys, parsed_items = _parse_batch(payload)
+    for attempt in range(2):
+        stmt = _existing_keys(keys)
+        existing = dict((await db.execute(stmt)).all()) if stmt is not None else {}
+        rows = _batch_rows(keys, parsed_items, existing)
+        try:
+            if rows:
+                await db.execute(insert(Report), list(rows.values()))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            if attempt == 0:
+                continue
+            raise
+        break
+
+    created = {}
+    if rows:
+        found = await db.scalars(select(Report).where(Report.idempotency_key.in_(rows)))
+        created = {r.idempotency_key: r for r in found}
+    for report in created.values():
+        schedule_previews(report)
+    return _batch_response(results, keys, created, existing)
+
+
+@router.get("", response_model=List[ReportOut])
+async def list_reports(
+    request: Request,
+    response: Response,
+    status_filter: Optional[ReportStatus] = None,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    _: None = Depends(get_current_admin),
+):
+    limit = max(1, min(limit, 200))
+    columns = _parse_fields(fields)
+    filters = _list_filters(status_filter)
+
+    count, last_modified, max_id, versions = (await db.execute(_list_validator(filters))).one()
+    etag = _etag("list", status_filter and status_filter.value, limit, offset, cursor, columns,
+                 count, max_id, versions)
+    if _not_modified(request, response, etag, last_modified):
+        return _not_modified_response(response)
+
+    result = await db.execute(_list_query(columns, filters, cursor, offset, limit))
+    reports = result.scalars().all() if columns is None else result.all()
+    return _list_response(reports, columns, response, limit)
+
+
+@router.get("/{report_id}", response_model=ReportOut)
+async def get_report(
+    report_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    _: None = Depends(get_current_admin),
+):
+    validator = (await db.execute(_detail_validator(report_id))).first()
+    if validator is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
+    last_modified, version = validator
+    if _not_modified(request, response, _etag("detail", report_id, version), last_modified):
+        return _not_modified_response(response)
+    return await db.get(Report, report_id)
+
+
+@router.patch("/{report_id}", response_model=ReportOut)
+async def update_report(
+    report_id: int,
+    update: ReportUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    _: None = Depends(get_current_admin),
+):
+    report = await db.get(Report, report_id)
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
+
+    _apply_update(report, update)
+    await db.commit()
+    await db.refresh(report)
+    return report
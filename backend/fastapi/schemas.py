@@ -35,6 +35,21 @@ class ReportBase(BaseModel):
 class ReportCreate(ReportBase):
     status: Optional[ReportStatus] = None
     title: str = Field(..., min_length=3)
+    idempotency_key: Optional[str] = Field(default=None, min_length=8, max_length=64)
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: str  # created | duplicate | error
+    error: Optional[str] = None
+
+
+class BatchIngestResponse(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    items: list[BatchItemResult]
 
 
 class ReportUpdate(BaseModel):
@@ -53,3 +68,22 @@ class ReportOut(ReportBase):
 
     class Config:
         from_attributes = True
+
+
+class RecordingSegmentOut(BaseModel):
+    index: int
+    url: str
+    size_bytes: int
+    frames: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    complete: bool = True
+    streamable: bool = False
+
+
+class RecordingOut(BaseModel):
+    report_id: int
+    fps: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    complete: bool = True
+    segments: list[RecordingSegmentOut]
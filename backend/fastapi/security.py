@@ -1,10 +1,16 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
 from jose import jwt, JWTError
 from passlib.context import CryptContext
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 
 from .config import settings
+from .models import Admin
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -31,3 +37,103 @@ def decode_token(token: str) -> dict | None:
         return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
     except JWTError:
         return None
+
+
+class AdminPrincipal:
+    """Snapshot admin yang sudah terautentikasi; tidak terikat ke Session sehingga aman dibagi antar request."""
+
+    __slots__ = ("id", "username", "created_at")
+
+    def __init__(self, id: int, username: str, created_at: datetime | None = None):
+        self.id = id
+        self.username = username
+        self.created_at = created_at
+
+    @classmethod
+    def from_admin(cls, admin) -> "AdminPrincipal":
+        return cls(admin.id, admin.username, admin.created_at)
+
+
+class PrincipalCache:
+    """LRU token -> AdminPrincipal dengan TTL, dibatasi max_entries.
+
+    Entri tidak pernah hidup melewati exp token. invalidate_admin() dipanggil saat
+    admin diubah/dihapus; event ORM di bawah memanggilnya otomatis.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(0, max_entries)
+        self._entries: OrderedDict[str, tuple[AdminPrincipal, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> AdminPrincipal | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, principal: AdminPrincipal, token_exp: float | None = None):
+        if self.ttl_seconds <= 0 or self.max_entries == 0:
+            return
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (principal, time.monotonic() + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_admin(self, admin_id: int):
+        with self._lock:
+            for token in [t for t, (p, _) in self._entries.items() if p.id == admin_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_TTL_SECONDS, settings.AUTH_CACHE_MAX_ENTRIES)
+
+
+def invalidate_admin(admin_id: int) -> None:
+    """Buang semua token admin ini dari cache (panggil setelah admin diubah atau dihapus)."""
+    principal_cache.invalidate_admin(admin_id)
+
+
+# Invalidasi otomatis: saat flush (proses ini langsung tidak memakai data lama) dan lagi
+# setelah commit, karena request lain bisa meng-cache ulang baris lama di antara keduanya.
+@event.listens_for(Admin, "after_update")
+@event.listens_for(Admin, "after_delete")
+def _admin_changed(mapper, connection, target):
+    principal_cache.invalidate_admin(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_admin_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_admins(session):
+    for admin_id in session.info.pop("changed_admin_ids", ()):
+        principal_cache.invalidate_admin(admin_id)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _admin_bulk_changed(update_context):
+    # query(Admin).update()/delete() tidak memicu event per baris: kosongkan seluruh cache
+    if update_context.mapper.class_ is Admin:
+        principal_cache.clear()
@@ -4,17 +4,22 @@ Flask Backend for PCD (Face Anonymization)
 Dipisahkan ke folder khusus `backend/flask_pcd` agar tidak bercampur dengan layanan FastAPI.
 
 Handles:
- - Menerima frame (base64) dari proses PCD eksternal (services/pcd_main.py)
+ - Menerima frame (JPEG mentah atau base64) dari proses PCD eksternal (services/pcd_main.py)
  - Memproses frame (face blur) via services.pcd_main
  - Broadcast ke klien via Socket.IO
  - Menyajikan Flutter Web (jika build tersedia)
 """
 
-from flask import Flask, send_from_directory, jsonify, request
+import time
+_IMPORT_STARTED = time.perf_counter()  # cold-start report: module import starts here
+
+from flask import Flask, Response, g, send_from_directory, jsonify, request
 from flask_socketio import SocketIO
+import base64
 import os
 import subprocess
 import sys
+import threading
 
 # Import modul pcd sebagai modul, jangan import fungsi yang memicu eksekusi loop pada import
 # Pastikan modul services dapat ditemukan saat menjalankan file ini langsung
@@ -23,22 +28,34 @@ BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
 if BACKEND_ROOT not in sys.path:
     sys.path.insert(0, BACKEND_ROOT)
 
-from services import pcd_main  # type: ignore
+# services.pcd_main (cv2, numpy, detektor) baru diimpor saat REPROCESS_FRAMES aktif, lihat _get_frame_pool()
+from services.broadcast import FrameBroadcaster  # type: ignore
+from services.frame_pool import FrameDropped  # type: ignore
+from services.metrics import CONTENT_TYPE, FRAMES_IN, FRAMES_OUT, REGISTRY, stage_timer  # type: ignore
+from services.startup import StartupReport  # type: ignore
 
 # --- Flask App Config ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret')
 socketio = SocketIO(app, cors_allowed_origins='*')
+startup = StartupReport('flask_pcd', started=_IMPORT_STARTED)
+
+# 'base64' (default): payload string yang dipahami semua viewer; 'binary': JPEG mentah (opsional, lebih kecil)
+FRAME_EMIT_FORMAT = os.environ.get('FRAME_EMIT_FORMAT', 'base64').lower()
+# Pengiriman 'frame' per klien: satu frame in-flight per viewer, tier kualitas sesuai latency ack
+broadcaster = FrameBroadcaster(socketio, emit_format=FRAME_EMIT_FORMAT)
 
 
 # --- SocketIO Events ---
 @socketio.on('connect')
 def handle_connect():
+    broadcaster.add_client(request.sid)
     print('✓ SocketIO client connected')
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    broadcaster.remove_client(request.sid)
     print('✓ SocketIO client disconnected')
 
 
@@ -68,42 +85,142 @@ def static_files(filename: str):
     return jsonify({'error': 'file not found'}), 404
 
 
+# --- Laporan cold start ---
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_first_request(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        startup.first_request(time.perf_counter() - started)
+    return response
+
+
+@app.route('/startup')
+def startup_report():
+    """Waktu cold start worker ini (import, load model lazy, request pertama)."""
+    return jsonify(startup.as_dict())
+
+
+@app.route('/metrics')
+def metrics():
+    """Metrik Prometheus: histogram latensi per tahap dan counter frame."""
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+
 # --- Receive Frame API ---
+_frame_pool = None
+_frame_pool_lock = threading.Lock()
+
+
+def _get_frame_pool():
+    """Impor services.pcd_main dan jalankan frame pool saat pertama dipakai (thread-safe, diukur)."""
+    global _frame_pool
+    if _frame_pool is None:
+        with _frame_pool_lock:
+            if _frame_pool is None:
+                with startup.time('pcd_main_import'):
+                    from services import pcd_main  # type: ignore
+                with startup.time('frame_pool_start'):
+                    _frame_pool = pcd_main.get_frame_pool()
+    return _frame_pool
+
+
+def _process_frame(jpeg: bytes) -> bytes:
+    """Proses frame di frame pool tanpa memblokir hub eventlet.
+
+    Worker pool (dengan DNN masing-masing) mengerjakan OpenCV; di eventlet
+    greenlet request hanya menunggu lewat tpool, sehingga klien lain tetap
+    dilayani dan frame dari banyak klien diproses di banyak core.
+    """
+    started = time.perf_counter()
+    future = _get_frame_pool().submit(jpeg)
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        result = tpool.execute(future.result)
+    else:
+        result = future.result()
+    # Hanya frame pertama yang disimpan: termasuk load model per worker
+    startup.mark('first_frame', time.perf_counter() - started)
+    return result
+
+
+def _reprocess_enabled() -> bool:
+    # Untuk mengurangi latency, default: JANGAN proses ulang di sini
+    # Set REPROCESS_FRAMES=1 jika ingin memproses di Flask juga (double pass)
+    return os.environ.get('REPROCESS_FRAMES', '0') in ('1', 'true', 'True')
+
+
+def _read_uploaded_jpeg() -> bytes | None:
+    """Ambil byte JPEG dari body mentah image/jpeg atau JSON lama {"image": "<base64>"}."""
+    if request.mimetype in ('image/jpeg', 'application/octet-stream'):
+        return request.get_data(cache=False) or None
+    data = request.get_json(force=True, silent=True)
+    if not data or 'image' not in data:
+        return None
+    return base64.b64decode(data['image'])
+
+
+def _handle_frame(jpeg: bytes):
+    """(Opsional) proses ulang frame lalu broadcast ke semua klien."""
+    FRAMES_IN.inc()
+    if _reprocess_enabled():
+        try:
+            jpeg = _process_frame(jpeg)
+        except FrameDropped:
+            # Antrean frame pool penuh: frame yang lebih baru menggantikannya, jangan broadcast
+            raise
+        except Exception as _:
+            # Jika gagal memproses, fallback kirim as-is
+            pass
+
+    # Viewer yang lambat melewatkan frame dan turun tier kualitas, bukan menumpuk buffer kirim
+    with stage_timer('socketio_emit'):
+        broadcaster.publish(jpeg)
+    FRAMES_OUT.inc()
+
+
 @app.route('/upload_frame', methods=['POST'])
 def upload_frame():
     """
-    Terima image base64 (JSON {"image":"..."}) → (opsional) proses via PCD → broadcast via Socket.IO
+    Terima frame (body image/jpeg mentah, atau JSON {"image":"<base64>"}) → (opsional) proses via PCD → broadcast via Socket.IO
     """
     try:
-        data = request.get_json(force=True)
-        if not data or 'image' not in data:
+        jpeg = _read_uploaded_jpeg()
+        if not jpeg:
             return jsonify({'error': 'missing image field'}), 400
 
-        img_b64 = data['image']
-
-        # Untuk mengurangi latency, default: JANGAN proses ulang di sini
-        # Set REPROCESS_FRAMES=1 jika ingin memproses di Flask juga (double pass)
-        reprocess = os.environ.get('REPROCESS_FRAMES', '0') in ('1', 'true', 'True')
-        if reprocess:
-            try:
-                img_b64 = pcd_main.process_frame_base64(img_b64)
-            except Exception as _:
-                # Jika gagal memproses, fallback kirim as-is
-                pass
-
-        # Broadcast ke semua klien
-        # Catatan: python-socketio/flask-socketio tidak menerima argumen 'compress' di emit()
-        # Kompresi sudah ditangani oleh JPEG; hapus argumen khusus untuk menghindari error.
-        socketio.emit('frame', {'image': img_b64})
+        _handle_frame(jpeg)
 
         print("→ Frame processed and broadcast to clients.")
         return jsonify({'status': 'processed'}), 200
 
+    except FrameDropped:
+        # 503 agar uploader mundur sebentar
+        return jsonify({'status': 'dropped'}), 503
     except Exception as e:
         print('✗ Error in /upload_frame:', e)
         return jsonify({'error': str(e)}), 500
 
 
+@socketio.on('upload_frame')
+def handle_upload_frame(data):
+    """Ingest biner via Socket.IO: klien mengirim byte JPEG di koneksi persisten."""
+    if not isinstance(data, (bytes, bytearray)) or not data:
+        return {'error': 'expected binary JPEG payload'}
+    try:
+        _handle_frame(bytes(data))
+        return {'status': 'processed'}
+    except FrameDropped:
+        return {'status': 'dropped'}
+    except Exception as e:
+        print('✗ Error in upload_frame event:', e)
+        return {'error': str(e)}
+
+
 # --- Run Server ---
 def _start_pcd_subprocess():
     """Menjalankan services/pcd_main.py sebagai subprocess.
@@ -128,6 +245,9 @@ def _start_pcd_subprocess():
         return None
 
 
+startup.mark('import')
+
+
 if __name__ == '__main__':
     print("🚀 Flask PCD backend running on http://0.0.0.0:5001")
     pcd_proc = _start_pcd_subprocess()
@@ -0,0 +1,128 @@
+import threading
+
+import cv2
+import numpy as np
+
+"""
+anonymizer.py
+--------------
+Single anonymization engine shared by pcd_main (capture pipeline and the
+Flask frame path) and the local mainDNN.py prototype.
+Every mode writes straight into the face ROI views of the frame (no crop
+copies), and large Gaussian kernels are applied on a downscaled ROI so the
+cost per face stays roughly constant however close the face is.
+"""
+
+MODES = ('gaussian', 'mosaic', 'solid', 'shuffle', 'none')
+
+
+def _oddize(n: int) -> int:
+    """Return an odd integer >= 3 based on n."""
+    n = max(3, int(n))
+    return n if (n % 2) == 1 else n + 1
+
+
+class Anonymizer:
+    """Anonymize all face boxes of a frame in place.
+
+    Modes:
+     - gaussian: kernel ~ min(face w, h) / kernel_factor, but never weaker than
+       min_kernel / min_sigma (the fixed 51x51, sigma 30 blur the Flask frame
+       path used before, so small or distant faces stay as anonymized); kernels
+       above max_kernel run on a downscaled ROI and are upscaled back
+     - mosaic: blocks of ~ face width / mosaic_divisor pixels
+     - solid: fill with `fill_color` (BGR)
+     - shuffle: ROI reduced to a coarse grid whose cells are randomly permuted,
+       so neither shapes nor the original pixel layout survive
+     - none: leave the frame untouched
+    """
+
+    def __init__(self, mode: str = 'gaussian', kernel_factor: int = 3, max_kernel: int = 31,
+                 min_kernel: int = 51, min_sigma: float = 30.0, mosaic_divisor: int = 15, fill_color: tuple[int, int, int] = (0, 0, 0),
+                 shuffle_divisor: int = 12):
+        self.mode = self._check_mode(mode)
+        self.kernel_factor = max(1, int(kernel_factor))
+        self.max_kernel = _oddize(max_kernel)
+        self.min_kernel = _oddize(min_kernel)
+        self.min_sigma = max(0.0, float(min_sigma))
+        self.mosaic_divisor = max(1, int(mosaic_divisor))
+        self.fill_color = tuple(int(c) for c in fill_color)
+        self.shuffle_divisor = max(1, int(shuffle_divisor))
+        # numpy Generators are not thread-safe; frame pool workers each get their own
+        self._local = threading.local()
+
+    @staticmethod
+    def _check_mode(mode: str) -> str:
+        mode = (mode or 'none').lower()
+        if mode not in MODES:
+            raise ValueError(f"unknown anonymization mode '{mode}' (expected one of {', '.join(MODES)})")
+        return mode
+
+    def apply(self, frame: np.ndarray, boxes, mode: str | None = None) -> int:
+        """Anonymize every (x1, y1, x2, y2) box of `frame` in place; returns how many were processed."""
+        mode = self.mode if mode is None else self._check_mode(mode)
+        if mode == 'none' or frame is None or len(boxes) == 0:
+            return 0
+        h, w = frame.shape[:2]
+        count = 0
+        for (x1, y1, x2, y2) in boxes:
+            x1, x2 = max(0, min(int(x1), w)), max(0, min(int(x2), w))
+            y1, y2 = max(0, min(int(y1), h)), max(0, min(int(y2), h))
+            if x2 <= x1 or y2 <= y1:
+                continue
+            self.anonymize_roi(frame[y1:y2, x1:x2], mode)
+            count += 1
+        return count
+
+    def anonymize_roi(self, roi: np.ndarray, mode: str | None = None) -> np.ndarray:
+        """Anonymize one ROI view in place (and return it)."""
+        mode = self.mode if mode is None else self._check_mode(mode)
+        if roi.size == 0 or mode == 'none':
+            return roi
+        if mode == 'gaussian':
+            self._gaussian(roi)
+        elif mode == 'mosaic':
+            self._mosaic(roi)
+        elif mode == 'solid':
+            # cv2 fill is much faster than numpy broadcasting into a strided view
+            cv2.rectangle(roi, (0, 0), (roi.shape[1] - 1, roi.shape[0] - 1), self.fill_color, -1)
+        elif mode == 'shuffle':
+            self._shuffle(roi)
+        return roi
+
+    # --- Modes ---
+    def _gaussian(self, roi: np.ndarray):
+        h, w = roi.shape[:2]
+        k = max(_oddize(min(h, w) // self.kernel_factor), self.min_kernel)
+        # sigma OpenCV would derive from k, raised to the floor
+        sigma = max(0.3 * ((k - 1) * 0.5 - 1) + 0.8, self.min_sigma)
+        if k <= self.max_kernel:
+            cv2.GaussianBlur(roi, (k, k), sigma, dst=roi)
+            return
+        # Blur at reduced size with a kernel of ~max_kernel, then upscale: constant cost per face
+        scale = self.max_kernel / float(k)
+        sw, sh = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+        small = cv2.resize(roi, (sw, sh), interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(small, (self.max_kernel, self.max_kernel), sigma * scale, dst=small)
+        cv2.resize(small, (w, h), dst=roi, interpolation=cv2.INTER_LINEAR)
+
+    def _mosaic(self, roi: np.ndarray):
+        h, w = roi.shape[:2]
+        block = max(3, w // self.mosaic_divisor)
+        small = cv2.resize(roi, (max(1, w // block), max(1, h // block)), interpolation=cv2.INTER_LINEAR)
+        cv2.resize(small, (w, h), dst=roi, interpolation=cv2.INTER_NEAREST)
+
+    def _shuffle(self, roi: np.ndarray):
+        h, w = roi.shape[:2]
+        gw = max(2, min(w, self.shuffle_divisor))
+        gh = max(2, min(h, int(round(self.shuffle_divisor * h / float(w)))))
+        small = cv2.resize(roi, (gw, gh), interpolation=cv2.INTER_AREA)
+        cells = small.reshape(gh * gw, -1)
+        small = cells[self._rng().permutation(cells.shape[0])].reshape(small.shape)
+        cv2.resize(small, (w, h), dst=roi, interpolation=cv2.INTER_NEAREST)
+
+    def _rng(self) -> np.random.Generator:
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = np.random.default_rng()
+        return rng
@@ -0,0 +1,242 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+"""
+batch_anonymize.py
+-------------------
+Offline re-anonymization of recorded videos, used by `pcd_main --batch`.
+Each input is split into frame-range chunks that run in a process pool; every
+worker process loads its own detector once and anonymizes its chunks without
+display, upload, mirroring or frame skipping (every frame is detected). The
+chunks of a video are joined back in order into one file with the source fps,
+and the joined frame count is checked against the source.
+Chunks are written in the final codec and concatenated without re-encoding
+when ffmpeg is on PATH; otherwise they are written as high-quality MJPEG and
+re-encoded once during the join.
+"""
+
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+BATCH_CHUNK_FRAMES = int(os.environ.get('BATCH_CHUNK_FRAMES', '600'))
+
+# Per-process state of pool workers (set by _init_worker)
+_worker_detector = None
+_worker_mode = None
+
+
+def _init_worker(mode: str):
+    global _worker_detector, _worker_mode
+    if int(os.environ.get('DETECTOR_THREADS', '0')) <= 0:
+        # One process per core already; OpenCV's own thread pool would only oversubscribe
+        cv2.setNumThreads(1)
+    from services import pcd_main
+    _worker_detector = pcd_main.load_detector()
+    _worker_mode = mode
+
+
+def _open_at(src: str, start: int):
+    """Open `src` positioned on frame `start` (seek, falling back to decoding forward when inexact)."""
+    cap = cv2.VideoCapture(src)
+    if start <= 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return cap
+    cap.release()
+    cap = cv2.VideoCapture(src)
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap
+
+
+def _anonymize_chunk(src: str, dst: str, start: int, count: int | None, fourcc: str,
+                     fps: float, size: tuple[int, int]) -> tuple[int, int]:
+    """Worker: anonymize frames [start, start + count) of src into dst (count=None: until EOF).
+
+    Returns (frames written, faces found).
+    """
+    from services import pcd_main
+    cap = _open_at(src, start)
+    writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if fourcc == 'MJPG':
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, 95)
+    if not cap.isOpened() or not writer.isOpened():
+        cap.release()
+        writer.release()
+        raise RuntimeError(f"cannot open {src} or {dst}")
+    written = faces = 0
+    try:
+        while count is None or written < count:
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                break
+            boxes = pcd_main.detect_frame_boxes(frame, own_detector=_worker_detector)
+            pcd_main.anonymizer.apply(frame, boxes, _worker_mode)
+            writer.write(frame)
+            written += 1
+            faces += len(boxes)
+    finally:
+        cap.release()
+        writer.release()
+    return written, faces
+
+
+def plan_chunks(total_frames: int, chunk_frames: int) -> list[tuple[int, int | None]]:
+    """Split a video into (start, count) ranges; the last one reads to EOF (frame counts can be off)."""
+    if total_frames <= 0 or chunk_frames <= 0 or total_frames <= chunk_frames:
+        return [(0, None)]
+    starts = list(range(0, total_frames, chunk_frames))
+    return [(s, chunk_frames) for s in starts[:-1]] + [(starts[-1], None)]
+
+
+def _join_chunks(parts: list[str], dst: str, fps: float, size: tuple[int, int], ffmpeg: str | None) -> int:
+    """Concatenate chunk files in order into dst; returns the number of frames in dst."""
+    if ffmpeg:
+        list_path = dst + '.concat.txt'
+        with open(list_path, 'w') as f:
+            for p in parts:
+                f.write(f"file '{os.path.abspath(p)}'\n")
+        try:
+            subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                            '-c', 'copy', dst], check=True)
+        finally:
+            os.remove(list_path)
+        cap = cv2.VideoCapture(dst)
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        return frames
+    writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"cannot open {dst} for writing")
+    frames = 0
+    try:
+        for p in parts:
+            cap = cv2.VideoCapture(p)
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                writer.write(frame)
+                frames += 1
+            cap.release()
+    finally:
+        writer.release()
+    return frames
+
+
+class _Job:
+    """One input video: its chunk plan, finished chunk results and temp directory."""
+
+    def __init__(self, src: str, dst: str, tmp_dir: str, chunk_frames: int, ext: str):
+        cap = cv2.VideoCapture(src)
+        if not cap.isOpened():
+            raise RuntimeError(f"could not open video file: {src}")
+        self.src, self.dst, self.tmp_dir = src, dst, tmp_dir
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        self.chunks = plan_chunks(self.total, chunk_frames)
+        self.parts = [os.path.join(tmp_dir, f"chunk_{i:05d}{ext}") for i in range(len(self.chunks))]
+        self.results: dict[int, tuple[int, int]] = {}
+        self.failed = None
+
+
+def run_batch(inputs: list[str], output_dir: str, workers: int | None = None, chunk_frames: int | None = None,
+              mode: str = 'gaussian', suffix: str = '_anon') -> int:
+    """Anonymize every input video into output_dir/<name><suffix>.mp4. Returns an exit code (0 = all ok)."""
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunk_frames = chunk_frames or BATCH_CHUNK_FRAMES
+    ffmpeg = shutil.which(os.environ.get('FFMPEG_BIN', 'ffmpeg'))
+    fourcc, ext = ('mp4v', '.mp4') if ffmpeg else ('MJPG', '.avi')
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_root = tempfile.mkdtemp(prefix='pcd_batch_', dir=output_dir)
+
+    jobs = []
+    for i, src in enumerate(inputs):
+        name = os.path.splitext(os.path.basename(src))[0]
+        dst = os.path.join(output_dir, f"{name}{suffix}.mp4")
+        try:
+            jobs.append(_Job(src, dst, os.path.join(tmp_root, str(i)), chunk_frames, ext))
+            os.makedirs(jobs[-1].tmp_dir)
+        except RuntimeError as e:
+            print(f"✗ {e}")
+    total_frames = sum(max(0, j.total) for j in jobs)
+    total_chunks = sum(len(j.chunks) for j in jobs)
+    print(f"ℹ️ Batch: {len(jobs)} video(s), {total_frames} frames in {total_chunks} chunk(s), "
+          f"{workers} worker(s), mode={mode}, join={'ffmpeg concat' if ffmpeg else 'opencv re-encode'}")
+
+    failures = len(inputs) - len(jobs)
+    done_frames = done_chunks = 0
+    started = time.monotonic()
+    ctx = multiprocessing.get_context('spawn')  # fresh interpreter per worker, same on Linux and Windows
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(mode,)) as pool:
+            # All chunks of all videos share the pool, so cores stay busy across file boundaries
+            pending = {}
+            for job in jobs:
+                for idx, (start, count) in enumerate(job.chunks):
+                    fut = pool.submit(_anonymize_chunk, job.src, job.parts[idx], start, count,
+                                      fourcc, job.fps, job.size)
+                    pending[fut] = (job, idx)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    job, idx = pending.pop(fut)
+                    try:
+                        job.results[idx] = fut.result()
+                    except Exception as e:
+                        if job.failed is None:
+                            job.failed = e
+                        job.results[idx] = (0, 0)
+                    done_chunks += 1
+                    done_frames += job.results[idx][0]
+                    elapsed = time.monotonic() - started
+                    fps = done_frames / elapsed if elapsed > 0 else 0.0
+                    eta = f", ETA {(total_frames - done_frames) / fps:.0f}s" if fps > 0 and total_frames else ''
+                    print(f"ℹ️ Batch: {done_chunks}/{total_chunks} chunks, {done_frames}/{total_frames} frames, "
+                          f"{fps:.1f} fps{eta}")
+                    if len(job.results) == len(job.chunks):
+                        failures += 0 if _finish_job(job, ffmpeg) else 1
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    elapsed = time.monotonic() - started
+    print(f"✓ Batch finished: {done_frames} frames in {elapsed:.1f}s "
+          f"({done_frames / elapsed if elapsed > 0 else 0:.1f} fps), {failures} failed")
+    return 1 if failures else 0
+
+
+def _finish_job(job: _Job, ffmpeg: str | None) -> bool:
+    """Join a video's chunks once all of them are done; returns False if the video failed."""
+    try:
+        if job.failed is not None:
+            raise RuntimeError(job.failed)
+        # A chunk that returned short (except the open-ended last one) would shift every later frame
+        for idx, (start, count) in enumerate(job.chunks):
+            if count is not None and job.results[idx][0] != count:
+                raise RuntimeError(f"chunk at frame {start} produced {job.results[idx][0]}/{count} frames")
+        expected = sum(r[0] for r in job.results.values())
+        joined = _join_chunks(job.parts, job.dst, job.fps, job.size, ffmpeg)
+        if joined != expected:
+            raise RuntimeError(f"joined file has {joined} frames, expected {expected}")
+        faces = sum(r[1] for r in job.results.values())
+        print(f"✓ Anonymized {job.src} → {job.dst} ({joined} frames, {faces} face boxes)")
+        return True
+    except Exception as e:
+        print(f"✗ Batch anonymization failed for {job.src}: {e}")
+        return False
+    finally:
+        shutil.rmtree(job.tmp_dir, ignore_errors=True)
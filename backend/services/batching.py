@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from services.metrics import stage_timer
+
+"""
+batching.py
+------------
+Micro-batching scheduler for the face detectors in services.detectors.
+Frames submitted from concurrent requests within a short window are handed to
+detector.detect_raw_batch() together; the SSD backend stacks them with
+cv2.dnn.blobFromImages and runs a single net.forward() call. Each caller
+receives only the detections that belong to its own frame.
+"""
+
+
+class DetectionBatcher:
+    """Collect frames for up to `max_wait_ms` (or `max_batch` frames) and detect them in one pass.
+
+    The scheduler owns `detector` exclusively: a single worker thread is the
+    only caller, so the detector is never used concurrently.
+    """
+
+    def __init__(self, detector, max_batch: int = 8, max_wait_ms: float = 5.0):
+        self.detector = detector
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._pending: list[tuple[np.ndarray, Future]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Simple counters for diagnostics
+        self.batches = 0
+        self.frames = 0
+
+        self._worker = threading.Thread(target=self._run, name='detect-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, frame: np.ndarray) -> Future:
+        """Queue a BGR frame; the Future resolves to its raw (boxes, scores)."""
+        fut: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('DetectionBatcher is closed')
+            self._pending.append((frame, fut))
+            self._cond.notify()
+        return fut
+
+    def detect(self, frame: np.ndarray, timeout: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Blocking helper: submit a frame and wait for its raw (boxes, scores) in image pixels."""
+        return self.submit(frame).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        avg = (self.frames / self.batches) if self.batches else 0.0
+        with self._cond:
+            pending = len(self._pending)
+        return {'batches': self.batches, 'frames': self.frames, 'avg_batch_size': round(avg, 2), 'pending': pending}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=2.0)
+
+    # --- Worker ---
+    def _take_batch(self) -> list[tuple[np.ndarray, Future]]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+            # First frame arrived: keep the window open until it is full or max_wait expires
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            batch = [(frame, fut) for (frame, fut) in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                with stage_timer('detect_batch'):
+                    results = self.detector.detect_raw_batch([frame for (frame, _) in batch])
+            except Exception as e:
+                for (_, fut) in batch:
+                    fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(batch)
+            for result, (_, fut) in zip(results, batch):
+                fut.set_result(result)
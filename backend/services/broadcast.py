@@ -0,0 +1,210 @@
+import base64
+import os
+import threading
+import time
+
+from services.metrics import FRAMES_DROPPED
+
+"""
+broadcast.py
+-------------
+Per-client 'frame' delivery for the Flask/Socket.IO backends.
+Instead of pushing every frame to every viewer, each client has at most one
+frame in flight: a new frame is only sent once the previous one was acked,
+and frames published meanwhile are skipped (the client always gets the
+latest one). Clients are placed on quality tiers (resolution / JPEG quality);
+each tier is encoded at most once per frame and shared by all its clients,
+and clients move between tiers based on their observed ack latency.
+
+The ack (Socket.IO ack callback) is optional. A client that has never acked
+(e.g. the existing dashboard) is treated as a legacy viewer and simply gets
+every published frame at the source tier, like a plain broadcast; the
+in-flight limit and tier switching only apply once a client has acked at
+least one frame.
+"""
+
+
+def parse_tiers(spec: str) -> list[dict]:
+    """Parse 'name:max_width:quality,...' (max_width 0 / quality 0 = keep the frame as received)."""
+    tiers = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, max_width, quality = part.split(':')
+        quality = int(quality)
+        tiers.append({'name': name, 'max_width': int(max_width), 'quality': max(10, min(95, quality)) if quality > 0 else 0})
+    return tiers
+
+
+DEFAULT_TIERS = 'source:0:0,medium:480:60,low:320:40'
+
+
+class _Client:
+    __slots__ = ('sid', 'tier', 'acked', 'in_flight', 'sent_at', 'last_seq', 'latency_ms', 'fast_acks', 'sent',
+                 'skipped')
+
+    def __init__(self, sid: str, tier: int):
+        self.sid = sid
+        self.tier = tier
+        self.acked = False  # False = legacy viewer: no ack seen yet, frames are not gated
+        self.in_flight = False
+        self.sent_at = 0.0
+        self.last_seq = -1
+        self.latency_ms = None  # EWMA of ack latency
+        self.fast_acks = 0
+        self.sent = 0
+        self.skipped = 0
+
+
+class FrameBroadcaster:
+    """Latest-frame-wins fan-out of JPEG frames with ack-driven quality tiers."""
+
+    def __init__(self, socketio, event: str = 'frame', tiers: list[dict] | None = None,
+                 emit_format: str = 'base64', ack_timeout: float | None = None,
+                 downgrade_ms: float | None = None, upgrade_ms: float | None = None,
+                 upgrade_after: int = 30):
+        self.socketio = socketio
+        self.event = event
+        self.tiers = tiers or parse_tiers(os.environ.get('FRAME_TIERS', DEFAULT_TIERS))
+        self.emit_format = emit_format
+        self.ack_timeout = ack_timeout if ack_timeout is not None else float(os.environ.get('FRAME_ACK_TIMEOUT', '2.0'))
+        self.downgrade_ms = downgrade_ms if downgrade_ms is not None else float(os.environ.get('FRAME_DOWNGRADE_MS', '250'))
+        self.upgrade_ms = upgrade_ms if upgrade_ms is not None else float(os.environ.get('FRAME_UPGRADE_MS', '80'))
+        self.upgrade_after = upgrade_after
+
+        self._clients: dict[str, _Client] = {}
+        self._lock = threading.Lock()
+        self._seq = -1
+        self._jpeg = None
+        self._decoded = None
+        self._encoded: dict[int, object] = {}  # tier index -> payload for the current frame
+
+    # --- Client lifecycle ---
+    def add_client(self, sid: str):
+        with self._lock:
+            self._clients[sid] = _Client(sid, 0)
+        self._flush()
+
+    def remove_client(self, sid: str):
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    # --- Publishing ---
+    def publish(self, jpeg: bytes):
+        """Make `jpeg` the latest frame and send it to every client that is ready for one."""
+        with self._lock:
+            self._seq += 1
+            self._jpeg = jpeg
+            self._decoded = None
+            self._encoded = {}
+            now = time.monotonic()
+            for client in self._clients.values():
+                if not client.acked:
+                    continue
+                if client.in_flight and (now - client.sent_at) > self.ack_timeout:
+                    # Lost or very slow ack: free the slot and move the client down a tier
+                    client.in_flight = False
+                    self._shift_tier(client, +1)
+                elif client.in_flight:
+                    client.skipped += 1
+                    FRAMES_DROPPED.labels('broadcast').inc()
+        self._flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_tier = {t['name']: 0 for t in self.tiers}
+            for c in self._clients.values():
+                per_tier[self.tiers[c.tier]['name']] += 1
+            return {
+                'clients': len(self._clients),
+                'legacy': sum(1 for c in self._clients.values() if not c.acked),
+                'tiers': per_tier,
+                'sent': sum(c.sent for c in self._clients.values()),
+                'skipped': sum(c.skipped for c in self._clients.values()),
+            }
+
+    # --- Internals ---
+    def _payload(self, tier_idx: int):
+        """Encode the current frame for a tier once; later clients on that tier reuse it."""
+        if tier_idx in self._encoded:
+            return self._encoded[tier_idx]
+        tier = self.tiers[tier_idx]
+        data = self._jpeg
+        if tier['max_width'] > 0 or tier['quality'] > 0:
+            # Deferred: cv2/numpy are only needed once a viewer drops to a re-encoded tier
+            import cv2
+            import numpy as np
+            if self._decoded is None:
+                self._decoded = cv2.imdecode(np.frombuffer(self._jpeg, np.uint8), cv2.IMREAD_COLOR)
+            frame = self._decoded
+            if frame is not None:
+                if tier['max_width'] > 0 and frame.shape[1] > tier['max_width']:
+                    ratio = tier['max_width'] / float(frame.shape[1])
+                    frame = cv2.resize(frame, (tier['max_width'], max(1, int(frame.shape[0] * ratio))),
+                                       interpolation=cv2.INTER_AREA)
+                quality = tier['quality'] or 80
+                data = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+        if self.emit_format == 'base64':
+            image = base64.b64encode(data).decode('ascii')
+        else:
+            image = data
+        payload = {'image': image, 'tier': tier['name'], 'seq': self._seq}
+        self._encoded[tier_idx] = payload
+        return payload
+
+    def _shift_tier(self, client: _Client, step: int):
+        new_tier = max(0, min(len(self.tiers) - 1, client.tier + step))
+        if new_tier != client.tier:
+            client.tier = new_tier
+            client.latency_ms = None
+            client.fast_acks = 0
+
+    def _on_ack(self, sid: str, seq: int):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            if not client.acked:
+                # First ack: the client takes part in flow control from now on. Legacy sends
+                # were not gated, so this ack says nothing about its latency yet.
+                client.acked = True
+                client.in_flight = False
+            elif client.last_seq != seq or not client.in_flight:
+                return
+            else:
+                client.in_flight = False
+                latency = (time.monotonic() - client.sent_at) * 1000.0
+                client.latency_ms = latency if client.latency_ms is None else 0.7 * client.latency_ms + 0.3 * latency
+                if client.latency_ms > self.downgrade_ms:
+                    self._shift_tier(client, +1)
+                elif client.latency_ms < self.upgrade_ms:
+                    client.fast_acks += 1
+                    if client.fast_acks >= self.upgrade_after:
+                        self._shift_tier(client, -1)
+                else:
+                    client.fast_acks = 0
+        # A newer frame may already be waiting for this client
+        self._flush()
+
+    def _flush(self):
+        """Send the latest frame to every idle client that has not seen it yet."""
+        sends = []
+        with self._lock:
+            if self._jpeg is None:
+                return
+            seq = self._seq
+            now = time.monotonic()
+            for client in self._clients.values():
+                if client.last_seq >= seq or (client.acked and client.in_flight):
+                    continue
+                # Legacy viewers get every frame (plain broadcast); acking viewers one at a time
+                client.in_flight = client.acked
+                client.sent_at = now
+                client.last_seq = seq
+                client.sent += 1
+                sends.append((client.sid, self._payload(client.tier)))
+        # Emit outside the lock: under eventlet emit may yield to other greenlets
+        for sid, payload in sends:
+            self.socketio.emit(self.event, payload, to=sid,
+                               callback=lambda *_, _sid=sid, _seq=seq: self._on_ack(_sid, _seq))
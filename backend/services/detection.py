@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+"""
+detection.py
+-------------
+Shared post-processing for the face detectors.
+Turns raw detections (the SSD `detections` tensor, or boxes + scores from any
+backend in services.detectors) into an (N, 4) int array of (x1, y1, x2, y2)
+boxes in frame coordinates using NumPy masking instead of a Python loop, then
+pads, clips and suppresses overlapping boxes so each face is blurred only
+once. For high-resolution sources the frame can instead be split into
+overlapping tiles that are detected as one batch.
+"""
+
+
+def nms_boxes(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Return indices of the boxes kept by non-maximum suppression (highest score first)."""
+    if boxes.shape[0] <= 1 or iou_threshold >= 1.0:
+        return np.arange(boxes.shape[0])
+    rects = np.column_stack([boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+    keep = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), 0.0, float(iou_threshold))
+    return np.asarray(keep, dtype=np.int64).reshape(-1)
+
+
+def decode_detections(detections: np.ndarray, width: int, height: int,
+                      confidence_threshold: float = 0.5, pad: float = 0.0,
+                      nms_threshold: float = 0.3) -> np.ndarray:
+    """Decode SSD output into padded, clipped, de-duplicated boxes.
+
+    detections: raw net.forward() output, shape (1, 1, K, 7) with rows
+        [image_id, label, confidence, x1, y1, x2, y2] (coordinates in 0..1).
+    pad: margin added on every side, as a fraction of the box width/height.
+    nms_threshold: IoU above which the lower-confidence box is dropped.
+
+    Returns an (N, 4) int32 array; N may be 0.
+    """
+    rows = detections.reshape(-1, 7)
+    rows = rows[rows[:, 2] > confidence_threshold]
+    boxes = rows[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+    return finish_boxes(boxes, rows[:, 2], width, height, pad, nms_threshold)
+
+
+def finish_boxes(boxes: np.ndarray, scores: np.ndarray, width: int, height: int,
+                  pad: float, nms_threshold: float) -> np.ndarray:
+    """Pad, clip to the frame, drop empty boxes and run NMS on float (x1, y1, x2, y2) boxes.
+
+    Shared by every detector backend (services.detectors) and decode_detections.
+    """
+    if boxes.shape[0] == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    if pad > 0:
+        bw = (boxes[:, 2] - boxes[:, 0]) * pad
+        bh = (boxes[:, 3] - boxes[:, 1]) * pad
+        boxes = boxes + np.column_stack([-bw, -bh, bw, bh])
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+    boxes = boxes.astype(np.int32)
+
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    boxes, scores = boxes[valid], scores[valid]
+    if boxes.shape[0] > 1:
+        boxes = boxes[nms_boxes(boxes, scores, nms_threshold)]
+    return boxes
+
+
+# --- Tiled detection for high-resolution frames ---
+def _tile_starts(length: int, tile: int, overlap: float) -> list[int]:
+    step = max(1.0, tile * (1.0 - overlap))
+    n = int(np.ceil(max(0, length - tile) / step)) + 1
+    if n == 1:
+        return [0]
+    return [int(round(v)) for v in np.linspace(0, length - tile, n)]
+
+
+def tile_views(width: int, height: int, tile_size: int = 600, overlap: float = 0.2,
+               max_tiles: int = 12) -> list[tuple[int, int, int, int]]:
+    """Views (x1, y1, x2, y2) to detect on: the full frame first, then overlapping square tiles.
+
+    The tile count follows the frame area (about area / tile_size^2), so the
+    cost grows predictably with resolution; when it would exceed `max_tiles`
+    the tiles are enlarged instead. Frames smaller than about 1.5 tiles get
+    only the full-frame view.
+    """
+    full = (0, 0, width, height)
+    # Below ~1.5 tiles the zoom gained per tile is too small to be worth the extra batch
+    if tile_size <= 0 or max(width, height) < 1.5 * tile_size:
+        return [full]
+    overlap = min(max(overlap, 0.0), 0.5)
+    size = tile_size
+    while True:
+        tw, th = min(size, width), min(size, height)
+        xs, ys = _tile_starts(width, tw, overlap), _tile_starts(height, th, overlap)
+        if len(xs) * len(ys) <= max(1, max_tiles) or (tw == width and th == height):
+            break
+        size = int(size * 1.25)
+    if len(xs) * len(ys) <= 1:
+        return [full]
+    return [full] + [(x, y, x + tw, y + th) for y in ys for x in xs]
+
+
+def merge_tile_boxes(results: list[tuple[np.ndarray, np.ndarray]], views: list[tuple[int, int, int, int]],
+                     width: int, height: int, edge_margin: int = 2) -> tuple[np.ndarray, np.ndarray]:
+    """Map per-view raw detections (boxes in view pixels, scores) back to frame coordinates.
+
+    Boxes touching a tile border that lies inside the frame are cut faces; they
+    are dropped because the overlap (or the full-frame view for large faces)
+    holds a complete copy. The caller runs finish_boxes (pad/clip/NMS) on the result.
+    """
+    all_boxes, all_scores = [], []
+    for (boxes, scores), (x1, y1, x2, y2) in zip(results, views):
+        if boxes.shape[0] == 0:
+            continue
+        boxes = boxes + np.array([x1, y1, x1, y1], dtype=np.float32)
+        if (x2 - x1, y2 - y1) != (width, height):
+            cut = np.zeros(boxes.shape[0], dtype=bool)
+            if x1 > 0:
+                cut |= boxes[:, 0] <= x1 + edge_margin
+            if y1 > 0:
+                cut |= boxes[:, 1] <= y1 + edge_margin
+            if x2 < width:
+                cut |= boxes[:, 2] >= x2 - edge_margin
+            if y2 < height:
+                cut |= boxes[:, 3] >= y2 - edge_margin
+            boxes, scores = boxes[~cut], scores[~cut]
+        all_boxes.append(boxes)
+        all_scores.append(scores)
+    if not all_boxes:
+        return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+    return np.concatenate(all_boxes), np.concatenate(all_scores)
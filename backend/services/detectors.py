@@ -0,0 +1,355 @@
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+"""
+detectors.py
+-------------
+Face-detection backends behind one interface.
+ - ssd:   res10 300x300 SSD through cv2.dnn (Caffe), batched with blobFromImages
+ - yunet: OpenCV FaceDetectorYN (YuNet ONNX model)
+ - onnx:  ONNX Runtime session for an UltraFace-style model (scores + boxes
+          outputs); point ONNX_MODEL at an INT8 model to run it quantized
+All backends run on the CPU, return raw (boxes, scores) in image pixels and
+leave padding/clipping/NMS to services.detection.finish_boxes.
+
+Compare backends on this host:
+    python services/detectors.py compare --size 1280x720 --frames 50
+"""
+
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Allow `python services/detectors.py compare` to import sibling modules as `services.*`
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+from services.metrics import stage_timer
+
+MODELS_DIR = os.path.join(_BACKEND_DIR, 'models')
+DEFAULT_SSD_PROTOTXT = os.path.join(MODELS_DIR, 'deploy.prototxt.txt')
+DEFAULT_SSD_MODEL = os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+DEFAULT_YUNET_MODEL = os.path.join(MODELS_DIR, 'face_detection_yunet_2023mar.onnx')
+DEFAULT_ONNX_MODEL = os.path.join(MODELS_DIR, 'version-RFB-320.onnx')
+
+_EMPTY = (np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32))
+
+
+class FaceDetector:
+    """Base class. Instances are not thread-safe: use one per thread or guard with a lock."""
+
+    name = 'base'
+
+    def __init__(self, confidence_threshold: float = 0.5, threads: int = 0):
+        self.confidence_threshold = confidence_threshold
+        self.threads = max(0, int(threads))
+
+    def detect_raw(self, image: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return (boxes (N, 4) float32 x1, y1, x2, y2 in image pixels, scores (N,))."""
+        return self.detect_raw_batch([image])[0]
+
+    def detect_raw_batch(self, images: list[np.ndarray]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Detect on several images (tiles, concurrent requests); backends override to batch."""
+        return [self.detect_raw(image) for image in images]
+
+    def warmup(self, size: tuple[int, int] = (640, 480), runs: int = 2) -> float:
+        """Run a few passes on a blank frame so the first real frame is not slow; returns ms."""
+        frame = np.full((size[1], size[0], 3), 127, dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(max(1, runs)):
+            self.detect_raw(frame)
+        return (time.perf_counter() - start) * 1000.0
+
+
+class SsdDetector(FaceDetector):
+    """res10 SSD (Caffe) via cv2.dnn; the whole batch goes through one forward pass."""
+
+    name = 'ssd'
+    input_size = (300, 300)
+    mean = (104.0, 177.0, 123.0)
+
+    def __init__(self, prototxt: str = DEFAULT_SSD_PROTOTXT, model: str = DEFAULT_SSD_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        # CPU only: OpenCL FP16 never helped on the CPU-only servers and slows start-up
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def detect_raw_batch(self, images):
+        with stage_timer('resize'):
+            resized = [cv2.resize(image, self.input_size) for image in images]
+        with stage_timer('blob'):
+            blob = cv2.dnn.blobFromImages(resized, 1.0, self.input_size, self.mean)
+        with stage_timer('forward'):
+            self.net.setInput(blob)
+            detections = self.net.forward()
+
+        rows = detections.reshape(-1, 7)
+        rows = rows[rows[:, 2] > self.confidence_threshold]
+        # DetectionOutput rows carry the batch index in column 0
+        image_ids = rows[:, 0].astype(np.int32)
+        results = []
+        for idx, image in enumerate(images):
+            h, w = image.shape[:2]
+            sel = rows[image_ids == idx]
+            boxes = np.clip(sel[:, 3:7], 0.0, 1.0) * np.array([w, h, w, h], dtype=np.float32)
+            results.append((boxes.astype(np.float32), sel[:, 2].astype(np.float32)))
+        return results
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV FaceDetectorYN; frames wider than `max_width` are downscaled first."""
+
+    name = 'yunet'
+
+    def __init__(self, model: str = DEFAULT_YUNET_MODEL, max_width: int = 640,
+                 nms_threshold: float = 0.3, top_k: int = 5000, **kwargs):
+        super().__init__(**kwargs)
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            raise RuntimeError('this OpenCV build has no FaceDetectorYN (needs OpenCV >= 4.5.4)')
+        if not os.path.exists(model):
+            raise FileNotFoundError(f'YuNet model not found: {model}')
+        self.max_width = max(0, int(max_width))
+        self._size = (320, 320)
+        self.model = cv2.FaceDetectorYN.create(model, '', self._size, self.confidence_threshold,
+                                               nms_threshold, top_k,
+                                               cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU)
+
+    def detect_raw(self, image):
+        h, w = image.shape[:2]
+        scale = 1.0
+        if self.max_width > 0 and w > self.max_width:
+            scale = self.max_width / float(w)
+            with stage_timer('resize'):
+                image = cv2.resize(image, (self.max_width, max(1, int(round(h * scale)))),
+                                   interpolation=cv2.INTER_AREA)
+        size = (image.shape[1], image.shape[0])
+        if size != self._size:
+            self.model.setInputSize(size)
+            self._size = size
+        with stage_timer('forward'):
+            _, faces = self.model.detect(image)
+        if faces is None or len(faces) == 0:
+            return _EMPTY
+        # Rows: x, y, w, h, 5 landmarks (x, y), score
+        boxes = faces[:, 0:4].astype(np.float32) / scale
+        boxes[:, 2:4] += boxes[:, 0:2]
+        return boxes, faces[:, 14].astype(np.float32)
+
+
+class OnnxRuntimeDetector(FaceDetector):
+    """ONNX Runtime engine for UltraFace-style models (outputs: scores (1, K, 2), boxes (1, K, 4) in 0..1).
+
+    Works unchanged with an INT8 model produced by `python services/detectors.py quantize`.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model: str = DEFAULT_ONNX_MODEL, mean: float = 127.0, scale: float = 1.0 / 128.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError('onnxruntime is not installed (pip install onnxruntime)') from e
+        if not os.path.exists(model):
+            raise FileNotFoundError(f'ONNX model not found: {model}')
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads > 0:
+            opts.intra_op_num_threads = self.threads
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model, sess_options=opts, providers=['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # NCHW; a symbolic batch dimension means the whole batch runs in one call
+        self.batchable = not isinstance(inp.shape[0], int)
+        self.input_size = (int(inp.shape[3]), int(inp.shape[2]))
+        self.mean = mean
+        self.scale = scale
+        names = [o.name for o in self.session.get_outputs()]
+        self.output_names = [n for n in ('scores', 'boxes') if n in names] or names[:2]
+
+    def _preprocess(self, images) -> np.ndarray:
+        with stage_timer('resize'):
+            resized = [cv2.resize(image, self.input_size) for image in images]
+        with stage_timer('blob'):
+            return cv2.dnn.blobFromImages(resized, self.scale, self.input_size,
+                                          (self.mean, self.mean, self.mean), swapRB=True)
+
+    def detect_raw_batch(self, images):
+        if not self.batchable and len(images) > 1:
+            return [self.detect_raw_batch([image])[0] for image in images]
+        blob = self._preprocess(images)
+        with stage_timer('forward'):
+            scores, boxes = self.session.run(self.output_names, {self.input_name: blob})
+        results = []
+        for idx, image in enumerate(images):
+            h, w = image.shape[:2]
+            conf = scores[idx, :, 1]
+            keep = conf > self.confidence_threshold
+            b = np.clip(boxes[idx, keep], 0.0, 1.0) * np.array([w, h, w, h], dtype=np.float32)
+            results.append((b.astype(np.float32), conf[keep].astype(np.float32)))
+        return results
+
+
+BACKENDS = {
+    'ssd': SsdDetector,
+    'yunet': YuNetDetector,
+    'onnx': OnnxRuntimeDetector,
+}
+
+
+def _model_path(env_name: str, default: str) -> str:
+    """Model path from env; relative paths are resolved against backend/."""
+    path = os.environ.get(env_name) or default
+    return path if os.path.isabs(path) else os.path.join(_BACKEND_DIR, path)
+
+
+def _backend_kwargs(name: str) -> dict:
+    """Model paths and options per backend from env vars."""
+    if name == 'ssd':
+        return {'prototxt': _model_path('SSD_PROTOTXT', DEFAULT_SSD_PROTOTXT),
+                'model': _model_path('SSD_MODEL', DEFAULT_SSD_MODEL)}
+    if name == 'yunet':
+        return {'model': _model_path('YUNET_MODEL', DEFAULT_YUNET_MODEL),
+                'max_width': int(os.environ.get('YUNET_MAX_WIDTH', '640'))}
+    if name == 'onnx':
+        return {'model': _model_path('ONNX_MODEL', DEFAULT_ONNX_MODEL)}
+    return {}
+
+
+def onnxruntime_available() -> bool:
+    return importlib.util.find_spec('onnxruntime') is not None
+
+
+def create_detector(name: str | None = None, confidence_threshold: float = 0.5, threads: int | None = None,
+                    warmup: bool = True, verbose: bool = False, fallback: bool = True) -> FaceDetector:
+    """Build the backend selected by `name` (or DETECTOR, default 'ssd').
+
+    threads: DETECTOR_THREADS by default; 0 keeps the library default. For the
+    cv2-based backends this is OpenCV's process-wide thread count.
+    fallback: with 'onnx' selected but onnxruntime not installed (it is an
+    optional dependency), log it and use the OpenCV DNN 'ssd' backend instead
+    of failing; pass False to get the RuntimeError.
+    """
+    name = (name or os.environ.get('DETECTOR', 'ssd')).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"unknown detector '{name}' (expected one of {', '.join(BACKENDS)})")
+    if name == 'onnx' and fallback and not onnxruntime_available():
+        print("⚠️ DETECTOR=onnx but onnxruntime is not installed (pip install onnxruntime, "
+              "or the 'onnx' extra); falling back to the OpenCV DNN 'ssd' detector")
+        name = 'ssd'
+    if threads is None:
+        threads = int(os.environ.get('DETECTOR_THREADS', '0'))
+    if threads > 0 and name in ('ssd', 'yunet'):
+        cv2.setNumThreads(threads)
+    detector = BACKENDS[name](confidence_threshold=confidence_threshold, threads=threads, **_backend_kwargs(name))
+    if warmup:
+        ms = detector.warmup()
+        if verbose:
+            print(f"ℹ️ Detector '{name}' warmed up in {ms:.1f} ms")
+    return detector
+
+
+# --- Command line: compare backends / quantize an ONNX model ---
+def _load_frames(source: str | None, size: tuple[int, int], count: int) -> list[np.ndarray]:
+    if source:
+        if os.path.splitext(source)[1].lower() in ('.jpg', '.jpeg', '.png', '.bmp'):
+            img = cv2.imread(source)
+            if img is None:
+                raise SystemExit(f'✗ Failed to read image: {source}')
+            return [img]
+        cap = cv2.VideoCapture(source)
+        frames = []
+        while len(frames) < count:
+            ok, img = cap.read()
+            if not ok:
+                break
+            frames.append(img)
+        cap.release()
+        if not frames:
+            raise SystemExit(f'✗ Failed to read video: {source}')
+        return frames
+    # Synthetic noise frame: no faces, but the per-frame cost of every backend is still realistic
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)]
+
+
+def compare(names, frames: list[np.ndarray], count: int, threads: int | None) -> list[dict]:
+    results = []
+    for name in names:
+        entry = {'backend': name}
+        try:
+            start = time.perf_counter()
+            detector = create_detector(name, threads=threads, warmup=False, fallback=False)
+            entry['load_ms'] = round((time.perf_counter() - start) * 1000.0, 1)
+            entry['warmup_ms'] = round(detector.warmup(size=(frames[0].shape[1], frames[0].shape[0])), 1)
+        except Exception as e:
+            entry['error'] = str(e)
+            results.append(entry)
+            continue
+        times, faces = [], 0
+        for i in range(count):
+            frame = frames[i % len(frames)]
+            start = time.perf_counter()
+            boxes, _ = detector.detect_raw(frame)
+            times.append((time.perf_counter() - start) * 1000.0)
+            faces += len(boxes)
+        arr = np.asarray(times)
+        entry.update({'frames': count, 'mean_ms': round(float(arr.mean()), 2),
+                      'p50_ms': round(float(np.percentile(arr, 50)), 2),
+                      'p95_ms': round(float(np.percentile(arr, 95)), 2),
+                      'fps': round(1000.0 / float(arr.mean()), 1), 'raw_faces_per_frame': round(faces / count, 2)})
+        results.append(entry)
+    return results
+
+
+def quantize(src: str, dst: str):
+    """Write a dynamically quantized (INT8 weights) copy of an ONNX model."""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise SystemExit('✗ onnxruntime is not installed (pip install onnxruntime)') from e
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"✓ INT8 model written: {dst}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Face detector backends: compare latency or quantize a model')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_cmp = sub.add_parser('compare', help='Per-frame latency of each backend on this host')
+    p_cmp.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated backends to run')
+    p_cmp.add_argument('--size', default='1280x720', help='Synthetic frame size WxH (ignored with --source)')
+    p_cmp.add_argument('--source', help='Image or video file to use as input frames')
+    p_cmp.add_argument('--frames', type=int, default=50, help='Frames to time per backend')
+    p_cmp.add_argument('--threads', type=int, default=None, help='Thread count (default: DETECTOR_THREADS)')
+    p_q = sub.add_parser('quantize', help='Quantize an ONNX model to INT8 for the onnx backend')
+    p_q.add_argument('src')
+    p_q.add_argument('dst')
+    args = parser.parse_args(argv)
+
+    if args.command == 'quantize':
+        quantize(args.src, args.dst)
+        return 0
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    frames = _load_frames(args.source, (width, height), args.frames)
+    names = [n.strip() for n in args.backends.split(',') if n.strip()]
+    print(f"Comparing detectors on {frames[0].shape[1]}x{frames[0].shape[0]}, {args.frames} frames, "
+          f"cv2 threads={cv2.getNumThreads()}")
+    print(f"{'backend':<8} {'load ms':>9} {'warmup ms':>10} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'fps':>7}")
+    for r in compare(names, frames, max(1, args.frames), args.threads):
+        if 'error' in r:
+            print(f"{r['backend']:<8} ✗ {r['error']}")
+            continue
+        print(f"{r['backend']:<8} {r['load_ms']:>9} {r['warmup_ms']:>10} {r['mean_ms']:>9} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['fps']:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
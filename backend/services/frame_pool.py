@@ -0,0 +1,114 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from services.metrics import FRAMES_DROPPED
+
+"""
+frame_pool.py
+--------------
+Native-thread pool for processing uploaded frames in the Flask backends.
+Every worker thread loads its own face detector on its first frame, so one detector
+(cv2.dnn.Net, FaceDetectorYN, ONNX session) is never called concurrently. OpenCV releases the GIL during
+decode, inference, blur and encode, which lets throughput scale with cores.
+The queue in front of the workers is bounded: when uploads arrive faster than
+they can be processed, the oldest waiting frame is dropped instead of letting
+latency grow without limit.
+"""
+
+
+class FrameDropped(Exception):
+    """The frame waited in a full queue and was replaced by a newer one (or the pool shut down)."""
+
+
+class FrameProcessingPool:
+    """Run `process_fn(jpeg, own_detector=<worker's detector>)` on a fixed set of worker threads.
+
+    detector_factory: callable returning a new detector for each worker, or None
+    to let workers share whatever `process_fn` uses by default (e.g. the batcher).
+    A worker whose factory call fails reports the error on that frame and tries
+    again on its next one.
+    max_pending: frames allowed to wait for a worker (default: one per worker);
+    beyond that the oldest waiting frame fails with FrameDropped.
+    """
+
+    def __init__(self, process_fn, detector_factory=None, workers: int = 1, max_pending: int | None = None):
+        self.process_fn = process_fn
+        self.detector_factory = detector_factory
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending if max_pending is not None else self.workers))
+        self._pending: deque[tuple[bytes, Future]] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.running = 0
+        self.completed = 0
+        self.dropped = 0
+        self._threads = [threading.Thread(target=self._worker, name=f'frame-pool_{i}', daemon=True)
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending) + self.running
+
+    def _worker(self):
+        detector = None
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                jpeg, fut = self._pending.popleft()
+                self.running += 1
+            try:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if detector is None and self.detector_factory is not None:
+                        detector = self.detector_factory()
+                    fut.set_result(self.process_fn(jpeg, own_detector=detector))
+                except Exception as e:
+                    fut.set_exception(e)
+            finally:
+                with self._cond:
+                    self.running -= 1
+                    self.completed += 1
+
+    def submit(self, jpeg: bytes) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('FrameProcessingPool is shut down')
+            if len(self._pending) >= self.max_pending:
+                # Live video: the newest frame is worth more than the oldest one still waiting
+                _, oldest = self._pending.popleft()
+                if oldest.set_running_or_notify_cancel():
+                    oldest.set_exception(FrameDropped('frame pool queue full'))
+                self.dropped += 1
+                FRAMES_DROPPED.labels('frame_pool').inc()
+            self._pending.append((jpeg, fut))
+            self._cond.notify()
+        return fut
+
+    def process(self, jpeg: bytes, timeout: float | None = None) -> bytes:
+        """Blocking helper: process one frame on a worker and return the JPEG bytes."""
+        return self.submit(jpeg).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'workers': self.workers, 'in_flight': self.in_flight, 'pending': len(self._pending),
+                    'max_pending': self.max_pending, 'completed': self.completed, 'dropped': self.dropped}
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._closed = True
+            pending, self._pending = list(self._pending), deque()
+            self._cond.notify_all()
+        for _, fut in pending:
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(FrameDropped('frame pool shut down'))
+        if wait:
+            for t in self._threads:
+                t.join()
@@ -13,6 +13,14 @@ Intended for local experiments (e.g., webcam).
 Not optimized for production or server use.
 """
 
+# Shared anonymization engine (services/anonymizer.py)
+_BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+from services.anonymizer import Anonymizer
+
+anonymizer = Anonymizer()
+
 # --- DNN Model Configuration ---
 prototxt_path = "models/deploy.prototxt.txt"
 model_path = "models/res10_300x300_ssd_iter_140000.caffemodel"
@@ -40,7 +48,7 @@ frame_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
 fps = int(capture.get(cv2.CAP_PROP_FPS)) or 30
 
 # Blur type selection
-blur_type = 'gaussian'  # 'gaussian', 'mosaic', or 'none'
+blur_type = 'gaussian'  # 'gaussian', 'mosaic', 'solid', 'shuffle' or 'none'
 blur_enabled = True  # Toggle blur on/off
 
 # Video recording setting
@@ -71,30 +79,7 @@ else:
 
 print(f'Display enabled: {display_enabled}')
 
-# --- Helper Functions (Keep these as they are) ---
-def _oddize(n: int) -> int:
-    """Return an odd integer >= 3 based on n."""
-    n = max(3, int(n))
-    return n if (n % 2) == 1 else n + 1
-
-def apply_gaussian_blur(image: np.ndarray, kernel_factor: int = 3) -> np.ndarray:
-    """Apply Gaussian blur to image."""
-    h, w = image.shape[:2]
-    k = _oddize(max(3, min(h, w) // kernel_factor))
-    # Add check for kernel size validity
-    if k <= 0: return image # Return original if kernel is invalid
-    return cv2.GaussianBlur(image, (k, k), 0)
-
-def apply_mosaic_blur(image: np.ndarray, block_size: int = 10) -> np.ndarray:
-    """Apply mosaic (pixelated) blur to image."""
-    h, w = image.shape[:2]
-    # Ensure block_size is reasonable
-    block_size = max(1, block_size)
-    small_h, small_w = max(1, h // block_size), max(1, w // block_size)
-    temp = cv2.resize(image, (small_w, small_h), interpolation=cv2.INTER_LINEAR)
-    mosaic = cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
-    return mosaic
-
+# --- Helper Functions ---
 def start_recording():
     """Start video recording with timestamp filename."""
     global video_writer
@@ -163,24 +148,9 @@ while True:
 
             # Check if ROI is valid before blurring
             if face_roi.size > 0:
-                # Apply blur if enabled
+                # Apply blur if enabled (in place on the ROI view)
                 if blur_enabled:
-                    box_w = endX - startX # Width of the detected face box
-                    if blur_type == 'gaussian':
-                        # Use box width for kernel calculation
-                        k_factor = 3
-                        # Adjust kernel size calculation
-                        k = _oddize(max(3, box_w // k_factor))
-                        blurred = apply_gaussian_blur(face_roi, kernel_factor=k_factor) # Pass k_factor instead
-                    elif blur_type == 'mosaic':
-                        # Use box width for block size calculation
-                        mosaic_block_size = max(3, box_w // 15)
-                        blurred = apply_mosaic_blur(face_roi, block_size=mosaic_block_size)
-                    else: # 'none' or unknown
-                         blurred = face_roi # No blurring if type is 'none' or invalid
-
-                    # Put blurred face back into the frame
-                    img[startY:endY, startX:endX] = blurred
+                    anonymizer.anonymize_roi(face_roi, blur_type)
 
             # Optional: Draw bounding box (can comment out if not needed)
             # cv2.rectangle(img, (startX, startY), (endX, endY), (0, 255, 0), 2)
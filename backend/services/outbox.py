@@ -0,0 +1,253 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from services.metrics import CallbackGauge, Counter
+
+"""
+outbox.py
+----------
+Durable outbox for report metadata sent by pcd_main to the FastAPI
+/reports endpoint. stop_recording() only inserts a row into a local SQLite
+file (microseconds, survives restarts); a background sender drains it with
+retries and exponential backoff per report, so one report the API keeps
+rejecting does not hold back the ones queued after it. Every report carries an
+idempotency key, so a retry after a lost response never creates a second
+report. When several reports are pending they go out together through
+POST /reports/batch (falling back to one POST per report if the API does not
+have it, or after repeated failures of the whole batch).
+"""
+
+REPORTS_SENT = Counter('pcd_outbox_sent_total', 'Report notifications delivered from the outbox', ('result',))
+
+
+class ReportOutbox:
+    """SQLite-backed queue of report payloads plus the sender thread that drains it.
+
+    Tunable via env vars:
+     - OUTBOX_PATH (default backend/outbox.sqlite3)
+     - OUTBOX_BATCH_MAX (int, default 50): reports per request when there is a backlog
+     - OUTBOX_BACKOFF_MAX (float seconds, default 300): cap of the exponential retry delay
+     - OUTBOX_MAX_ATTEMPTS (int, default 0 = retry forever): then the row is kept as 'dead'
+     - OUTBOX_BATCH_FAILURES_MAX (int, default 3): consecutive failed batch requests after
+       which the reports are sent one by one, isolating a report that breaks the batch
+     - REPORT_API_KEY: sent as X-Report-Api-Key
+    """
+
+    def __init__(self, api_url: str, path: str | None = None, api_key: str | None = None,
+                 batch_max: int | None = None, timeout: float = 5.0):
+        self.api_url = api_url.rstrip('/')
+        self.path = path or os.environ.get('OUTBOX_PATH') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'outbox.sqlite3')
+        self.api_key = api_key if api_key is not None else os.environ.get('REPORT_API_KEY')
+        self.batch_max = max(1, batch_max or int(os.environ.get('OUTBOX_BATCH_MAX', '50')))
+        self.backoff_max = float(os.environ.get('OUTBOX_BACKOFF_MAX', '300'))
+        self.max_attempts = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '0'))
+        self.batch_failures_max = max(1, int(os.environ.get('OUTBOX_BATCH_FAILURES_MAX', '3')))
+        self.timeout = timeout
+        self._batch_supported = True
+        self._batch_failures = 0
+        self._failing = False
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._consecutive_failures = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS report_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                next_attempt REAL NOT NULL DEFAULT 0
+            )""")
+        if 'next_attempt' not in {r[1] for r in self._conn.execute('PRAGMA table_info(report_outbox)')}:
+            # Outbox file from an older version
+            self._conn.execute('ALTER TABLE report_outbox ADD COLUMN next_attempt REAL NOT NULL DEFAULT 0')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_outbox_status ON report_outbox (status, id)')
+
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, name='pcd-outbox', daemon=True)
+        self._thread.start()
+        CallbackGauge('pcd_outbox_pending', 'Report notifications waiting in the outbox',
+                      lambda: {(): self.pending()})
+
+    # --- Producer side ---
+    def enqueue(self, payload: dict) -> str:
+        """Persist a report payload and wake the sender; returns its idempotency key."""
+        key = payload.get('idempotency_key') or uuid.uuid4().hex
+        payload = {**payload, 'idempotency_key': key}
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO report_outbox (idempotency_key, payload, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(payload), now))
+        self._wake.set()
+        return key
+
+    def pending(self) -> int:
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM report_outbox WHERE status = 'pending'").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM report_outbox GROUP BY status').fetchall()
+        return dict(rows)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the sender; give it `timeout` seconds to deliver what is pending (the rest stays on disk)."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and self._consecutive_failures == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=max(0.1, deadline - time.monotonic()))
+        self._session.close()
+
+    # --- Sender thread ---
+    def _run(self):
+        while not self._closed:
+            self._wake.clear()  # before the query, so an enqueue racing with it is not missed
+            now = time.time()
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT id, payload, attempts FROM report_outbox WHERE status = 'pending' AND next_attempt <= ? "
+                    "ORDER BY id LIMIT ?", (now, self.batch_max)).fetchall()
+                due = None if rows else self._conn.execute(
+                    "SELECT MIN(next_attempt) FROM report_outbox WHERE status = 'pending'").fetchone()[0]
+            if not rows:
+                # Sleep until the next retry is due; a new report or close() wakes the sender earlier
+                self._wake.wait(timeout=60.0 if due is None else min(60.0, max(0.01, due - now)))
+                continue
+            try:
+                results = self._send([json.loads(r[1]) for r in rows])
+            except Exception as e:
+                results = [(False, True, str(e))] * len(rows)
+            if self._record(rows, results):
+                self._consecutive_failures = 0
+            else:
+                self._consecutive_failures += 1
+
+    def _headers(self) -> dict:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['X-Report-Api-Key'] = self.api_key
+        return headers
+
+    def _send(self, payloads: list[dict]) -> list[tuple[bool, bool, str | None]]:
+        """POST the payloads; returns (delivered, retry, error) per payload.
+
+        Only a report's own error marks it dead: a whole-request rejection of
+        /reports/batch is narrowed down first (413 -> halves, 400/422 -> one by
+        one), any other failure of the batch keeps every row retryable.
+        """
+        if len(payloads) > 1 and self._batch_supported:
+            resp = self._session.post(f"{self.api_url}/batch", json=payloads, headers=self._headers(),
+                                      timeout=self.timeout)
+            if resp.status_code in (404, 405):
+                print("ℹ️ Report API has no /reports/batch; sending reports one by one")
+                self._batch_supported = False
+            elif resp.ok:
+                items = resp.json().get('items', [])
+                out = []
+                for i in range(len(payloads)):
+                    item = items[i] if i < len(items) else {}
+                    if item.get('id') is not None:
+                        out.append((True, False, None))
+                    else:
+                        # Per-item errors are validation errors: retrying the same payload cannot fix them
+                        out.append((False, False, str(item.get('error'))))
+                self._batch_failures = 0
+                return out
+            elif resp.status_code == 413:
+                # Batch too large for the API (REPORT_BATCH_MAX or a proxy body limit): send it in
+                # halves and keep later batches at the smaller size
+                half = len(payloads) // 2
+                if half < self.batch_max:
+                    print(f"ℹ️ Report API rejected a batch of {len(payloads)} as too large; "
+                          f"batching at most {half} report(s)")
+                    self.batch_max = half
+                return self._send(payloads[:half]) + self._send(payloads[half:])
+            elif resp.status_code in (400, 422):
+                # The request as a whole was rejected, not necessarily every report in it:
+                # send them one by one so only the offending ones end up dead
+                pass
+            else:
+                # Could be an outage, or one report the API chokes on (e.g. a 500): after a few
+                # failures in a row, send this round one by one so such a report only fails itself
+                self._batch_failures += 1
+                if self._batch_failures < self.batch_failures_max:
+                    return [(False, True, self._describe(resp))] * len(payloads)
+                print(f"ℹ️ /reports/batch failed {self._batch_failures} times in a row "
+                      f"({self._describe(resp)}); sending these reports one by one")
+                self._batch_failures = 0
+        results = []
+        for payload in payloads:
+            resp = self._session.post(self.api_url, json=payload, headers=self._headers(), timeout=self.timeout)
+            if resp.ok:
+                results.append((True, False, None))
+            else:
+                results.append((False, self._retryable(resp.status_code), self._describe(resp)))
+        return results
+
+    @staticmethod
+    def _retryable(status_code: int) -> bool:
+        # For a single report: a rejected payload stays rejected; auth/config errors and outages
+        # are worth retrying
+        return status_code not in (400, 413, 422)
+
+    @staticmethod
+    def _describe(resp) -> str:
+        return f"status={resp.status_code}: {resp.text[:200]}"
+
+    def _record(self, rows, results) -> bool:
+        """Delete delivered rows, count attempts on the others; returns False if something must be retried.
+
+        A row to retry gets its own exponential backoff with jitter (1, 2, 4, ... seconds
+        up to OUTBOX_BACKOFF_MAX), so the rows behind it keep going out.
+        """
+        delivered = failed = 0
+        retry_error = None
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute('BEGIN')
+            for (row_id, _, attempts), (ok, retry, error) in zip(rows, results):
+                if ok:
+                    delivered += 1
+                    self._conn.execute('DELETE FROM report_outbox WHERE id = ?', (row_id,))
+                    continue
+                failed += 1
+                attempts += 1
+                dead = not retry or (self.max_attempts > 0 and attempts >= self.max_attempts)
+                delay = min(self.backoff_max, 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                self._conn.execute('UPDATE report_outbox SET status = ?, attempts = ?, last_error = ?, next_attempt = ? '
+                                   'WHERE id = ?', ('dead' if dead else 'pending', attempts, error, now + delay, row_id))
+                if dead:
+                    print(f"✗ Report notification dropped after {attempts} attempt(s): {error}")
+                elif retry_error is None:
+                    retry_error = error
+            self._conn.execute('COMMIT')
+        if delivered:
+            REPORTS_SENT.labels('sent').inc(delivered)
+            print(f"✓ Report metadata sent ({delivered} report(s))")
+            if self._failing:
+                print('✓ Report API reachable again, outbox draining')
+                self._failing = False
+        if failed:
+            REPORTS_SENT.labels('failed').inc(failed)
+        if retry_error is not None and not self._failing:
+            # Log once per outage; the rows stay in the outbox
+            print(f"✗ Failed to send report metadata, will retry: {retry_error}")
+            self._failing = True
+        return retry_error is None
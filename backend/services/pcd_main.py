@@ -4,11 +4,10 @@ import numpy as np
 from datetime import datetime
 import os
 import base64
-import requests
 import time
 import argparse
 import threading
-from collections import deque
+import queue
 
 """
 pcd_main.py
@@ -22,30 +21,213 @@ Includes robust error handling and logging.
 # --- DNN Model Configuration ---
 # Get the backend directory (parent of services directory)
 _BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-prototxt_path = os.path.join(_BACKEND_DIR, "models/deploy.prototxt.txt")
-model_path = os.path.join(_BACKEND_DIR, "models/res10_300x300_ssd_iter_140000.caffemodel")
+# Allow `python services/pcd_main.py` to import sibling modules as `services.*`
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+from services.anonymizer import Anonymizer, MODES as ANONYMIZE_MODES
+from services.detection import finish_boxes, merge_tile_boxes, tile_views
+from services.detectors import FaceDetector, create_detector
+from services.metrics import (CallbackGauge, FACES_DETECTED, FRAMES_DROPPED, FRAMES_IN, FRAMES_OUT,
+                              stage_timer, start_http_server)
+from services.pipeline import FramePipeline, END
+from services.tracking import FaceTracker
+
 confidence_threshold = 0.5  # Minimum probability to filter weak detections
+# Post-processing: margin around each face (fraction of box size) and NMS IoU threshold
+BOX_PAD = float(os.environ.get('BOX_PAD', '0.1'))
+NMS_THRESHOLD = float(os.environ.get('NMS_THRESHOLD', '0.3'))
+
+
+def load_detector(verbose: bool = False) -> FaceDetector:
+    """Create a fresh, warmed-up detector for the DETECTOR backend (parallel workers each need their own)."""
+    return create_detector(confidence_threshold=confidence_threshold, verbose=verbose)
+
+
+# --- Shared face detector, loaded lazily on first use (importing this module stays cheap)
+# DETECTOR=ssd (default, res10 Caffe) | yunet (FaceDetectorYN) | onnx (ONNX Runtime, e.g. INT8 model)
+_detector = None
+_detector_init_lock = threading.Lock()
+detector_load_seconds = None  # how long the first get_detector() took (startup report)
+
+
+def get_detector() -> FaceDetector:
+    """Return the shared detector, loading and warming it up on first use (thread-safe)."""
+    global _detector, detector_load_seconds
+    if _detector is None:
+        with _detector_init_lock:
+            if _detector is None:
+                started = time.perf_counter()
+                try:
+                    d = load_detector(verbose=True)
+                except (cv2.error, RuntimeError, FileNotFoundError, ValueError) as e:
+                    print(f"✗ Error loading face detector: {e}")
+                    print("Check DETECTOR and the model files in backend/models "
+                          "(ssd: 'deploy.prototxt.txt' and 'res10_300x300_ssd_iter_140000.caffemodel').")
+                    # don't sys.exit here; raise so the caller (Flask request, main) can handle it
+                    raise
+                detector_load_seconds = time.perf_counter() - started
+                print(f"✓ Face detector '{d.name}' loaded in {detector_load_seconds * 1000:.0f} ms")
+                if DETECT_TILED:
+                    print(f"✓ Tiled detection enabled (tile={DETECT_TILE_SIZE}px, overlap={DETECT_TILE_OVERLAP}, "
+                          f"max_tiles={DETECT_MAX_TILES})")
+                _detector = d
+    return _detector
+
+# --- Micro-batched detection for concurrent /upload_frame requests ---
+# DETECT_BATCH_MAX=1 (default) disables batching; each request runs its own forward pass.
+DETECT_BATCH_MAX = int(os.environ.get('DETECT_BATCH_MAX', '1'))
+DETECT_BATCH_WAIT_MS = float(os.environ.get('DETECT_BATCH_WAIT_MS', '5'))
+_batcher = None
+_batcher_lock = threading.Lock()
+_detector_lock = threading.Lock()
+
+
+def get_detection_batcher():
+    """Return the shared DetectionBatcher, or None when batching is disabled."""
+    global _batcher
+    if DETECT_BATCH_MAX <= 1:
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from services.batching import DetectionBatcher
+                _batcher = DetectionBatcher(get_detector(), max_batch=DETECT_BATCH_MAX, max_wait_ms=DETECT_BATCH_WAIT_MS)
+                print(f"✓ Detection batching enabled (max_batch={DETECT_BATCH_MAX}, max_wait={DETECT_BATCH_WAIT_MS}ms)")
+    return _batcher
+
+
+def _detect_raw(images: list[np.ndarray], own_detector: FaceDetector | None = None) -> list:
+    """Run the detector on a frame (or the tiles of one frame); returns raw (boxes, scores) per image.
+
+    own_detector: a detector used only by the calling thread (frame pool
+    workers, the capture pipeline), run without locking. Otherwise the images
+    (a frame or all of its tiles) go through the batcher when enabled, or
+    through the shared detector from get_detector().
+    """
+    if own_detector is not None:
+        return own_detector.detect_raw_batch(images)
+    batcher = get_detection_batcher()
+    if batcher is not None:
+        # The batcher's worker is the only caller of the shared detector: tiles are queued
+        # as separate frames (and may share a forward pass with other requests' frames)
+        futures = [batcher.submit(image) for image in images]
+        return [fut.result() for fut in futures]
+    shared = get_detector()
+    # the detector is shared between request threads; calls must not interleave
+    with _detector_lock:
+        return shared.detect_raw_batch(images)
+
+
+# --- Frame processing pool for the Flask backends ---
+# Each worker thread owns a detector; OpenCV releases the GIL so frames are processed in parallel.
+FRAME_POOL_WORKERS = int(os.environ.get('FRAME_POOL_WORKERS', str(os.cpu_count() or 1)))
+# Frames allowed to wait for a worker; beyond that the oldest waiting frame is dropped (0 = one per worker)
+FRAME_POOL_MAX_PENDING = int(os.environ.get('FRAME_POOL_MAX_PENDING', '0'))
+_frame_pool = None
+_frame_pool_lock = threading.Lock()
+
+
+def get_frame_pool():
+    """Return the shared FrameProcessingPool, creating it (and its per-thread detectors) on first use."""
+    global _frame_pool
+    if _frame_pool is None:
+        with _frame_pool_lock:
+            if _frame_pool is None:
+                from services.frame_pool import FrameProcessingPool
+                workers = max(1, FRAME_POOL_WORKERS)
+                if workers > 1 and int(os.environ.get('DETECTOR_THREADS', '0')) <= 0:
+                    # Avoid oversubscription: split OpenCV's internal threads between workers
+                    cv2.setNumThreads(max(1, (os.cpu_count() or 1) // workers))
+                # With batching enabled the workers share the batcher instead of owning a detector
+                factory = None if DETECT_BATCH_MAX > 1 else load_detector
+                _frame_pool = FrameProcessingPool(process_frame_bytes, detector_factory=factory, workers=workers,
+                                                  max_pending=FRAME_POOL_MAX_PENDING or None)
+                print(f"✓ Frame processing pool started (workers={workers}, max_pending={_frame_pool.max_pending})")
+    return _frame_pool
+
+
+# --- Recording previews (thumbnail + sprite sheet), generated in the background after a recording stops
+_thumbnail_worker = None
+_thumbnail_worker_lock = threading.Lock()
+
+
+def get_thumbnail_worker():
+    """Return the shared ThumbnailWorker, starting it on first use."""
+    global _thumbnail_worker
+    if _thumbnail_worker is None:
+        with _thumbnail_worker_lock:
+            if _thumbnail_worker is None:
+                from services.thumbnails import ThumbnailWorker
+                _thumbnail_worker = ThumbnailWorker()
+    return _thumbnail_worker
+
+
+def close_thumbnail_worker():
+    """Let queued previews finish and stop the worker (a later get_thumbnail_worker() starts a new one)."""
+    global _thumbnail_worker
+    with _thumbnail_worker_lock:
+        worker, _thumbnail_worker = _thumbnail_worker, None
+    if worker is not None:
+        worker.close()
+
+
+# --- Report notifications: durable SQLite outbox drained by a background sender (REPORT_API_URL)
+_report_outbox = None
+_report_outbox_lock = threading.Lock()
+
+
+def get_report_outbox():
+    """Return the shared ReportOutbox, or None when REPORT_API_URL is not set."""
+    global _report_outbox
+    api_url = os.environ.get('REPORT_API_URL')
+    if not api_url:
+        return None
+    if _report_outbox is None:
+        with _report_outbox_lock:
+            if _report_outbox is None:
+                from services.outbox import ReportOutbox
+                _report_outbox = ReportOutbox(api_url)
+                pending = _report_outbox.pending()
+                if pending:
+                    print(f"ℹ️ Report outbox: {pending} notification(s) pending from a previous run")
+    return _report_outbox
+
+
+# --- Tiled detection for high-resolution sources ---
+# DETECT_TILED=1 splits large frames into overlapping DETECT_TILE_SIZE px tiles (plus one
+# full-frame view) that go to the detector as one batch, so small/distant faces are not
+# lost when the frame is shrunk to the model input. DETECT_MAX_TILES caps the batch; tiles grow beyond it.
+DETECT_TILED = os.environ.get('DETECT_TILED', '0') in ('1', 'true', 'True')
+DETECT_TILE_SIZE = int(os.environ.get('DETECT_TILE_SIZE', '600'))
+DETECT_TILE_OVERLAP = float(os.environ.get('DETECT_TILE_OVERLAP', '0.2'))
+DETECT_MAX_TILES = int(os.environ.get('DETECT_MAX_TILES', '12'))
+
+
+def detect_frame_boxes(frame: np.ndarray, own_detector: FaceDetector | None = None) -> np.ndarray:
+    """Detect faces in a BGR frame and return padded, clipped, NMS-merged (N, 4) int boxes.
+
+    Uses the tiled path when DETECT_TILED is on and the frame is larger than one
+    tile (all tiles go to the detector as one batch); otherwise one pass on the
+    whole frame.
+    """
+    (h, w) = frame.shape[:2]
+    views = tile_views(w, h, DETECT_TILE_SIZE, DETECT_TILE_OVERLAP, DETECT_MAX_TILES) if DETECT_TILED else []
+    if len(views) <= 1:
+        boxes, scores = _detect_raw([frame], own_detector)[0]
+    else:
+        crops = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in views]
+        boxes, scores = merge_tile_boxes(_detect_raw(crops, own_detector), views, w, h)
+    boxes = finish_boxes(boxes, scores, w, h, BOX_PAD, NMS_THRESHOLD)
+    FACES_DETECTED.inc(len(boxes))
+    return boxes
+
+
+# --- Anonymization (shared by the capture pipeline and process_frame_bytes) ---
+# ANONYMIZE_MODE applies to frames processed for the Flask backends; main() uses BLUR_TYPE.
+ANONYMIZE_MODE = os.environ.get('ANONYMIZE_MODE', 'gaussian').lower()
+anonymizer = Anonymizer(mode=ANONYMIZE_MODE if ANONYMIZE_MODE in ANONYMIZE_MODES else 'gaussian')
 
-# --- Load the DNN Model (kept at module import so process_frame_base64 dapat digunakan)
-try:
-    net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
-    # Try to use OpenCL FP16 if available for speed; fallback to CPU
-    try:
-        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-        try:
-            net.setPreferableTarget(cv2.dnn.DNN_TARGET_OPENCL_FP16)
-            print("✓ DNN target: OpenCL FP16")
-        except Exception:
-            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-            print("ℹ️ DNN target: CPU")
-    except Exception:
-        pass
-    print("✓ DNN face detection model loaded successfully.")
-except cv2.error as e:
-    print(f"✗ Error loading DNN model: {e}")
-    print("Make sure 'deploy.prototxt.txt' and 'res10_300x300_ssd_iter_140000.caffemodel' exist.")
-    # don't sys.exit here; raise so importing app can handle it if needed
-    raise
 
 # --- Command line args (allow using file/video as source) ---
 def _parse_args(argv=None):
@@ -53,6 +235,16 @@ def _parse_args(argv=None):
     parser.add_argument('--source', '-s', help='Path to image or video file to use instead of webcam')
     parser.add_argument('--device', '-d', help='Camera device index (0,1,...) or path (/dev/video0). Overrides default camera when no --source provided')
     parser.add_argument('--no-upload', action='store_true', help="Don't send frames to BACKEND_URL (for local testing)")
+    parser.add_argument('--record', action='store_true', help='Start recording right away (e.g. headless capture)')
+    # Offline batch mode: re-anonymize whole video files on all cores instead of the live loop
+    parser.add_argument('--batch', nargs='+', metavar='VIDEO', help='Anonymize these video files offline (process pool) and exit')
+    parser.add_argument('--output-dir', default=os.path.join(_BACKEND_DIR, 'recordings', 'anonymized'),
+                        help='Batch mode: directory for <name>_anon.mp4 outputs')
+    parser.add_argument('--workers', type=int, default=None, help='Batch mode: worker processes (default: CPU count)')
+    parser.add_argument('--chunk-frames', type=int, default=None,
+                        help='Batch mode: frames per chunk (default: BATCH_CHUNK_FRAMES or 600)')
+    parser.add_argument('--mode', choices=ANONYMIZE_MODES, default=anonymizer.mode,
+                        help='Batch mode: anonymization mode (default: ANONYMIZE_MODE)')
     return parser.parse_args(argv)
 
 
@@ -62,19 +254,23 @@ def main(argv=None):
     argv: list or None. If None, defaults to sys.argv[1:]
     """
     args = _parse_args(argv)
+    if args.batch:
+        from services.batch_anonymize import run_batch
+        return run_batch(args.batch, args.output_dir, workers=args.workers, chunk_frames=args.chunk_frames,
+                         mode=args.mode)
 
     # --- Helper utilities (local to main) ---
-    # These are defined here so they can access main's local state (video_writer, etc.)
-    video_writer = None
+    # These are defined here so they can access main's local state (recorder, etc.)
+    recorder = None
     recording = False
     current_recording_path = None
     recording_started_at = None
     output_dir = os.path.join(_BACKEND_DIR, 'recordings')
 
     def _notify_report_backend(file_path: str | None, started_at: datetime | None, ended_at: datetime | None):
-        """Send metadata about a completed recording to FastAPI reports endpoint."""
-        api_url = os.environ.get('REPORT_API_URL')
-        if not api_url or not file_path:
+        """Queue metadata about a completed recording for the FastAPI reports endpoint (sent in the background)."""
+        outbox = get_report_outbox()
+        if outbox is None or not file_path:
             return
 
         try:
@@ -88,88 +284,43 @@ def main(argv=None):
             }
             if started_at and ended_at and ended_at >= started_at:
                 payload['duration_seconds'] = int((ended_at - started_at).total_seconds())
-
-            headers = {'Content-Type': 'application/json'}
-            api_key = os.environ.get('REPORT_API_KEY')
-            if api_key:
-                headers['X-Report-Api-Key'] = api_key
-
-            resp = requests.post(api_url.rstrip('/'), json=payload, headers=headers, timeout=5)
-            if resp.ok:
-                try:
-                    resp_payload = resp.json()
-                except ValueError:
-                    resp_payload = {}
-                print(f"✓ Report metadata sent (id={resp_payload.get('id')})")
-            else:
-                print(f"✗ Failed to send report metadata (status={resp.status_code}): {resp.text}")
+            # Durable write only; the outbox sender retries until the API has it (never blocks capture)
+            key = outbox.enqueue(payload)
+            print(f"✓ Report metadata queued (key={key})")
         except Exception as exc:
-            print(f"✗ Exception sending report metadata: {exc}")
-
-    def _oddize(n: int) -> int:
-        """Return an odd integer >= 3 based on n."""
-        n = max(3, int(n))
-        return n if (n % 2) == 1 else n + 1
-
-    def apply_gaussian_blur(image: np.ndarray, kernel_factor: int = 3) -> np.ndarray:
-        """Apply Gaussian blur to an image using a kernel derived from image size."""
-        if image is None or image.size == 0:
-            return image
-        h, w = image.shape[:2]
-        try:
-            kf = max(1, int(kernel_factor))
-        except Exception:
-            kf = 3
-        k = _oddize(max(3, min(h, w) // kf))
-        k = min(k, max(3, min(h, w) if min(h, w) % 2 == 1 else min(h, w) - 1))
-        if k <= 1:
-            return image
-        return cv2.GaussianBlur(image, (k, k), 0)
-
-    def apply_mosaic_blur(image: np.ndarray, block_size: int = 10) -> np.ndarray:
-        """Apply mosaic (pixelated) blur to image."""
-        h, w = image.shape[:2]
-        block_size = max(1, block_size)
-        small_h, small_w = max(1, h // block_size), max(1, w // block_size)
-        temp = cv2.resize(image, (small_w, small_h), interpolation=cv2.INTER_LINEAR)
-        mosaic = cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
-        return mosaic
+            print(f"✗ Exception queuing report metadata: {exc}")
 
     def start_recording():
-        nonlocal video_writer, recording, current_recording_path, recording_started_at
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        filename = os.path.join(output_dir, f'recording_{timestamp}.mp4')
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        nonlocal recorder, recording, current_recording_path, recording_started_at
+        from services.recorder import SegmentedRecorder
         try:
-            vw = cv2.VideoWriter(filename, fourcc, fps, (frame_width, frame_height))
-            if vw.isOpened():
-                video_writer = vw
-                current_recording_path = filename
-                recording_started_at = datetime.utcnow()
-                print(f"✓ Recording started: {filename}")
-                return True
-            else:
-                print("✗ Failed to start recording")
-                video_writer = None
-                return False
+            # Frames go to a writer thread that rotates time-based segments (RECORD_SEGMENT_SECONDS)
+            rec = SegmentedRecorder(output_dir, fps, (frame_width, frame_height)).start()
         except Exception as e:
             print(f"✗ Exception starting recording: {e}")
-            video_writer = None
+            recorder = None
             return False
+        recorder = rec
+        current_recording_path = rec.manifest_path
+        recording_started_at = rec.started_at
+        print(f"✓ Recording started: {rec.directory} (segments of {rec.segment_seconds:g}s)")
+        return True
 
     def stop_recording():
-        nonlocal video_writer, recording, current_recording_path, recording_started_at
+        nonlocal recorder, recording, current_recording_path, recording_started_at
         finished_at = datetime.utcnow()
-        if video_writer is not None:
+        if recorder is not None:
             try:
-                video_writer.release()
-            except Exception:
-                pass
-            video_writer = None
-            print("✓ Recording stopped")
+                manifest = recorder.close()
+                print(f"✓ Recording stopped: {len(manifest['segments'])} segment(s), "
+                      f"{manifest['frames_written']} frames written, {manifest['frames_dropped']} dropped")
+                # Previews are built once the last segment is streamable (its frames are final)
+                get_thumbnail_worker().submit(recorder.manifest_path, wait_for=recorder.wait_post_processed)
+            except Exception as e:
+                print(f"✗ Exception stopping recording: {e}")
+            recorder = None
         if current_recording_path:
+            # The report points at the manifest, which lists every segment of the recording
             rel_path = os.path.relpath(current_recording_path, _BACKEND_DIR)
         else:
             rel_path = None
@@ -177,39 +328,6 @@ def main(argv=None):
         current_recording_path = None
         recording_started_at = None
 
-    def send_frame_to_backend(img: np.ndarray):
-        """Encode frame as JPEG base64 and POST to backend /upload_frame if BACKEND_URL is set.
-
-        Tunable via env vars:
-         - UPLOAD_MAX_WIDTH (int, default 640): resize width while keeping aspect ratio
-         - UPLOAD_JPEG_QUALITY (int, default 60): JPEG quality
-        """
-        backend_url = os.environ.get('BACKEND_URL')
-        if not backend_url:
-            return False
-        try:
-            up_max_w = int(os.environ.get('UPLOAD_MAX_WIDTH', '640'))
-            jpg_q = int(os.environ.get('UPLOAD_JPEG_QUALITY', '60'))
-
-            frame_to_send = img
-            # Resize to reduce bandwidth if wider than target
-            try:
-                if up_max_w > 0 and frame_to_send.shape[1] > up_max_w:
-                    ratio = up_max_w / float(frame_to_send.shape[1])
-                    new_h = max(1, int(frame_to_send.shape[0] * ratio))
-                    frame_to_send = cv2.resize(frame_to_send, (up_max_w, new_h), interpolation=cv2.INTER_AREA)
-            except Exception:
-                pass
-
-            _, buffer = cv2.imencode('.jpg', frame_to_send, [int(cv2.IMWRITE_JPEG_QUALITY), max(30, min(95, jpg_q))])
-            jpg_b64 = base64.b64encode(buffer).decode('ascii')
-            payload = {'image': jpg_b64}
-            resp = requests.post(f"{backend_url.rstrip('/')}/upload_frame", json=payload, timeout=2.0)
-            return resp.ok
-        except Exception as e:
-            print(f"✗ Failed to send frame to backend: {e}")
-            return False
-
     # --- Camera and Settings ---
     capture = None
     image_source = None
@@ -286,12 +404,15 @@ def main(argv=None):
         fps = int(capture.get(cv2.CAP_PROP_FPS)) or 30
 
     # Blur type selection (env override: BLUR_TYPE)
-    blur_type = os.environ.get('BLUR_TYPE', 'mosaic').lower()  # 'gaussian', 'mosaic', or 'none'
+    blur_type = os.environ.get('BLUR_TYPE', 'mosaic').lower()  # 'gaussian', 'mosaic', 'solid', 'shuffle' or 'none'
+    if blur_type not in ANONYMIZE_MODES:
+        print(f"⚠️ Unknown BLUR_TYPE '{blur_type}', using mosaic")
+        blur_type = 'mosaic'
     blur_enabled = True  # Toggle blur on/off
 
     # Video recording setting
     recording = False  # Toggle video recording
-    video_writer = None
+    recorder = None
 
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
@@ -318,109 +439,152 @@ def main(argv=None):
     # Initialize window name for display
     WINDOW_NAME = 'Face Blur Detection (DNN) - Press Q to Quit'
 
-    # Frame queue for matplotlib display (thread-safe)
-    # --- Main Loop ---
-    loop_count = 0
+    # --- Staged pipeline: capture → detect → blur → (main: record/display) → uploader ---
+    # Each stage runs in its own thread; live sources use drop-oldest queues so the
+    # camera never waits on the DNN or the network. File sources keep every frame.
     upload_every_n = int(os.environ.get('UPLOAD_EVERY_N', '1'))  # send every Nth frame
     # Reuse detections between frames to reduce DNN calls (persist across frames)
     detect_every_n = int(os.environ.get('DETECT_EVERY_N', '2'))
     max_box_age = int(os.environ.get('MAX_BOX_AGE', '5'))
-    last_boxes = []  # list of (startX, startY, endX, endY)
-    last_boxes_age = 0
-    while True:
+    queue_size = max(1, int(os.environ.get('PIPELINE_QUEUE_SIZE', '2')))
+    stats_every = float(os.environ.get('PIPELINE_STATS_SECONDS', '0'))  # 0 = no periodic stats
+    live_source = image_source is None and not args.source
+
+    # Load the model before the pipeline starts so the first frames are not delayed by it
+    detector = get_detector()
+
+    pipeline = FramePipeline()
+    detect_q = pipeline.add_queue('detect', queue_size, drop_oldest=live_source,
+                                  on_drop=FRAMES_DROPPED.labels('detect').inc)
+    blur_q = pipeline.add_queue('blur', queue_size, drop_oldest=live_source,
+                                on_drop=FRAMES_DROPPED.labels('blur').inc)
+    output_q = pipeline.add_queue('output', queue_size, drop_oldest=live_source,
+                                  on_drop=FRAMES_DROPPED.labels('output').inc)
+    CallbackGauge('pcd_pipeline_queue_depth', 'Frames waiting in front of each pipeline stage',
+                  lambda: {(name,): depth for name, depth in pipeline.queue_depths().items()}, ('queue',))
+
+    # Optional Prometheus endpoint for this capture process
+    metrics_port = int(os.environ.get('METRICS_PORT', '0'))
+    if metrics_port > 0:
+        try:
+            start_http_server(metrics_port)
+            print(f"✓ Metrics available on http://0.0.0.0:{metrics_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Could not start metrics server on port {metrics_port}: {e}")
+    # Start draining report notifications left over from a previous run right away
+    get_report_outbox()
+
+    frame_index = 0
+
+    def capture_stage():
+        nonlocal frame_index
         if image_source is not None:
+            # Still image: pace the loop instead of spinning
+            time.sleep(0.005)
             img = image_source.copy()
             success = True
         else:
-            success, img = capture.read()
+            with stage_timer('capture_read'):
+                success, img = capture.read()
         if not success or img is None:
             print("Warning: failed to read frame. Exiting.")
-            break
-
+            return END
+        FRAMES_IN.inc()
         # Apply mirror/flip (always enabled)
         img = cv2.flip(img, 1)
+        idx = frame_index
+        frame_index += 1
+        return idx, img
 
-        # --- DNN Face Detection (every N frames) ---
-        (h, w) = img.shape[:2]  # Frame height and width
-
-        def _blur_boxes_on_img(boxes):
-            nonlocal img
-            if not blur_enabled or blur_type == 'none':
-                return
-            for (startX, startY, endX, endY) in boxes:
-                # ensure bounds
-                sx = max(0, min(startX, w-1)); ex = max(0, min(endX, w))
-                sy = max(0, min(startY, h-1)); ey = max(0, min(endY, h))
-                if ex <= sx or ey <= sy:
-                    continue
-                face_roi = img[sy:ey, sx:ex]
-                if face_roi.size <= 0:
-                    continue
-                if blur_type == 'gaussian':
-                    box_w = ex - sx
-                    k_factor = 3
-                    _ = _oddize(max(3, box_w // k_factor))
-                    blurred = apply_gaussian_blur(face_roi, kernel_factor=k_factor)
-                elif blur_type == 'mosaic':
-                    mosaic_block_size = max(3, (ex - sx) // 15)
-                    blurred = apply_mosaic_blur(face_roi, block_size=mosaic_block_size)
-                else:
-                    blurred = face_roi
-                img[sy:ey, sx:ex] = blurred
-
-        run_detection = (detect_every_n <= 1) or ((loop_count % detect_every_n) == 0)
+    last_boxes = []  # (N, 4) boxes as (startX, startY, endX, endY)
+    last_boxes_age = 0
+    # Between detections, follow faces with optical flow (TRACKER=none replays last_boxes instead)
+    tracker = None
+    if os.environ.get('TRACKER', 'flow').lower() != 'none':
+        tracker = FaceTracker(max_age=max(max_box_age, 2 * detect_every_n))
+
+    def detect_stage(item):
+        nonlocal last_boxes, last_boxes_age
+        idx, img = item
+        run_detection = (detect_every_n <= 1) or ((idx % detect_every_n) == 0)
         if run_detection:
-            blob = cv2.dnn.blobFromImage(cv2.resize(img, (300, 300)), 1.0,
-                (300, 300), (104.0, 177.0, 123.0))
-            net.setInput(blob)
-            detections = net.forward()
-
-            current_boxes = []
-            for i in range(0, detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > confidence_threshold:
-                    box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                    (startX, startY, endX, endY) = box.astype("int")
-                    startX = max(0, startX)
-                    startY = max(0, startY)
-                    endX = min(w, endX)
-                    endY = min(h, endY)
-                    if endX > startX and endY > startY:
-                        current_boxes.append((startX, startY, endX, endY))
+            # The detect stage is the only user of the detector in this process
+            current_boxes = detect_frame_boxes(img, own_detector=detector)
 
+            if tracker is not None:
+                # Tracks the detector missed this time are kept (and blurred) until they age out
+                with stage_timer('track'):
+                    current_boxes = tracker.update(img, current_boxes)
             last_boxes = current_boxes
             last_boxes_age = 0
-            _blur_boxes_on_img(last_boxes)
-            face_found = len(current_boxes) > 0
-        else:
-            # reuse previous boxes for a few frames
-            if last_boxes and last_boxes_age < max_box_age:
-                _blur_boxes_on_img(last_boxes)
-                last_boxes_age += 1
-                face_found = True
-            else:
-                face_found = False
+            return idx, img, current_boxes, len(current_boxes) > 0
+        if tracker is not None:
+            with stage_timer('track'):
+                tracked = tracker.track(img)
+            return idx, img, tracked, len(tracked) > 0
+        # reuse previous boxes for a few frames
+        if len(last_boxes) and last_boxes_age < max_box_age:
+            last_boxes_age += 1
+            return idx, img, last_boxes, True
+        return idx, img, [], False
+
+    def blur_stage(item):
+        with stage_timer('blur'):
+            return _blur_frame(item)
+
+    def _blur_frame(item):
+        idx, img, boxes, face_found = item
+        if blur_enabled:
+            # All boxes in one call, written in place into the frame
+            anonymizer.apply(img, boxes, blur_type)
 
         # Display "No Face Found" if applicable
         if not face_found:
             cv2.putText(img, 'No Face Found!', (20, 50), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 255), 2)
+        return idx, img
+
+    pipeline.add_stage('capture', capture_stage, None, [detect_q])
+    pipeline.add_stage('detect', detect_stage, detect_q, [blur_q])
+    pipeline.add_stage('blur', blur_stage, blur_q, [output_q])
+    # Uploads are best-effort and run on their own thread (latest frame wins)
+    uploader = None
+    if not args.no_upload and os.environ.get('BACKEND_URL'):
+        from services.uploader import FrameUploader
+        uploader = FrameUploader(os.environ['BACKEND_URL'])
+    pipeline.start()
+    if args.record:
+        recording = start_recording()
+
+    # --- Main Loop (record, overlay, display, keyboard) ---
+    loop_count = 0
+    stats_started = time.monotonic()
+    stats_frames = 0
+    while True:
+        try:
+            item = output_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        except KeyboardInterrupt:
+            break
+        if item is END:
+            break
+        idx, img = item
+        FRAMES_OUT.inc()
 
-        # Write frame to video file if recording
-        if recording and video_writer is not None:
-            video_writer.write(img)
+        # Hand frame to the recording writer thread (never waits on the disk);
+        # it gets a copy because the status overlay below draws on img
+        if recording and recorder is not None:
+            recorder.submit(img.copy())
 
         # Display current status
         blur_status = 'OFF' if not blur_enabled else blur_type.upper()
         recording_status = 'REC' if recording else 'OFF'
-        mode_text = f'Blur: {blur_status} | Rec: {recording_status} | [G]aussian [M]osaic [B]lur ON/OFF [R]ec ON/OFF [Q]uit'
+        mode_text = f'Blur: {blur_status} | Rec: {recording_status} | [G]aussian [M]osaic [S]olid [P]ixel shuffle [B]lur ON/OFF [R]ec ON/OFF [Q]uit'
         cv2.putText(img, mode_text, (10, img.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
-        # Best-effort: send frame to backend with downsampling to reduce bandwidth/latency
-        try:
-            if not args.no_upload and (upload_every_n <= 1 or (loop_count % upload_every_n) == 0):
-                send_frame_to_backend(img)
-        except Exception:
-            pass
+        # Best-effort: hand frame to the uploader (never blocks this loop)
+        if uploader is not None and (upload_every_n <= 1 or (idx % upload_every_n) == 0):
+            uploader.submit(img)
 
         if display_enabled and use_cv2_display:
             try:
@@ -442,6 +606,14 @@ def main(argv=None):
                 blur_type = 'mosaic'
                 blur_enabled = True
                 print("✓ Switched to Mosaic Blur mode (ENABLED)")
+            elif key == ord('s'):
+                blur_type = 'solid'
+                blur_enabled = True
+                print("✓ Switched to Solid Fill mode (ENABLED)")
+            elif key == ord('p'):
+                blur_type = 'shuffle'
+                blur_enabled = True
+                print("✓ Switched to Pixel Shuffle mode (ENABLED)")
             elif key == ord('b'):
                 blur_enabled = not blur_enabled
                 status = "ENABLED" if blur_enabled else "DISABLED"
@@ -453,18 +625,31 @@ def main(argv=None):
                         recording = False  # Revert state if failed
                 else:
                     stop_recording()
-        else:
-            # Headless mode: sleep ringan dan lanjut loop
-            try:
-                time.sleep(0.005)
-            except KeyboardInterrupt:
-                break
 
         loop_count += 1
+        stats_frames += 1
+        if stats_every > 0 and (time.monotonic() - stats_started) >= stats_every:
+            elapsed = time.monotonic() - stats_started
+            upload_info = f" | upload {uploader.stats()}" if uploader is not None else ''
+            record_info = f" | record {recorder.stats()}" if recorder is not None else ''
+            print(f"ℹ️ Pipeline: {stats_frames / elapsed:.1f} fps | queue depth {pipeline.queue_depths()}"
+                  f"{upload_info}{record_info}")
+            stats_started = time.monotonic()
+            stats_frames = 0
+
+    pipeline.stop()
+    if uploader is not None:
+        uploader.close()
+        up = uploader.stats()
+        print(f"ℹ️ Frame upload: sent={up['sent']} dropped={up['dropped']} failed={up['failed']}")
 
     # --- Cleanup ---
     if recording:
         stop_recording()
+    close_thumbnail_worker()
+    if _report_outbox is not None:
+        # Short grace period to deliver; undelivered reports stay in the outbox for the next run
+        _report_outbox.close(timeout=float(os.environ.get('OUTBOX_CLOSE_SECONDS', '3')))
 
     # Release capture if it exists
     try:
@@ -487,65 +672,49 @@ def main(argv=None):
 
 
 # === Modular function for backend integration ===
-def process_frame_base64(img_b64: str) -> str:
+def process_frame_bytes(jpeg: bytes, own_detector: FaceDetector | None = None) -> bytes:
     """
-    Receive base64 image → decode → blur face → return base64 image (processed)
-    Used by Flask backend when receiving /upload_frame.
+    Receive JPEG bytes → decode → blur face → return JPEG bytes (processed)
+    Used by Flask backend for binary /upload_frame bodies and Socket.IO uploads.
+    own_detector: per-thread detector when called from the frame processing pool.
     """
-    import base64
-    import cv2
-    import numpy as np
-
     try:
-        # Decode base64 → numpy array
-        img_data = base64.b64decode(img_b64)
-        np_arr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        np_arr = np.frombuffer(jpeg, np.uint8)
+        with stage_timer('jpeg_decode'):
+            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
 
         if frame is None:
             print("✗ Invalid frame data received")
-            return img_b64
+            return jpeg
 
         # --- DNN Face Detection ---
-        (h, w) = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(
-            cv2.resize(frame, (300, 300)), 1.0,
-            (300, 300), (104.0, 177.0, 123.0)
-        )
-
-        net.setInput(blob)
-        detections = net.forward()
-
-        # Loop over detections
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-
-            if confidence > confidence_threshold:
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (x1, y1, x2, y2) = box.astype("int")
-
-                # Validasi posisi agar tetap di dalam frame
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(w, x2), min(h, y2)
-
-                # Potong area wajah
-                face = frame[y1:y2, x1:x2]
-                if face.size > 0:
-                    # Terapkan Gaussian blur ke area wajah
-                    face = cv2.GaussianBlur(face, (51, 51), 30)
-                    frame[y1:y2, x1:x2] = face
-
-        # Encode kembali hasil frame ke base64
-        _, buffer = cv2.imencode('.jpg', frame)
-        processed_b64 = base64.b64encode(buffer).decode('ascii')
-        return processed_b64
+        # Kotak sudah di-clip ke dalam frame dan bebas duplikat (NMS)
+        boxes = detect_frame_boxes(frame, own_detector)
+        with stage_timer('blur'):
+            # Anonimisasi semua wajah langsung di frame (ANONYMIZE_MODE)
+            anonymizer.apply(frame, boxes)
+
+        # Encode kembali hasil frame ke JPEG
+        with stage_timer('jpeg_encode'):
+            _, buffer = cv2.imencode('.jpg', frame)
+        return buffer.tobytes()
 
     except Exception as e:
         print(f"✗ Error processing frame: {e}")
-        return img_b64  # fallback ke gambar asli bila error
+        return jpeg  # fallback ke gambar asli bila error
 
 
-print("✓ Module ready: pcd_main loaded")
+def process_frame_base64(img_b64: str) -> str:
+    """
+    Receive base64 image → decode → blur face → return base64 image (processed)
+    Kept for clients that still POST JSON {"image": "<base64>"}.
+    """
+    try:
+        img_data = base64.b64decode(img_b64)
+    except Exception as e:
+        print(f"✗ Error processing frame: {e}")
+        return img_b64
+    return base64.b64encode(process_frame_bytes(img_data)).decode('ascii')
 
 
 if __name__ == '__main__':
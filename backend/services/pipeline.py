@@ -0,0 +1,158 @@
+import queue
+import threading
+from collections import deque
+
+"""
+pipeline.py
+------------
+Small building blocks for the staged capture pipeline used by pcd_main.main().
+Every stage runs in its own worker thread and talks to the next one through a
+bounded queue. Live sources use drop-oldest queues so a slow stage (DNN,
+network) never stalls the camera: the stale frame is discarded instead.
+"""
+
+
+class EndOfStream:
+    """Sentinel pushed through the queues when the source is exhausted or stopped."""
+
+
+END = EndOfStream()
+
+
+class DropOldestQueue:
+    """Bounded FIFO; when full, `put` evicts the oldest item (or blocks if drop_oldest=False)."""
+
+    def __init__(self, maxsize: int = 2, name: str = 'queue', drop_oldest: bool = True, on_drop=None):
+        self.name = name
+        self.on_drop = on_drop  # optional callable, invoked once per evicted item
+        self.maxsize = max(1, int(maxsize))
+        self.drop_oldest = drop_oldest
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.put_count = 0
+
+    def put(self, item, timeout: float | None = None) -> bool:
+        """Add an item. Returns False if the queue was closed or a blocking put timed out."""
+        with self._cond:
+            if not self.drop_oldest:
+                # END may overshoot maxsize by one so shutdown never blocks
+                if item is not END and not self._cond.wait_for(lambda: len(self._items) < self.maxsize, timeout):
+                    return False
+            elif len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop()
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: float | None = None):
+        """Remove and return the oldest item; raises queue.Empty on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) > 0, timeout):
+                raise queue.Empty
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+
+class Stage(threading.Thread):
+    """Worker thread: `fn(item)` for every item from `inq`, result fanned out to `outqs`.
+
+    `fn` may return None to swallow an item. A source stage has `inq=None`
+    and `fn()` is called repeatedly; it returns END when the source is done.
+    """
+
+    def __init__(self, name: str, fn, inq: DropOldestQueue | None, outqs: list[DropOldestQueue],
+                 stop_event: threading.Event):
+        super().__init__(name=f'pcd-{name}', daemon=True)
+        self.stage_name = name
+        self.fn = fn
+        self.inq = inq
+        self.outqs = outqs
+        self.stop_event = stop_event
+        self.processed = 0
+        self.errors = 0
+
+    def _emit(self, item):
+        for q in self.outqs:
+            # Blocking queues must still notice a stop request
+            while not q.put(item, timeout=0.1):
+                if self.stop_event.is_set():
+                    return
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.inq is None:
+                item = None
+            else:
+                try:
+                    item = self.inq.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is END:
+                    break
+            try:
+                result = self.fn() if self.inq is None else self.fn(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"✗ Pipeline stage '{self.stage_name}' error: {e}")
+                continue
+            if result is END:
+                break
+            self.processed += 1
+            if result is not None:
+                self._emit(result)
+        self._emit(END)
+
+
+class FramePipeline:
+    """Owns the queues and stage threads of one capture session."""
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.queues: dict[str, DropOldestQueue] = {}
+        self.stages: list[Stage] = []
+
+    def add_queue(self, name: str, maxsize: int = 2, drop_oldest: bool = True, on_drop=None) -> DropOldestQueue:
+        q = DropOldestQueue(maxsize=maxsize, name=name, drop_oldest=drop_oldest, on_drop=on_drop)
+        self.queues[name] = q
+        return q
+
+    def add_stage(self, name: str, fn, inq: DropOldestQueue | None, outqs: list[DropOldestQueue]) -> Stage:
+        stage = Stage(name, fn, inq, outqs, self.stop_event)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout: float = 2.0):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join(timeout=timeout)
+
+    def queue_depths(self) -> dict[str, int]:
+        """Current number of items waiting in front of each stage."""
+        return {name: q.qsize() for name, q in self.queues.items()}
+
+    def stats(self) -> dict:
+        return {
+            'queues': {name: {'depth': q.qsize(), 'maxsize': q.maxsize, 'dropped': q.dropped}
+                       for name, q in self.queues.items()},
+            'stages': {s.stage_name: {'processed': s.processed, 'errors': s.errors, 'alive': s.is_alive()}
+                       for s in self.stages},
+        }
@@ -0,0 +1,303 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from services.metrics import CallbackGauge, FRAMES_DROPPED, stage_timer
+from services.pipeline import DropOldestQueue
+
+"""
+recorder.py
+------------
+Asynchronous, segmented recording for pcd_main.
+The capture loop only hands frames to a bounded queue; a dedicated writer
+thread encodes them, so a slow or busy disk never stalls live FPS. One
+recording is a directory of time-based segments (segment_00000.mp4, ...) plus
+manifest.json, rewritten atomically whenever a segment closes, so a crash
+loses at most the segment being written and the manifest always lists the
+segments that belong to the report.
+When ffmpeg is available, every closed segment is rewritten in the background
+as fragmented MP4 (H.264 by default) so browsers can start playback and seek
+over HTTP Range requests without downloading the whole file first.
+"""
+
+# Overflow policies when the writer falls behind:
+#  - drop_oldest: evict the oldest queued frame (recording stays close to live)
+#  - drop_newest: refuse the incoming frame
+#  - block: wait up to RECORD_BLOCK_MS for room, then drop the incoming frame
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+MANIFEST_NAME = 'manifest.json'
+
+# Post-processing of closed segments (needs ffmpeg on PATH, or FFMPEG_BIN):
+#  - fmp4: fragmented MP4 (moov up front, one fragment per keyframe); plays while downloading
+#  - faststart: regular MP4 with the moov atom moved to the front
+#  - off: keep the OpenCV output as is
+STREAMABLE_MODES = ('fmp4', 'faststart', 'off')
+_MOVFLAGS = {'fmp4': '+frag_keyframe+empty_moov+default_base_moof', 'faststart': '+faststart'}
+
+
+def make_streamable(path: str, mode: str = 'fmp4', codec: str = 'libx264', ffmpeg: str | None = None) -> bool:
+    """Rewrite an MP4 in place as fragmented/faststart MP4 with ffmpeg; returns False if not possible.
+
+    codec: ffmpeg video encoder (libx264 is what browsers play; 'copy' only remuxes).
+    """
+    ffmpeg = ffmpeg or shutil.which(os.environ.get('FFMPEG_BIN', 'ffmpeg'))
+    if mode not in _MOVFLAGS or ffmpeg is None:
+        return False
+    tmp = path + '.stream.mp4'
+    cmd = [ffmpeg, '-y', '-loglevel', 'error', '-i', path, '-an', '-c:v', codec]
+    if codec == 'libx264':
+        cmd += ['-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p']
+    cmd += ['-movflags', _MOVFLAGS[mode], tmp]
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.replace(tmp, path)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        detail = e.stderr.decode(errors='replace').strip() if getattr(e, 'stderr', None) else e
+        print(f"✗ Could not make {os.path.basename(path)} streamable: {detail}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+class SegmentedRecorder:
+    """Write frames of one recording into rotating segments from a background thread.
+
+    Tunable via env vars:
+     - RECORD_SEGMENT_SECONDS (float, default 60): segment length; 0 = one segment
+     - RECORD_QUEUE_SIZE (int, default 2 seconds of frames): writer backlog bound
+     - RECORD_OVERFLOW ('drop_oldest' default, 'drop_newest', 'block')
+     - RECORD_BLOCK_MS (float, default 50): max wait per frame with 'block'
+     - RECORD_STREAMABLE ('fmp4' default, 'faststart', 'off'): post-processing of closed segments
+     - RECORD_STREAM_CODEC (default 'libx264'; 'copy' keeps the mp4v stream)
+    """
+
+    def __init__(self, output_dir: str, fps: float, size: tuple[int, int], name: str | None = None,
+                 segment_seconds: float | None = None, queue_size: int | None = None,
+                 overflow: str | None = None, fourcc: str = 'mp4v'):
+        self.fps = float(fps) if fps and fps > 0 else 30.0
+        self.size = (int(size[0]), int(size[1]))
+        self.fourcc = fourcc
+        self.name = name or f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.directory = os.path.join(output_dir, self.name)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        self.segment_seconds = (segment_seconds if segment_seconds is not None
+                                else float(os.environ.get('RECORD_SEGMENT_SECONDS', '60')))
+        if queue_size is None:
+            queue_size = int(os.environ.get('RECORD_QUEUE_SIZE', str(int(self.fps * 2))))
+        self.overflow = (overflow or os.environ.get('RECORD_OVERFLOW', 'drop_oldest')).lower()
+        if self.overflow not in OVERFLOW_POLICIES:
+            print(f"⚠️ Unknown RECORD_OVERFLOW '{self.overflow}', using drop_oldest")
+            self.overflow = 'drop_oldest'
+        self.block_timeout = float(os.environ.get('RECORD_BLOCK_MS', '50')) / 1000.0
+        self.streamable = os.environ.get('RECORD_STREAMABLE', 'fmp4').lower()
+        self.stream_codec = os.environ.get('RECORD_STREAM_CODEC', 'libx264')
+        self._ffmpeg = shutil.which(os.environ.get('FFMPEG_BIN', 'ffmpeg')) if self.streamable in _MOVFLAGS else None
+        if self.streamable in _MOVFLAGS and self._ffmpeg is None:
+            print("⚠️ ffmpeg not found; recording segments stay plain mp4v (RECORD_STREAMABLE ignored)")
+
+        self._queue = DropOldestQueue(maxsize=queue_size, name='record',
+                                      drop_oldest=self.overflow == 'drop_oldest', on_drop=self._count_drop)
+        self._lock = threading.Lock()
+        self._manifest_lock = threading.RLock()
+        self._closed = False
+        self._writer = None
+        self._segment = None  # manifest entry of the open segment
+        self._segment_started = None  # submit timestamp of its first frame
+        self.started_at = None
+        self.ended_at = None
+        self.segments: list[dict] = []
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = None
+        self._thread = threading.Thread(target=self._run, name='pcd-recorder', daemon=True)
+        # Not a daemon: the process waits for the last segment's post-processing before exiting
+        self._post_queue: queue.Queue = queue.Queue()
+        self._post_thread = threading.Thread(target=self._post_process, name='pcd-recorder-post')
+
+    # --- Capture-loop side ---
+    def start(self) -> 'SegmentedRecorder':
+        os.makedirs(self.directory, exist_ok=True)
+        self.started_at = datetime.utcnow()
+        self._write_manifest()
+        self._thread.start()
+        if self._ffmpeg is not None:
+            self._post_thread.start()
+        CallbackGauge('pcd_recorder_backlog', 'Frames waiting for the recording writer thread',
+                      lambda: {(): self._queue.qsize()})
+        return self
+
+    def submit(self, img: np.ndarray) -> bool:
+        """Queue a frame for recording (the recorder keeps a reference; pass a frame that is not modified later).
+
+        Never blocks longer than the overflow policy allows; returns False if the frame was dropped.
+        """
+        if self._closed:
+            return False
+        self.submitted += 1
+        item = (time.monotonic(), img)
+        if self.overflow == 'drop_oldest':
+            return self._queue.put(item)
+        if self._queue.put(item, timeout=self.block_timeout if self.overflow == 'block' else 0):
+            return True
+        self._count_drop()
+        return False
+
+    def close(self, timeout: float = 10.0) -> dict:
+        """Flush queued frames, close the last segment and finalize the manifest; returns it.
+
+        Post-processing of the last segment continues in the background.
+        """
+        if not self._closed:
+            # No END sentinel: with drop_oldest it could evict a frame; the writer drains, then exits
+            self._closed = True
+            if self._thread.is_alive():
+                self._thread.join(timeout=timeout)
+                if self._thread.is_alive():
+                    print(f"⚠️ Recorder still flushing after {timeout:.0f}s; manifest may be incomplete")
+        return self.manifest()
+
+    def wait_post_processed(self, timeout: float | None = None):
+        """Block until every closed segment has been made streamable (no-op without ffmpeg)."""
+        if self._post_thread.is_alive():
+            self._post_thread.join(timeout=timeout)
+
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {'submitted': self.submitted, 'written': self.written, 'dropped': self.dropped,
+                'backlog': self.backlog(), 'segments': len(self.segments)}
+
+    def _count_drop(self):
+        with self._lock:
+            self.dropped += 1
+        FRAMES_DROPPED.labels('record').inc()
+
+    # --- Writer thread ---
+    def _run(self):
+        while True:
+            try:
+                ts, img = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            try:
+                if self._writer is None or (self.segment_seconds > 0
+                                            and ts - self._segment_started >= self.segment_seconds):
+                    self._rotate(ts)
+                if self._writer is None:
+                    self._count_drop()
+                    continue
+                with stage_timer('record_write'):
+                    self._writer.write(img)
+                self._segment['frames'] += 1
+                self.written += 1
+            except Exception as e:
+                self._count_drop()
+                if self.failed is None:
+                    self.failed = str(e)
+                    print(f"✗ Recording writer error: {e}")
+        self._close_segment()
+        self.ended_at = datetime.utcnow()
+        self._write_manifest()
+        self._post_queue.put(None)
+
+    def _rotate(self, ts: float):
+        self._close_segment()
+        index = len(self.segments)
+        filename = f"segment_{index:05d}.mp4"
+        vw = cv2.VideoWriter(os.path.join(self.directory, filename), cv2.VideoWriter_fourcc(*self.fourcc),
+                             self.fps, self.size)
+        if not vw.isOpened():
+            if self.failed is None:
+                self.failed = f"could not open {filename}"
+                print(f"✗ Failed to open recording segment {filename}")
+            return
+        self._writer = vw
+        self._segment_started = ts
+        self._segment = {'index': index, 'file': filename, 'started_at': datetime.utcnow().isoformat(),
+                         'frames': 0, 'complete': False}
+        with self._manifest_lock:
+            self.segments.append(self._segment)
+        self._write_manifest()
+
+    def _close_segment(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.release()
+        finally:
+            self._writer = None
+        self._segment['complete'] = True
+        self._segment['duration_seconds'] = round(self._segment['frames'] / self.fps, 3)
+        self._segment['streamable'] = False
+        self._segment['format'] = 'mp4'
+        self._write_manifest()
+        if self._ffmpeg is not None:
+            self._post_queue.put(self._segment)
+
+    def _post_process(self):
+        """Rewrite closed segments as streamable MP4, one at a time, off the writer thread."""
+        while True:
+            segment = self._post_queue.get()
+            if segment is None:
+                return
+            path = os.path.join(self.directory, segment['file'])
+            with stage_timer('record_streamable'):
+                ok = make_streamable(path, self.streamable, self.stream_codec, self._ffmpeg)
+            if ok:
+                with self._manifest_lock:
+                    segment['streamable'] = True
+                    segment['format'] = self.streamable
+                    segment['codec'] = self.stream_codec
+                self._write_manifest()
+
+    # --- Manifest ---
+    def manifest(self) -> dict:
+        with self._manifest_lock:
+            segments = [dict(s) for s in self.segments]
+        return {
+            'name': self.name,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'fps': self.fps,
+            'width': self.size[0],
+            'height': self.size[1],
+            'fourcc': self.fourcc,
+            'segment_seconds': self.segment_seconds,
+            'frames_written': self.written,
+            'frames_dropped': self.dropped,
+            'complete': self.ended_at is not None,
+            'segments': segments,
+        }
+
+    def _write_manifest(self):
+        # Write-then-rename so a crash never leaves a truncated manifest behind
+        # (the writer and post-processing threads both update it; the lock keeps the latest state last)
+        tmp = self.manifest_path + '.tmp'
+        try:
+            with self._manifest_lock:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(self.manifest(), f, indent=2)
+                os.replace(tmp, self.manifest_path)
+        except OSError as e:
+            print(f"✗ Failed to write recording manifest: {e}")
+
+
+def load_manifest(path: str) -> dict:
+    """Read a recording manifest (path to manifest.json or to the recording directory)."""
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_NAME)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from services.metrics import CallbackGauge
+
+"""
+startup.py
+-----------
+Cold-start timings for one worker process: how long the app module took to
+import, how long lazy phases (e.g. detector load) took on first use, and the
+latency of the very first request. Printed once and exposed both as JSON
+(GET /startup on the Flask apps) and as pcd_startup_seconds on /metrics, so
+slow cold starts of autoscaled workers are visible.
+"""
+
+
+class StartupReport:
+    """Collect named phase durations (seconds) for the current process."""
+
+    def __init__(self, service: str, started: float | None = None):
+        self.service = service
+        # perf_counter() taken as early as possible in the app module
+        self.started = started if started is not None else time.perf_counter()
+        self.pid = os.getpid()
+        self.phases: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._first_request_done = False
+        CallbackGauge('pcd_startup_seconds', 'Cold-start phase durations of this worker process',
+                      lambda: {(self.service, k): v for k, v in self.as_dict()['phases'].items()},
+                      ('service', 'phase'))
+
+    def mark(self, phase: str, seconds: float | None = None):
+        """Record a phase; without `seconds`, the time elapsed since the process report started."""
+        value = (time.perf_counter() - self.started) if seconds is None else seconds
+        with self._lock:
+            self.phases.setdefault(phase, value)
+
+    @contextmanager
+    def time(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(phase, time.perf_counter() - start)
+
+    def first_request(self, seconds: float):
+        """Record the first request's latency (only the first call counts) and print the report."""
+        with self._lock:
+            if self._first_request_done:
+                return
+            self._first_request_done = True
+        self.mark('first_request', seconds)
+        self.mark('ready_to_first_response')
+        self.log()
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            phases = {k: round(v, 4) for k, v in self.phases.items()}
+        return {'service': self.service, 'pid': self.pid, 'phases': phases}
+
+    def log(self):
+        parts = ', '.join(f"{k}={v * 1000:.0f}ms" for k, v in self.as_dict()['phases'].items())
+        print(f"ℹ️ Startup [{self.service} pid={self.pid}]: {parts}")
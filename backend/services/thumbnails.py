@@ -0,0 +1,269 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+"""
+thumbnails.py
+--------------
+Preview images for recordings: one representative thumbnail plus a sprite
+sheet of evenly spaced frames (with a JSON index of tile timestamps) for
+scrubbing previews in the admin dashboard.
+Only the sampled frames are decoded (a seek per sample, or a few grab() calls
+when the next sample is close), so the cost does not grow with recording length.
+Outputs are written next to the recording and reused when they are already up
+to date; a lock file keeps pcd_main and the FastAPI worker from generating the
+same previews twice.
+Used by pcd_main (after stop_recording) and by the FastAPI ingest endpoint, so
+this module only depends on OpenCV/numpy.
+"""
+
+SPRITE_COLUMNS = int(os.environ.get('SPRITE_COLUMNS', '5'))
+SPRITE_ROWS = int(os.environ.get('SPRITE_ROWS', '5'))
+SPRITE_TILE_WIDTH = int(os.environ.get('SPRITE_TILE_WIDTH', '160'))
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', '480'))
+# Forward gaps up to this many frames are skipped with grab() instead of a seek
+_GRAB_INSTEAD_OF_SEEK = 30
+_LOCK_STALE_SECONDS = 600
+
+
+def preview_paths(recording_path: str) -> dict:
+    """Output paths for a recording (manifest.json → files in its directory; video → <name>.thumbnail.jpg, ...)."""
+    if recording_path.endswith('.json'):
+        base = os.path.join(os.path.dirname(recording_path), '')
+    else:
+        base = os.path.splitext(recording_path)[0] + '.'
+    return {'thumbnail': base + 'thumbnail.jpg', 'sprite': base + 'sprite.jpg', 'index': base + 'sprite.json'}
+
+
+def _sources(recording_path: str) -> tuple[list[tuple[str, int]], float]:
+    """[(video file, frame count)] in playback order and the fps."""
+    if not recording_path.endswith('.json'):
+        cap = cv2.VideoCapture(recording_path)
+        frames, fps = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+        return [(recording_path, frames)], fps
+    with open(recording_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(recording_path)
+    sources = []
+    for seg in manifest.get('segments', []):
+        path = os.path.join(directory, seg['file'])
+        if seg.get('complete') and os.path.isfile(path):
+            sources.append((path, int(seg.get('frames') or 0)))
+    return sources, float(manifest.get('fps') or 30.0)
+
+
+def _sample_frames(sources: list[tuple[str, int]], count: int) -> list[tuple[int, np.ndarray]]:
+    """Decode `count` evenly spaced frames across all sources; returns [(global frame index, frame)]."""
+    total = sum(n for _, n in sources)
+    if total <= 0 or count <= 0:
+        return []
+    # Centre of each of `count` equal slices, so the first/last tiles are not black fade frames
+    targets = sorted({min(total - 1, int((i + 0.5) * total / count)) for i in range(count)})
+    samples = []
+    offset = 0
+    for path, frames in sources:
+        local = [t - offset for t in targets if offset <= t < offset + frames]
+        if local:
+            cap = cv2.VideoCapture(path)
+            pos = 0
+            for idx in local:
+                if 0 <= idx - pos <= _GRAB_INSTEAD_OF_SEEK:
+                    while pos < idx and cap.grab():
+                        pos += 1
+                else:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                    pos = idx
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    break
+                pos += 1
+                samples.append((offset + idx, frame))
+            cap.release()
+        offset += frames
+    return samples
+
+
+def _score(frame: np.ndarray) -> float:
+    """How representative a frame is: sharp (Laplacian variance) and neither near-black nor blown out."""
+    gray = cv2.cvtColor(cv2.resize(frame, (160, max(1, frame.shape[0] * 160 // frame.shape[1]))),
+                        cv2.COLOR_BGR2GRAY)
+    mean = float(gray.mean())
+    exposure = 1.0 if 40 <= mean <= 215 else 0.2
+    return cv2.Laplacian(gray, cv2.CV_64F).var() * exposure + float(gray.std())
+
+
+def _resize_width(frame: np.ndarray, width: int) -> np.ndarray:
+    h, w = frame.shape[:2]
+    if width <= 0 or w <= width:
+        return frame
+    return cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def _write_jpeg(path: str, img: np.ndarray, quality: int = 80):
+    ok, buf = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError(f"could not encode {os.path.basename(path)}")
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(buf.tobytes())
+    os.replace(tmp, path)
+
+
+def _up_to_date(paths: dict, total_frames: int, params: dict) -> bool:
+    if not all(os.path.isfile(p) for p in paths.values()):
+        return False
+    try:
+        with open(paths['index'], encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # Same frame count and layout → the previews still match (post-processing a segment keeps its frames)
+    return index.get('source_frames') == total_frames and index.get('params') == params
+
+
+def generate_previews(recording_path: str, columns: int | None = None, rows: int | None = None,
+                      tile_width: int | None = None, force: bool = False, lock_wait: float = 120.0) -> dict | None:
+    """Create thumbnail.jpg, sprite.jpg and sprite.json for a recording (manifest.json or video file).
+
+    Returns the preview_paths() dict plus 'generated' (False when existing outputs
+    were reused), or None when the recording has no readable frames.
+    """
+    columns = max(1, columns or SPRITE_COLUMNS)
+    rows = max(1, rows or SPRITE_ROWS)
+    tile_width = max(16, tile_width or SPRITE_TILE_WIDTH)
+    params = {'columns': columns, 'rows': rows, 'tile_width': tile_width, 'thumbnail_width': THUMBNAIL_WIDTH}
+    paths = preview_paths(recording_path)
+    sources, fps = _sources(recording_path)
+    total = sum(n for _, n in sources)
+    if total <= 0:
+        return None
+    if not force and _up_to_date(paths, total, params):
+        return {**paths, 'generated': False}
+
+    lock = paths['index'] + '.lock'
+    deadline = time.monotonic() + lock_wait
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > _LOCK_STALE_SECONDS:
+                    os.remove(lock)  # left behind by a crashed process
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"previews of {recording_path} are locked by another process")
+            time.sleep(0.5)
+    try:
+        # Another process may have finished them while we waited for the lock
+        if not force and _up_to_date(paths, total, params):
+            return {**paths, 'generated': False}
+        samples = _sample_frames(sources, columns * rows)
+        if not samples:
+            return None
+
+        tiles = [_resize_width(frame, tile_width) for _, frame in samples]
+        th, tw = tiles[0].shape[:2]
+        sheet = np.zeros((th * rows, tw * columns, 3), dtype=np.uint8)
+        entries = []
+        for i, ((idx, _), tile) in enumerate(zip(samples, tiles)):
+            r, c = divmod(i, columns)
+            tile = tile if tile.shape[:2] == (th, tw) else cv2.resize(tile, (tw, th))
+            sheet[r * th:(r + 1) * th, c * tw:(c + 1) * tw] = tile
+            entries.append({'time': round(idx / fps, 3), 'x': c * tw, 'y': r * th, 'w': tw, 'h': th})
+
+        best = max(samples, key=lambda s: _score(s[1]))
+        _write_jpeg(paths['thumbnail'], _resize_width(best[1], THUMBNAIL_WIDTH), quality=85)
+        _write_jpeg(paths['sprite'], sheet, quality=75)
+        index = {'source_frames': total, 'fps': fps, 'params': params,
+                 'thumbnail_time': round(best[0] / fps, 3), 'sprite': os.path.basename(paths['sprite']),
+                 'tiles': entries}
+        tmp = paths['index'] + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, paths['index'])
+        return {**paths, 'generated': True}
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+class ThumbnailWorker:
+    """Single background thread generating previews in submission order.
+
+    submit() is non-blocking and ignores a recording that is already queued.
+    on_done(key, result) runs on the worker thread after each job (result is
+    the generate_previews() dict or None). close() lets queued jobs finish, so
+    call it on shutdown; otherwise pending previews are simply redone next time.
+    """
+
+    def __init__(self, on_done=None, name: str = 'pcd-thumbnails'):
+        self.on_done = on_done
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: set = set()
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, recording_path: str, key=None, wait_for=None) -> bool:
+        """Queue previews for recording_path. wait_for: optional callable run first (e.g. wait for post-processing)."""
+        key = recording_path if key is None else key
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._queue.put((key, recording_path, wait_for))
+        return True
+
+    def close(self, timeout: float | None = None):
+        """Finish the queued jobs, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize(), 'generated': self.generated, 'skipped': self.skipped,
+                'failed': self.failed}
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            key, path, wait_for = job
+            result = None
+            try:
+                if wait_for is not None:
+                    wait_for()
+                result = generate_previews(path)
+                if result is None:
+                    self.failed += 1
+                    print(f"⚠️ No frames to build previews from: {path}")
+                elif result['generated']:
+                    self.generated += 1
+                    print(f"✓ Previews created: {result['thumbnail']}")
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"✗ Preview generation failed for {path}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+            if self.on_done is not None:
+                try:
+                    self.on_done(key, result)
+                except Exception as e:
+                    print(f"✗ Preview callback failed for {path}: {e}")
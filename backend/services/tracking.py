@@ -0,0 +1,178 @@
+import cv2
+import numpy as np
+
+"""
+tracking.py
+------------
+Lightweight face-box tracker used between DNN detections.
+Each box is followed with pyramidal Lucas-Kanade optical flow on a handful of
+feature points inside it; when the detector runs again, detections are
+associated to existing tracks by IoU. This keeps the blur on moving faces
+while the expensive SSD only runs every DETECT_EVERY_N frames.
+"""
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between boxes a (N,4) and b (M,4) in (x1, y1, x2, y2) form."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    if a.shape[0] == 0 or b.shape[0] == 0:
+        return np.zeros((a.shape[0], b.shape[0]), dtype=np.float32)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0).astype(np.float32)
+
+
+class _Track:
+    __slots__ = ('box', 'points', 'age')
+
+    def __init__(self, box: np.ndarray):
+        self.box = np.asarray(box, dtype=np.float32)
+        self.points = None
+        self.age = 0  # frames since last confirmed by the detector
+
+
+class FaceTracker:
+    """Move face boxes with optical flow between detector runs.
+
+    Boxes are given and returned in full-frame pixel coordinates; tracking
+    itself runs on a grayscale copy downscaled to at most `max_width` pixels.
+    """
+
+    def __init__(self, max_age: int = 10, iou_threshold: float = 0.3,
+                 max_points: int = 20, max_width: int = 480):
+        self.max_age = max(1, int(max_age))
+        self.iou_threshold = iou_threshold
+        self.max_points = max_points
+        self.max_width = max_width
+        self.tracks: list[_Track] = []
+        self._prev_gray = None
+        self._scale = 1.0
+        self._lk_params = dict(winSize=(15, 15), maxLevel=2,
+                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def _to_gray(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        self._scale = min(1.0, self.max_width / float(w)) if self.max_width > 0 else 1.0
+        if self._scale < 1.0:
+            frame = cv2.resize(frame, (int(w * self._scale), int(h * self._scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def _seed_points(self, gray: np.ndarray, track: _Track):
+        """Pick feature points inside the (scaled) box; fall back to a 3x3 grid on flat regions."""
+        x1, y1, x2, y2 = (track.box * self._scale).astype(np.int32)
+        gh, gw = gray.shape[:2]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(gw, x2), min(gh, y2)
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            track.points = None
+            return
+        pts = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], maxCorners=self.max_points,
+                                      qualityLevel=0.01, minDistance=3)
+        if pts is None or len(pts) < 3:
+            xs = np.linspace(0.25, 0.75, 3) * (x2 - x1)
+            ys = np.linspace(0.25, 0.75, 3) * (y2 - y1)
+            pts = np.array([[[x, y]] for y in ys for x in xs], dtype=np.float32)
+        pts = pts.astype(np.float32)
+        pts[:, 0, 0] += x1
+        pts[:, 0, 1] += y1
+        track.points = pts
+
+    def update(self, frame: np.ndarray, boxes) -> list[tuple[int, int, int, int]]:
+        """Feed fresh detector output. Returns the boxes to blur on this frame."""
+        gray = self._to_gray(frame)
+        det = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        ious = iou_matrix(np.array([t.box for t in self.tracks], dtype=np.float32), det)
+
+        matched_tracks: set[int] = set()
+        matched_dets: set[int] = set()
+        # Greedy association, best IoU first
+        if ious.size:
+            for flat in np.argsort(-ious, axis=None):
+                ti, di = np.unravel_index(flat, ious.shape)
+                if ious[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                matched_tracks.add(int(ti))
+                matched_dets.add(int(di))
+                self.tracks[ti].box = det[di].copy()
+                self.tracks[ti].age = 0
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti in matched_tracks:
+                survivors.append(track)
+            else:
+                # Detector missed it: keep following it for a while rather than un-blurring
+                track.age += 1
+                if track.age <= self.max_age:
+                    survivors.append(track)
+        for di in range(det.shape[0]):
+            if di not in matched_dets:
+                survivors.append(_Track(det[di]))
+        self.tracks = survivors
+
+        for track in self.tracks:
+            self._seed_points(gray, track)
+        self._prev_gray = gray
+        return self._boxes(frame.shape)
+
+    def track(self, frame: np.ndarray) -> list[tuple[int, int, int, int]]:
+        """Advance all boxes to `frame` using optical flow (no detector run)."""
+        gray = self._to_gray(frame)
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape or not self.tracks:
+            self._prev_gray = gray
+            return self._boxes(frame.shape)
+
+        active = [t for t in self.tracks if t.points is not None and len(t.points)]
+        if active:
+            prev_pts = np.concatenate([t.points for t in active], axis=0)
+            next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None, **self._lk_params)
+            offset = 0
+            for t in active:
+                n = len(t.points)
+                ok = status[offset:offset + n, 0] == 1
+                old = t.points[ok, 0]
+                new = next_pts[offset:offset + n][ok, 0]
+                offset += n
+                if len(new) < 3:
+                    continue  # lost texture: coast on the last box
+                shift = np.median(new - old, axis=0) / self._scale
+                # Scale change from the spread of the points around their centroid
+                old_spread = np.median(np.linalg.norm(old - old.mean(axis=0), axis=1))
+                new_spread = np.median(np.linalg.norm(new - new.mean(axis=0), axis=1))
+                scale = float(np.clip(new_spread / old_spread, 0.8, 1.25)) if old_spread > 1e-3 else 1.0
+                cx = (t.box[0] + t.box[2]) / 2.0 + shift[0]
+                cy = (t.box[1] + t.box[3]) / 2.0 + shift[1]
+                hw = (t.box[2] - t.box[0]) * scale / 2.0
+                hh = (t.box[3] - t.box[1]) * scale / 2.0
+                t.box = np.array([cx - hw, cy - hh, cx + hw, cy + hh], dtype=np.float32)
+                t.points = new.reshape(-1, 1, 2)
+
+        for t in self.tracks:
+            t.age += 1
+        self.tracks = [t for t in self.tracks if t.age <= self.max_age]
+        self._prev_gray = gray
+        return self._boxes(frame.shape)
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+
+    def _boxes(self, shape) -> list[tuple[int, int, int, int]]:
+        h, w = shape[:2]
+        out = []
+        for t in self.tracks:
+            x1, y1, x2, y2 = t.box
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(w, int(round(x2))), min(h, int(round(y2)))
+            if x2 > x1 and y2 > y1:
+                out.append((x1, y1, x2, y2))
+        return out
@@ -0,0 +1,142 @@
+import base64
+import os
+import threading
+
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import FRAMES_DROPPED, UPLOADS, stage_timer
+
+"""
+uploader.py
+------------
+Background frame uploader for pcd_main.
+The capture loop only drops its latest frame into a single slot; a worker
+thread encodes it and POSTs it to BACKEND_URL/upload_frame over a pooled
+keep-alive session. Frames that arrive while an upload is still in flight
+replace the pending one (latest frame wins), so a slow or restarting backend
+never slows down capture or recording.
+"""
+
+
+class FrameUploader:
+    """Single-slot, latest-frame-wins uploader with sent/dropped/failed counters.
+
+    Tunable via env vars:
+     - UPLOAD_MAX_WIDTH (int, default 640): resize width while keeping aspect ratio
+     - UPLOAD_JPEG_QUALITY (int, default 60): JPEG quality
+     - UPLOAD_TRANSPORT ('binary' default: raw image/jpeg body; 'json': legacy base64 JSON)
+     - UPLOAD_TIMEOUT (float seconds, default 2.0)
+    """
+
+    def __init__(self, backend_url: str, max_width: int | None = None, jpeg_quality: int | None = None,
+                 transport: str | None = None, timeout: float | None = None):
+        self.url = f"{backend_url.rstrip('/')}/upload_frame"
+        self.max_width = max_width if max_width is not None else int(os.environ.get('UPLOAD_MAX_WIDTH', '640'))
+        jpg_q = jpeg_quality if jpeg_quality is not None else int(os.environ.get('UPLOAD_JPEG_QUALITY', '60'))
+        self.jpeg_quality = max(30, min(95, jpg_q))
+        self.transport = (transport or os.environ.get('UPLOAD_TRANSPORT', 'binary')).lower()
+        self.timeout = timeout if timeout is not None else float(os.environ.get('UPLOAD_TIMEOUT', '2.0'))
+
+        # Pooled keep-alive session; retries are pointless for live frames (a newer one is coming)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._slot = None
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self._backoff = 0.0
+        self._failing = False
+
+        self._worker = threading.Thread(target=self._run, name='pcd-uploader', daemon=True)
+        self._worker.start()
+
+    def submit(self, img: np.ndarray):
+        """Offer a frame for upload; never blocks. Replaces a frame that has not been sent yet."""
+        with self._cond:
+            if self._closed:
+                return
+            if self._slot is not None:
+                self.dropped += 1
+                FRAMES_DROPPED.labels('upload').inc()
+            self._slot = img
+            self.submitted += 1
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = 1 if self._slot is not None else 0
+        return {'submitted': self.submitted, 'sent': self.sent, 'dropped': self.dropped,
+                'failed': self.failed, 'pending': pending}
+
+    def close(self, timeout: float = 2.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=timeout)
+        self.session.close()
+
+    def encode(self, img: np.ndarray) -> bytes:
+        """Downscale to UPLOAD_MAX_WIDTH and JPEG-encode."""
+        frame_to_send = img
+        if self.max_width > 0 and frame_to_send.shape[1] > self.max_width:
+            ratio = self.max_width / float(frame_to_send.shape[1])
+            new_h = max(1, int(frame_to_send.shape[0] * ratio))
+            frame_to_send = cv2.resize(frame_to_send, (self.max_width, new_h), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame_to_send, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        return buffer.tobytes()
+
+    def _post(self, jpeg: bytes) -> bool:
+        if self.transport == 'json':
+            payload = {'image': base64.b64encode(jpeg).decode('ascii')}
+            resp = self.session.post(self.url, json=payload, timeout=self.timeout)
+        else:
+            resp = self.session.post(self.url, data=jpeg, headers={'Content-Type': 'image/jpeg'},
+                                     timeout=self.timeout)
+        return resp.ok
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._slot is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                img, self._slot = self._slot, None
+
+            try:
+                with stage_timer('jpeg_encode'):
+                    jpeg = self.encode(img)
+                with stage_timer('upload'):
+                    ok = self._post(jpeg)
+                error = None if ok else 'non-2xx response'
+            except Exception as e:
+                ok, error = False, e
+            UPLOADS.labels('sent' if ok else 'failed').inc()
+
+            if ok:
+                self.sent += 1
+                self._backoff = 0.0
+                if self._failing:
+                    print('✓ Backend reachable again, frame upload resumed')
+                    self._failing = False
+                continue
+
+            self.failed += 1
+            if not self._failing:
+                # Log once per outage instead of once per frame
+                print(f"✗ Failed to send frame to backend: {error}")
+                self._failing = True
+            # Back off while the backend is down; frames submitted meanwhile just replace the slot
+            self._backoff = min(2.0, max(0.1, self._backoff * 2))
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, timeout=self._backoff)
@@ -22,7 +22,20 @@ CREATE TABLE IF NOT EXISTS reports (
   submitted_by VARCHAR(255) DEFAULT NULL,
   notes TEXT DEFAULT NULL,
   captured_at DATETIME DEFAULT NULL,
+  idempotency_key VARCHAR(64) DEFAULT NULL,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-  PRIMARY KEY (id)
+  version INT UNSIGNED NOT NULL DEFAULT 1,
+  PRIMARY KEY (id),
+  UNIQUE KEY uq_reports_idempotency_key (idempotency_key),
+  KEY ix_reports_created_at_id (created_at, id),
+  KEY ix_reports_status_created_at_id (status, created_at, id),
+  KEY ix_reports_status_updated_at_version (status, updated_at, version)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Upgrade database lama (FastAPI juga menambahkannya otomatis saat startup):
+-- ALTER TABLE reports ADD COLUMN idempotency_key VARCHAR(64) DEFAULT NULL,
+--   ADD UNIQUE KEY uq_reports_idempotency_key (idempotency_key);
+-- ALTER TABLE reports ADD KEY ix_reports_created_at_id (created_at, id),
+--   ADD KEY ix_reports_status_created_at_id (status, created_at, id),
+--   ADD KEY ix_reports_status_updated_at (status, updated_at);